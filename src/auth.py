@@ -1,10 +1,24 @@
 import os
 import sys
 import ssl
+import socket
 import json
+import logging
+import threading
+import time
+from contextlib import contextmanager
 import httpx
 import msal
 from dotenv import load_dotenv
+from .utils.json_stream import iter_odata_values
+from .utils.token_cache import TokenCacheFile
+from .utils.singleflight import SingleFlight
+from .utils.write_queue import WriteQueue
+from .utils.search_index import SearchIndex
+from .utils.scheduler import scheduler
+from .utils.circuit_breaker import CircuitBreakers, GraphUnavailableError, parse_settings
+from .utils import autotune
+from .prefetch import Prefetcher, parse_rules
 
 # Windows OpenSSL Applink 修复
 try:
@@ -16,6 +30,30 @@ except Exception:
 # 加载环境变量
 load_dotenv()
 
+logger = logging.getLogger(__name__)
+
+# 单个 $batch 请求最多包含的子请求数
+BATCH_LIMIT = 20
+
+# 各类请求的超时 (秒)：连接超时统一；读取超时按请求类别区分——
+# 普通读取 (read)、写操作 (write)、$batch 与附件传输 (transfer)
+DEFAULT_TIMEOUTS = {"connect": 5.0, "read": 20.0, "write": 30.0, "batch": 60.0, "transfer": 120.0}
+
+def _parse_timeouts(value):
+    """解析形如 "connect=5,read=20" 的超时配置，返回 {类别: httpx.Timeout}。"""
+    seconds = dict(DEFAULT_TIMEOUTS)
+    for part in filter(None, (value or "").split(",")):
+        name, _, number = part.partition("=")
+        name = name.strip()
+        try:
+            if name not in DEFAULT_TIMEOUTS or float(number) <= 0:
+                raise ValueError
+        except ValueError:
+            raise ValueError(f"M365_TIMEOUTS 配置无效: {part}")
+        seconds[name] = float(number)
+    connect = seconds.pop("connect")
+    return {kind: httpx.Timeout(timeout, connect=connect) for kind, timeout in seconds.items()}
+
 # 根据环境变量获取动态权限范围的辅助函数
 def get_scopes():
     scopes = ['User.Read']
@@ -29,15 +67,19 @@ def get_scopes():
     return scopes
 
 class GraphClient:
-    def __init__(self, client_id, redirect_uri=None, token_path=None):
+    # 写后队列是否按进程使用独立文件 (经代理访问时各服务器进程互不共享队列)
+    per_process_write_queue = False
+
+    def __init__(self, client_id, redirect_uri=None, token_path=None, transport=None):
         self.client_id = client_id
         self.redirect_uri = redirect_uri or 'https://login.microsoftonline.com/common/oauth2/nativeclient'
         self.token_path = token_path or 'graph_token.json'
         self.authority = "https://login.microsoftonline.com/common"
         self.base_url = "https://graph.microsoft.com/v1.0"
         
-        # 使用 SerializableTokenCache 进行持久化存储
+        # 使用 SerializableTokenCache 进行持久化存储；文件读写经过跨进程锁与原子替换
         self._token_cache = msal.SerializableTokenCache()
+        self._cache_file = TokenCacheFile(self.token_path, key=os.getenv('MS_GRAPH_TOKEN_KEY'))
         self._load_cache()
 
         # 对于个人助手，使用公共客户端应用 (PublicClientApplication)
@@ -47,33 +89,78 @@ class GraphClient:
             token_cache=self._token_cache
         )
 
+        # 合并相同的并发 GET 请求
+        self._flights = SingleFlight()
+        self._account_id = None
+        self._me = None
+        self.warm_up_timings = None
+
+        # 进程内复用的连接池，避免每个请求重新进行 DNS 解析与 TLS 握手；
+        # 可注入 httpx 传输层 (如测试用的 MockTransport)
+        self._http = httpx.Client(transport=transport)
+        self._timeouts = _parse_timeouts(os.getenv("M365_TIMEOUTS"))
+        # 按端点族熔断：Graph 持续出错或超时时快速失败，而不是让每次工具调用都等到超时
+        self._breakers = CircuitBreakers(parse_settings(os.getenv("M365_CIRCUIT_BREAKER")))
+        # 根据观测到的延迟与限流自动调节并发上限与列表页大小
+        self.autotuner = None
+        if os.getenv("ENABLE_AUTOTUNE", "true").lower() in ("true", "1", "yes"):
+            self.autotuner = autotune.Autotuner(scheduler, autotune.parse_settings(os.getenv("M365_AUTOTUNE")))
+
+        # 可选的写后队列：写操作先落本地，后台合并后通过 $batch 提交
+        self.write_queue = None
+        if os.getenv("ENABLE_WRITE_BEHIND", "false").lower() in ("true", "1", "yes"):
+            queue_path = os.getenv("M365_WRITE_QUEUE_PATH") or os.path.join(
+                os.path.dirname(os.path.abspath(self.token_path)), "pending_writes.json"
+            )
+            self.write_queue = WriteQueue(self, queue_path, per_process=self.per_process_write_queue)
+
+        # 本地全文索引：由读取到的邮件、日程与待办增量构建；设置了 Token 加密口令时同样加密
+        self.search_index = None
+        if os.getenv("ENABLE_SEARCH_INDEX", "false").lower() in ("true", "1", "yes"):
+            index_path = os.getenv("M365_SEARCH_INDEX_PATH") or os.path.join(
+                os.path.dirname(os.path.abspath(self.token_path)), "search_index.json"
+            )
+            self.search_index = SearchIndex(index_path, key=os.getenv('MS_GRAPH_TOKEN_KEY'))
+
+        # 预测性预取：get_current_time 之后在后台预取今天/本周的日程、忙闲与待办
+        self.prefetcher = None
+        if os.getenv("ENABLE_PREFETCH", "true").lower() in ("true", "1", "yes"):
+            self.prefetcher = Prefetcher(self, parse_rules(os.getenv("M365_PREFETCH_RULES")))
+
     def _load_cache(self):
-        if os.path.exists(self.token_path):
-            with open(self.token_path, 'r') as f:
-                try:
-                    self._token_cache.deserialize(f.read())
-                except:
-                    pass
+        data = self._cache_file.load()
+        if data:
+            try:
+                self._token_cache.deserialize(data)
+            except ValueError as e:
+                logger.warning("Token 缓存文件 %s 内容无效，已忽略：%s", self.token_path, e)
 
     def _save_cache(self):
         if self._token_cache.has_state_changed:
-            with open(self.token_path, 'w') as f:
-                f.write(self._token_cache.serialize())
+            self._cache_file.save(self._token_cache.serialize())
+            self._token_cache.has_state_changed = False
 
     def get_token(self):
-        accounts = self.app.get_accounts()
-        result = None
-        scopes = get_scopes()
-        if accounts:
-            result = self.app.acquire_token_silent(scopes, account=accounts[0])
-        
-        if not result:
-            return None
-        
-        self._save_cache()
+        # 在跨进程锁内完成 "读取最新缓存 -> 静默获取/刷新 -> 保存"，
+        # 避免多个服务器进程同时刷新并互相覆盖缓存文件
+        with self._cache_file.locked():
+            if self._cache_file.changed():
+                self._load_cache()
+
+            accounts = self.app.get_accounts()
+            result = None
+            scopes = get_scopes()
+            if accounts:
+                self._account_id = accounts[0].get("home_account_id")
+                result = self.app.acquire_token_silent(scopes, account=accounts[0])
+            
+            if not result:
+                return None
+            
+            self._save_cache()
         return result.get("access_token")
 
-    def request(self, method, endpoint, **kwargs):
+    def _prepare_request(self, endpoint, kwargs):
         token = self.get_token()
         if not token:
             raise RuntimeError("账号未认证。请先运行 m365-auth。")
@@ -81,42 +168,311 @@ class GraphClient:
         url = f"{self.base_url}{endpoint}" if endpoint.startswith('/') else endpoint
         headers = kwargs.pop('headers', {})
         headers['Authorization'] = f"Bearer {token}"
-        # 设置默认时区为中国标准时间 (UTC+8)
-        headers['Prefer'] = 'outlook.timezone="China Standard Time"'
-        
-        with httpx.Client() as client:
+        # 设置默认时区为中国标准时间 (UTC+8)，保留调用方指定的其他偏好 (如正文格式)
+        prefer = 'outlook.timezone="China Standard Time"'
+        existing = headers.get('Prefer')
+        if not existing:
+            headers['Prefer'] = prefer
+        elif 'outlook.timezone' not in existing:
+            headers['Prefer'] = f"{prefer}, {existing}"
+        return url, headers
+
+    @staticmethod
+    def _graph_error(response):
+        # 5xx 表示服务端暂时不可用，读取类工具可以回退到缓存数据
+        error_class = GraphUnavailableError if response.status_code >= 500 else RuntimeError
+        # 尝试解析 Graph API 错误信息
+        try:
+            error = response.json().get('error', {})
+        except Exception:
+            error = None
+        if error is None:
+            exc = error_class(f"HTTP 错误 {response.status_code}: {response.reason_phrase}")
+        else:
+            error_msg = error.get('message', response.reason_phrase)
+            error_code = error.get('code', 'UnknownError')
+            exc = error_class(f"Microsoft Graph API 错误 ({error_code}): {error_msg}")
+        # 供调用方区分具体状态 (如上传会话过期的 404/410)
+        exc.status_code = response.status_code
+        return exc
+
+    def _observe(self, kind, elapsed, status):
+        if self.autotuner:
+            # $batch 与附件传输的耗时取决于内容多少，不用于判断拥塞
+            self.autotuner.observe(elapsed if kind in ("read", "write") else None, status)
+
+    @staticmethod
+    def _unavailable(error):
+        reason = "请求超时" if isinstance(error, httpx.TimeoutException) else "网络错误"
+        return GraphUnavailableError(f"Microsoft Graph {reason}: {error}")
+
+    def _flight_key(self, method, url, headers, kwargs):
+        """相同账号、方法、URL、查询参数与请求头的 GET 请求视为同一请求；其他请求不合并。"""
+        if method.upper() != "GET" or any(kwargs.get(k) is not None for k in ("content", "data", "json", "files")):
+            return None
+        params = kwargs.get("params")
+        return (
+            self._account_id,
+            url,
+            repr(sorted(params.items()) if isinstance(params, dict) else params),
+            tuple(sorted((k.lower(), v) for k, v in headers.items() if k.lower() != "authorization")),
+        )
+
+    def _check(self, response):
+        if response.status_code == 429:
+            # 限流：暂停后台通道，把剩余额度留给交互请求
+            scheduler.throttled(response.headers.get("Retry-After"))
+        if response.is_error:
+            response.read()
+            raise self._graph_error(response)
+
+    def _send(self, method, url, headers, kwargs, check=True):
+        breaker = self._breakers.for_url(url)
+        probe = breaker.allow()
+        kind = "batch" if url.endswith("/$batch") else "read" if method.upper() == "GET" else "write"
+        kwargs.setdefault("timeout", self._timeouts[kind])
+        with scheduler.slot(self._account_id):
+            started, ok, status = time.monotonic(), False, None
             try:
-                response = client.request(method, url, headers=headers, **kwargs)
-                response.raise_for_status()
-                return response
-            except httpx.HTTPStatusError as e:
-                # 尝试解析 Graph API 错误信息
-                try:
-                    error_data = e.response.json()
-                    error_msg = error_data.get('error', {}).get('message', str(e))
-                    error_code = error_data.get('error', {}).get('code', 'UnknownError')
-                    raise RuntimeError(f"Microsoft Graph API 错误 ({error_code}): {error_msg}")
-                except Exception:
-                    raise RuntimeError(f"HTTP 错误 {e.response.status_code}: {str(e)}")
+                response = self._http.request(method, url, headers=headers, **kwargs)
+                status = response.status_code
+                ok = status < 500
+            except httpx.TransportError as e:
+                raise self._unavailable(e) from e
+            finally:
+                elapsed = time.monotonic() - started
+                breaker.record(ok, elapsed, probe)
+                self._observe(kind, elapsed, status)
+            if check:
+                self._check(response)
+            elif status == 429:
+                scheduler.throttled(response.headers.get("Retry-After"))
+            return response
+
+    @contextmanager
+    def _open_stream(self, method, url, headers, kwargs, kind=None, timing=None):
+        """
+        发起流式请求并产出响应 (不检查状态码)：排队、熔断与自动调节统计，网络错误转换为 GraphUnavailableError。
+        :param timing: 可选的 dict，写入在调度队列中等待的时间 "queued" (秒)。
+        """
+        breaker = self._breakers.for_url(url)
+        probe = breaker.allow()
+        kind = kind or ("read" if method.upper() == "GET" else "write")
+        kwargs.setdefault("timeout", self._timeouts[kind])
+        queued = time.monotonic()
+        with scheduler.slot(self._account_id):
+            if timing is not None:
+                timing["queued"] = time.monotonic() - queued
+            # 以收到响应头为准记录结果与耗时，不计入调用方消费响应体的时间
+            started, recorded = time.monotonic(), False
+            try:
+                with self._http.stream(method, url, headers=headers, **kwargs) as response:
+                    elapsed = time.monotonic() - started
+                    breaker.record(response.status_code < 500, elapsed, probe)
+                    self._observe(kind, elapsed, response.status_code)
+                    recorded = True
+                    yield response
+            except httpx.TransportError as e:
+                raise self._unavailable(e) from e
+            finally:
+                if not recorded:
+                    breaker.record(False, time.monotonic() - started, probe)
+                    self._observe(kind, None, None)
+
+    def _stream_bytes(self, method, url, headers, kwargs, chunk_size=None, kind=None, timing=None):
+        with self._open_stream(method, url, headers, kwargs, kind, timing) as response:
+            self._check(response)
+            yield from response.iter_bytes(chunk_size)
+
+    def _lead_stream(self, key, flight, chunks):
+        # 领导者边读取边把数据块共享给跟随者
+        try:
+            for chunk in chunks:
+                flight.append(chunk)
+                yield chunk
+        except GeneratorExit:
+            # 调用方提前停止读取时，为仍在等待的跟随者读完剩余数据
+            try:
+                for chunk in chunks:
+                    flight.append(chunk)
+            except Exception as e:
+                flight.finish(error=e)
+            else:
+                flight.finish()
+            raise
+        except BaseException as e:
+            flight.finish(error=e)
+            raise
+        else:
+            flight.finish()
+        finally:
+            self._flights.end(key, flight)
+
+    def request(self, method, endpoint, **kwargs):
+        url, headers = self._prepare_request(endpoint, kwargs)
+        key = self._flight_key(method, url, headers, kwargs)
+        if key is None:
+            return self._send(method, url, headers, kwargs)
+        return self._flights.do(key, lambda: self._send(method, url, headers, kwargs))
+
+    def iter_values(self, method, endpoint, meta=None, **kwargs):
+        """
+        以流式方式请求 OData 集合，逐项产出 `value` 数组中的实体。
+        响应体按块增量解析，无需缓冲整个页面；其余顶层字段 (如 @odata.nextLink) 写入 `meta`。
+        相同的并发请求共享同一个网络响应流。
+        """
+        url, headers = self._prepare_request(endpoint, kwargs)
+        key = self._flight_key(method, url, headers, kwargs)
+        timing = {}
+        if key is None:
+            chunks = self._stream_bytes(method, url, headers, kwargs, timing=timing)
+        else:
+            flight, leader = self._flights.begin(key, stream=True)
+            if leader:
+                chunks = self._lead_stream(key, flight, self._stream_bytes(method, url, headers, kwargs, timing=timing))
+            else:
+                chunks = flight.iter_chunks()
+                # 跟随者共享领导者的响应，不重复统计
+                yield from iter_odata_values(chunks, meta)
+                return
+
+        family = autotune.page_family(url) if self.autotuner else None
+        if family is None:
+            yield from iter_odata_values(chunks, meta)
+            return
+        # 只统计读取网络数据的耗时，不计入调用方处理每一项的时间与在调度队列中等待的时间
+        size, elapsed = [0], [0.0]
+
+        def counted(chunks):
+            chunks = iter(chunks)
+            while True:
+                started = time.monotonic()
+                chunk = next(chunks, None)
+                elapsed[0] += time.monotonic() - started
+                if chunk is None:
+                    return
+                size[0] += len(chunk)
+                yield chunk
+
+        items = 0
+        for item in iter_odata_values(counted(chunks), meta):
+            items += 1
+            yield item
+        self.autotuner.observe_page(family, items, size[0], max(elapsed[0] - timing.get("queued", 0.0), 0.0))
+
+    def iter_bytes(self, method, endpoint, chunk_size=None, **kwargs):
+        """以流式方式读取原始响应体 (如附件内容)，按块产出字节；此类请求不参与合并。"""
+        url, headers = self._prepare_request(endpoint, kwargs)
+        yield from self._stream_bytes(method, url, headers, kwargs, chunk_size, kind="transfer")
+
+    def request_upload_url(self, method, url, **kwargs):
+        """向上传会话返回的预授权 URL 发送请求。该 URL 自带授权，不能携带 Authorization 头。"""
+        with scheduler.slot(self._account_id):
+            response = self._http.request(method, url, timeout=self._timeouts["transfer"], **kwargs)
+            self._check(response)
+            return response
+
+    def batch(self, requests):
+        """
+        通过 JSON 批处理 ($batch) 合并发送多个请求，每批最多 20 个。
+        :param requests: [{"method": ..., "url": "/me/...", "body": 可选, "headers": 可选}]
+        :return: 与输入顺序一致的 [{"status": ..., "headers": ..., "body": ...}]
+        """
+        results = []
+        for offset in range(0, len(requests), BATCH_LIMIT):
+            chunk = requests[offset:offset + BATCH_LIMIT]
+            batch_requests = []
+            for index, req in enumerate(chunk):
+                headers = {"Prefer": 'outlook.timezone="China Standard Time"', **req.get("headers", {})}
+                if "body" in req:
+                    headers.setdefault("Content-Type", "application/json")
+                batch_requests.append({**req, "id": str(index), "headers": headers})
+            response = self.request("POST", "/$batch", json={"requests": batch_requests})
+            by_id = {item.get("id"): item for item in response.json().get("responses", [])}
+            results.extend(
+                by_id.get(str(index), {"status": 500, "headers": {}, "body": None})
+                for index in range(len(chunk))
+            )
+        return results
+
+    def get_me(self):
+        """获取当前用户资料 (/me)，在进程内缓存。"""
+        if self._me is None:
+            self._me = self.request("GET", "/me").json()
+        return self._me
+
+    def warm_up(self):
+        """
+        预热：从缓存静默获取 (必要时刷新) 访问令牌，建立到 Graph 的池化连接并解析用户资料。
+        返回各步骤耗时 (毫秒)；未认证时只完成令牌步骤。
+        """
+        timings = {}
+        started = time.perf_counter()
+        token = self.get_token()
+        timings["token_ms"] = round((time.perf_counter() - started) * 1000, 1)
+        if token:
+            started = time.perf_counter()
+            self.get_me()
+            timings["profile_ms"] = round((time.perf_counter() - started) * 1000, 1)
+        self.warm_up_timings = timings
+        return timings
+
+    def get_metrics(self):
+        """返回客户端运行指标。"""
+        metrics = {
+            "singleflight": dict(self._flights.stats),
+            "scheduler": scheduler.stats(),
+            "circuit_breakers": self._breakers.stats(),
+        }
+        if self.autotuner:
+            metrics["autotune"] = self.autotuner.snapshot()
+        if self.write_queue:
+            metrics["write_behind"] = dict(self.write_queue.stats)
+        if self.search_index:
+            metrics["search_index"] = self.search_index.stats()
+        if self.prefetcher:
+            metrics["prefetch"] = self.prefetcher.stats()
+        if self.warm_up_timings is not None:
+            metrics["warm_up"] = dict(self.warm_up_timings)
+        return metrics
 
     @property
     def is_authenticated(self):
         return self.get_token() is not None
 
+# 进程内共享的客户端实例，以便在工具调用之间复用 Token 与合并并发请求
+_client = None
+_client_lock = threading.Lock()
+
 def get_client():
-    client_id = os.getenv('MS_GRAPH_CLIENT_ID')
-    redirect_uri = os.getenv('MS_GRAPH_REDIRECT_URI')
-    token_path = os.getenv('MS_GRAPH_TOKEN_PATH')
+    global _client
+    with _client_lock:
+        if _client is not None:
+            return _client
 
-    if not client_id:
-        print("错误：必须在 .env 文件或环境变量中设置 MS_GRAPH_CLIENT_ID。")
-        sys.exit(1)
-    
-    return GraphClient(
-        client_id=client_id,
-        redirect_uri=redirect_uri,
-        token_path=token_path if token_path else 'graph_token.json'
-    )
+        client_id = os.getenv('MS_GRAPH_CLIENT_ID')
+        redirect_uri = os.getenv('MS_GRAPH_REDIRECT_URI')
+        token_path = os.getenv('MS_GRAPH_TOKEN_PATH')
+
+        if not client_id:
+            print("错误：必须在 .env 文件或环境变量中设置 MS_GRAPH_CLIENT_ID。")
+            sys.exit(1)
+        
+        client_class = GraphClient
+        if os.getenv("M365_BROKER", "false").lower() in ("true", "1", "yes"):
+            # 通过本地缓存代理共享 Token、连接池与限流额度；不支持 Unix 域套接字的平台直接访问 Graph
+            if hasattr(socket, "AF_UNIX"):
+                from .broker import BrokeredGraphClient
+                client_class = BrokeredGraphClient
+            else:
+                logger.warning("当前平台不支持 Unix 域套接字，M365_BROKER 已忽略")
+
+        _client = client_class(
+            client_id=client_id,
+            redirect_uri=redirect_uri,
+            token_path=token_path if token_path else 'graph_token.json'
+        )
+        return _client
 
 def authenticate_interactive():
     client = get_client()
@@ -0,0 +1,568 @@
+"""
+本地缓存代理 (broker)：一个后台进程持有 Token 缓存、连接池、限流预算、熔断器、请求合并与可选的短期响应缓存，
+同一用户的多个 stdio 服务器进程通过 Unix 域套接字把 Graph 请求转发给它，共享令牌与限流额度。
+第一个需要它的服务器进程自动启动代理；代理空闲一段时间后自动退出。
+套接字位于 $XDG_RUNTIME_DIR 或仅当前用户可访问的目录中，双方在收发任何数据前都会核对对端的用户。
+"""
+import argparse
+import base64
+import logging
+import os
+import socket
+import socketserver
+import stat
+import struct
+import subprocess
+import sys
+import tempfile
+import threading
+import time
+from collections import OrderedDict
+from urllib.parse import urlsplit
+
+import httpx
+
+from .auth import GraphClient
+from .utils.circuit_breaker import GraphUnavailableError
+from .utils.json_stream import loads, dumps
+from .utils.scheduler import scheduler
+from .utils.token_cache import FileLock
+
+logger = logging.getLogger(__name__)
+
+# 代理在没有任何请求多久之后退出 (秒)
+DEFAULT_IDLE_TIMEOUT = 600
+# 自动启动代理后等待其就绪的最长时间 (秒)
+SPAWN_TIMEOUT = 10.0
+# 单个转发请求的套接字超时 (秒)，需覆盖附件传输等长请求
+SOCKET_TIMEOUT = 300.0
+# 转发请求时标识“由代理附加访问令牌”的占位令牌
+BROKER_TOKEN = "m365-broker"
+# 响应体分帧转发时每帧的最大字节数
+FRAME_BYTES = 64 * 1024
+# 响应缓存的默认有效期 (秒，0 为不缓存)、单个响应与缓存总量的字节数上限。
+# 缓存只在经过代理的写请求后失效，其他客户端 (如 Outlook) 的修改在有效期内不可见，因此默认关闭
+DEFAULT_CACHE_TTL = 0.0
+CACHE_MAX_ENTRY_BYTES = 1024 * 1024
+CACHE_MAX_BYTES = 64 * 1024 * 1024
+# 不附加访问令牌时允许访问的主机 (附件上传会话返回的预授权 URL)
+UPLOAD_HOSTS = ("outlook.office.com", "outlook.office365.com")
+# 不转发的逐跳请求头与响应头 (响应体已由代理解压)
+_REQUEST_SKIP = {"host", "content-length", "connection", "authorization"}
+_RESPONSE_SKIP = {"content-encoding", "content-length", "transfer-encoding", "connection"}
+
+
+def default_socket_path():
+    """$M365_BROKER_SOCKET；否则 $XDG_RUNTIME_DIR 下，或临时目录中仅当前用户可访问的子目录下。"""
+    configured = os.getenv("M365_BROKER_SOCKET")
+    if configured:
+        return configured
+    runtime = os.getenv("XDG_RUNTIME_DIR")
+    if runtime and os.path.isdir(runtime):
+        return os.path.join(runtime, "m365-mcp-broker.sock")
+    return os.path.join(tempfile.gettempdir(), f"m365-mcp-{os.getuid()}", "broker.sock")
+
+
+def _private_dir(socket_path):
+    """创建 (0700) 并检查套接字所在目录：必须属于当前用户，且其他用户不可写 (否则可替换套接字)。"""
+    directory = os.path.dirname(os.path.abspath(socket_path))
+    try:
+        os.makedirs(directory, mode=0o700)
+    except FileExistsError:
+        pass
+    info = os.lstat(directory)
+    if not stat.S_ISDIR(info.st_mode) or info.st_uid != os.getuid() or info.st_mode & 0o022:
+        raise RuntimeError(f"代理套接字目录 {directory} 不属于当前用户或可被其他用户写入，拒绝使用")
+
+
+def _peer_uid(sock):
+    """对端进程的用户 ID (Linux 的 SO_PEERCRED)；平台不支持时返回 None。"""
+    if not hasattr(socket, "SO_PEERCRED"):
+        return None
+    creds = sock.getsockopt(socket.SOL_SOCKET, socket.SO_PEERCRED, struct.calcsize("3i"))
+    return struct.unpack("3i", creds)[1]
+
+
+def send_frame(sock, message):
+    data = dumps(message).encode("utf-8")
+    sock.sendall(struct.pack(">I", len(data)) + data)
+
+
+def _recv_exactly(sock, size):
+    buffer = bytearray()
+    while len(buffer) < size:
+        chunk = sock.recv(size - len(buffer))
+        if not chunk:
+            return None
+        buffer += chunk
+    return bytes(buffer)
+
+
+def recv_frame(sock):
+    """读取一帧 (4 字节长度 + JSON)；对端关闭连接时返回 None。"""
+    header = _recv_exactly(sock, 4)
+    if header is None:
+        return None
+    data = _recv_exactly(sock, struct.unpack(">I", header)[0])
+    if data is None:
+        raise ConnectionError("代理连接在读取消息时中断")
+    return loads(data)
+
+
+# --- 代理进程 ---
+
+class ResponseCache:
+    """
+    代理内的 GET 响应缓存：按请求合并的键缓存 200 响应 ttl 秒，按字节数做 LRU 淘汰。
+    任何写请求都会清空整个缓存；写请求期间开始的读取不会写入缓存。
+    """
+
+    def __init__(self, ttl=DEFAULT_CACHE_TTL, max_bytes=CACHE_MAX_BYTES, max_entry_bytes=CACHE_MAX_ENTRY_BYTES):
+        self.ttl = ttl
+        self.max_bytes = max_bytes
+        self.max_entry_bytes = max_entry_bytes
+        self._lock = threading.Lock()
+        self._entries = OrderedDict()
+        self._size = 0
+        self.generation = 0
+        self.stats = {"hits": 0, "misses": 0, "invalidations": 0}
+
+    def get(self, key):
+        """返回 (响应头帧, 响应体)；未命中或已过期时返回 None。"""
+        if self.ttl <= 0:
+            return None
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is not None and entry[0] > time.monotonic():
+                self._entries.move_to_end(key)
+                self.stats["hits"] += 1
+                return entry[1], entry[2]
+            if entry is not None:
+                self._discard(key)
+            self.stats["misses"] += 1
+            return None
+
+    def put(self, key, head, body, generation):
+        if self.ttl <= 0 or len(body) > self.max_entry_bytes:
+            return
+        with self._lock:
+            if generation != self.generation:
+                return
+            self._discard(key)
+            self._entries[key] = (time.monotonic() + self.ttl, head, body)
+            self._size += len(body)
+            while self._size > self.max_bytes:
+                self._discard(next(iter(self._entries)))
+
+    def invalidate(self):
+        with self._lock:
+            self._entries.clear()
+            self._size = 0
+            self.generation += 1
+            self.stats["invalidations"] += 1
+
+    def _discard(self, key):
+        entry = self._entries.pop(key, None)
+        if entry is not None:
+            self._size -= len(entry[2])
+
+    def summary(self):
+        with self._lock:
+            return {**self.stats, "entries": len(self._entries), "bytes": self._size, "ttl": self.ttl}
+
+
+class Broker:
+    """代理端：用一个 GraphClient 执行各服务器进程转发来的请求。"""
+
+    def __init__(self, client, idle_timeout=DEFAULT_IDLE_TIMEOUT, cache_ttl=None):
+        self.client = client
+        self.idle_timeout = idle_timeout
+        if cache_ttl is None:
+            cache_ttl = float(os.getenv("M365_BROKER_CACHE_TTL", DEFAULT_CACHE_TTL))
+        self.cache = ResponseCache(cache_ttl)
+        self._lock = threading.Lock()
+        self._active = 0
+        self._last_activity = time.monotonic()
+        self.stats = {"requests": 0, "errors": 0}
+
+    def _touch(self, delta):
+        with self._lock:
+            self._active += delta
+            self._last_activity = time.monotonic()
+
+    def idle_for(self):
+        with self._lock:
+            return 0.0 if self._active else time.monotonic() - self._last_activity
+
+    def handle(self, message):
+        """status/metrics 返回一个回复；http 返回回复帧的迭代器 (响应头、若干数据块、结束标记)。"""
+        op = message.get("op")
+        if op == "http":
+            return self._forward(message)
+        if op == "status":
+            return {"authenticated": self.client.is_authenticated}
+        if op == "metrics":
+            with self._lock:
+                stats = {**self.stats, "active": self._active}
+            return {"broker": stats, "cache": self.cache.summary(), **self.client.get_metrics()}
+        raise ValueError(f"未知的代理操作: {op}")
+
+    def _forward(self, message):
+        client = self.client
+        method, url = message["method"], message["url"]
+        # 请求头名不区分大小写，便于 _prepare_request 合并调用方的 Prefer
+        headers = httpx.Headers([(k, v) for k, v in message["headers"] if k.lower() not in _REQUEST_SKIP])
+        authorized = any(k.lower() == "authorization" and v == f"Bearer {BROKER_TOKEN}" for k, v in message["headers"])
+        kwargs = {}
+        if message.get("content"):
+            kwargs["content"] = base64.b64decode(message["content"])
+        # 访问令牌只附加给 Graph；不附加令牌的请求只允许发往附件上传会话的主机
+        if authorized and not url.startswith(client.base_url + "/"):
+            raise ValueError(f"代理只为 {client.base_url} 下的请求附加访问令牌: {url}")
+        parts = urlsplit(url)
+        if not authorized and (parts.scheme != "https" or parts.hostname not in UPLOAD_HOSTS):
+            raise ValueError(f"代理不转发该地址的请求: {parts.scheme}://{parts.hostname}")
+        with self._lock:
+            self.stats["requests"] += 1
+
+        if method.upper() != "GET":
+            frames = self._write(method, url, headers, kwargs, authorized)
+        else:
+            frames = self._read(method, url, headers, kwargs, authorized)
+        try:
+            for item in frames:
+                yield item if isinstance(item, dict) else {"chunk": base64.b64encode(item).decode("ascii")}
+        finally:
+            frames.close()
+        yield {"end": True}
+
+    def _read(self, method, url, headers, kwargs, authorized):
+        client = self.client
+        if not authorized:
+            yield from self._upload(method, url, headers, kwargs)
+            return
+        url, headers = client._prepare_request(url, {**kwargs, "headers": headers})
+        key = client._flight_key(method, url, headers, kwargs)
+        cached = self.cache.get(key) if key is not None else None
+        if cached is not None:
+            head, body = cached
+            yield head
+            for offset in range(0, len(body), FRAME_BYTES):
+                yield body[offset:offset + FRAME_BYTES]
+            return
+        if key is None:
+            yield from self._stream(method, url, headers, kwargs)
+            return
+        # 与本进程内的请求相同：合并相同的并发 GET，跟随者依次读取领导者的响应头与数据块
+        flight, leader = client._flights.begin(key, stream=True)
+        if leader:
+            yield from client._lead_stream(key, flight, self._stream(method, url, headers, kwargs, key))
+        else:
+            yield from flight.iter_chunks()
+
+    def _write(self, method, url, headers, kwargs, authorized):
+        # 写请求完成后清空响应缓存，之后的读取从服务器重新获取
+        try:
+            if authorized:
+                url, headers = self.client._prepare_request(url, {**kwargs, "headers": headers})
+                yield from self._stream(method, url, headers, kwargs)
+            else:
+                yield from self._upload(method, url, headers, kwargs)
+        finally:
+            self.cache.invalidate()
+
+    def _stream(self, method, url, headers, kwargs, cache_key=None):
+        """附加令牌后执行请求 (排队、熔断、统计)，依次产出响应头帧与响应体数据块；成功的 GET 写入缓存。"""
+        client = self.client
+        generation = self.cache.generation
+        kind = "batch" if urlsplit(url).path.endswith("/$batch") else None
+        with client._open_stream(method, url, headers, dict(kwargs), kind=kind) as response:
+            if response.status_code == 429:
+                scheduler.throttled(response.headers.get("Retry-After"))
+            head = self._head(response)
+            yield head
+            body, size = [], 0
+            cacheable = cache_key is not None and response.status_code == 200
+            for chunk in response.iter_bytes(FRAME_BYTES):
+                if cacheable:
+                    size += len(chunk)
+                    if size <= self.cache.max_entry_bytes:
+                        body.append(chunk)
+                    else:
+                        cacheable, body = False, []
+                yield chunk
+        if cacheable:
+            self.cache.put(cache_key, head, b"".join(body), generation)
+
+    def _upload(self, method, url, headers, kwargs):
+        # 预授权的上传 URL：不附加令牌，只占用共享的并发额度
+        client = self.client
+        with scheduler.slot(client._account_id):
+            try:
+                with client._http.stream(method, url, headers=headers,
+                                         timeout=client._timeouts["transfer"], **kwargs) as response:
+                    yield self._head(response)
+                    yield from response.iter_bytes(FRAME_BYTES)
+            except httpx.TransportError as e:
+                raise client._unavailable(e) from e
+
+    @staticmethod
+    def _head(response):
+        return {
+            "status": response.status_code,
+            "headers": [[k, v] for k, v in response.headers.multi_items() if k.lower() not in _RESPONSE_SKIP],
+        }
+
+
+class _PeerGone(Exception):
+    pass
+
+
+class _Handler(socketserver.BaseRequestHandler):
+    def handle(self):
+        broker = self.server.broker
+        # 目录权限之外再核对连接方的用户
+        peer = _peer_uid(self.request)
+        if peer is not None and peer != os.getuid():
+            logger.warning("拒绝来自用户 %d 的连接", peer)
+            return
+        while True:
+            try:
+                message = recv_frame(self.request)
+            except (ConnectionError, OSError):
+                return
+            if message is None:
+                return
+            broker._touch(1)
+            try:
+                self._reply(broker, message)
+            except _PeerGone:
+                return
+            finally:
+                broker._touch(-1)
+
+    def _send(self, frame):
+        try:
+            send_frame(self.request, frame)
+        except OSError as e:
+            raise _PeerGone() from e
+
+    def _reply(self, broker, message):
+        # 错误帧可以出现在任何位置 (包括已发送部分响应体之后)，客户端收到后抛出异常
+        try:
+            reply = broker.handle(message)
+            if isinstance(reply, dict):
+                self._send(reply)
+                return
+            try:
+                for frame in reply:
+                    self._send(frame)
+            finally:
+                reply.close()
+        except _PeerGone:
+            raise
+        except Exception as e:
+            with broker._lock:
+                broker.stats["errors"] += 1
+            kind = "unavailable" if isinstance(e, GraphUnavailableError) else "error"
+            self._send({"error": {"type": kind, "message": str(e)}})
+
+
+class _Server(socketserver.ThreadingMixIn, socketserver.UnixStreamServer):
+    daemon_threads = True
+
+
+def serve(socket_path=None, idle_timeout=None, client=None):
+    """在 Unix 域套接字上运行代理，空闲超过 idle_timeout 秒后退出。"""
+    socket_path = socket_path or default_socket_path()
+    if idle_timeout is None:
+        idle_timeout = float(os.getenv("M365_BROKER_IDLE", DEFAULT_IDLE_TIMEOUT))
+    _private_dir(socket_path)
+    if _connect(socket_path) is not None:
+        logger.info("代理已在运行：%s", socket_path)
+        return
+    if os.path.lexists(socket_path):
+        os.remove(socket_path)
+    if client is None:
+        # 写后队列、搜索索引与预取属于各服务器进程 (写后队列按进程独立)，代理只负责 Graph 请求
+        for name in ("M365_BROKER", "ENABLE_WRITE_BEHIND", "ENABLE_SEARCH_INDEX", "ENABLE_PREFETCH"):
+            os.environ[name] = "false"
+        from .auth import get_client
+        client = get_client()
+    broker = Broker(client, idle_timeout)
+
+    old_umask = os.umask(0o077)
+    try:
+        server = _Server(socket_path, _Handler)
+    finally:
+        os.umask(old_umask)
+    server.broker = broker
+
+    def watchdog():
+        while broker.idle_for() < idle_timeout:
+            time.sleep(min(1.0, idle_timeout))
+        logger.info("代理空闲 %d 秒，退出", idle_timeout)
+        server.shutdown()
+
+    threading.Thread(target=watchdog, name="m365-broker-idle", daemon=True).start()
+    try:
+        server.serve_forever()
+    finally:
+        server.server_close()
+        if os.path.exists(socket_path):
+            os.remove(socket_path)
+
+
+# --- 服务器进程端 (shim) ---
+
+def _connect(socket_path):
+    """连接已运行的代理；套接字不存在或无人监听时返回 None，不属于当前用户时抛出异常。"""
+    try:
+        info = os.lstat(socket_path)
+    except FileNotFoundError:
+        return None
+    if not stat.S_ISSOCK(info.st_mode) or info.st_uid != os.getuid():
+        raise RuntimeError(f"{socket_path} 不是当前用户的代理套接字，拒绝连接")
+    sock = socket.socket(socket.AF_UNIX, socket.SOCK_STREAM)
+    sock.settimeout(SOCKET_TIMEOUT)
+    try:
+        sock.connect(socket_path)
+    except OSError:
+        sock.close()
+        return None
+    peer = _peer_uid(sock)
+    if peer is not None and peer != os.getuid():
+        sock.close()
+        raise RuntimeError(f"{socket_path} 上的代理属于用户 {peer}，拒绝连接")
+    return sock
+
+
+def connect(socket_path, spawn=True):
+    """连接代理；未运行时自动启动 (跨进程加锁，避免多个会话同时启动多个代理)。"""
+    _private_dir(socket_path)
+    sock = _connect(socket_path)
+    if sock is not None or not spawn:
+        return sock
+    with FileLock(socket_path + ".lock", timeout=SPAWN_TIMEOUT * 2):
+        sock = _connect(socket_path)
+        if sock is not None:
+            return sock
+        # 保持当前工作目录 (相对的 Token 路径不变)，通过 PYTHONPATH 确保能导入本包
+        root = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+        env = {**os.environ, "PYTHONPATH": os.pathsep.join(filter(None, [root, os.getenv("PYTHONPATH")]))}
+        subprocess.Popen(
+            [sys.executable, "-m", "src.broker", "--socket", socket_path],
+            stdin=subprocess.DEVNULL, stdout=subprocess.DEVNULL, stderr=subprocess.DEVNULL,
+            start_new_session=True, env=env,
+        )
+        deadline = time.monotonic() + SPAWN_TIMEOUT
+        while time.monotonic() < deadline:
+            sock = _connect(socket_path)
+            if sock is not None:
+                return sock
+            time.sleep(0.05)
+    raise RuntimeError(f"无法启动本地缓存代理 ({socket_path})。可设置 M365_BROKER=false 改为直接访问 Graph。")
+
+
+def _check_reply(reply):
+    """代理报告的错误在本进程中重新抛出。"""
+    if reply is None:
+        raise GraphUnavailableError("本地缓存代理意外断开连接")
+    if "error" in reply:
+        error_class = GraphUnavailableError if reply["error"]["type"] == "unavailable" else RuntimeError
+        raise error_class(reply["error"]["message"])
+    return reply
+
+
+def call(socket_path, message):
+    """向代理发送一条消息并返回回复。"""
+    sock = connect(socket_path)
+    try:
+        send_frame(sock, message)
+        return _check_reply(recv_frame(sock))
+    finally:
+        sock.close()
+
+
+class _FrameStream(httpx.SyncByteStream):
+    """逐帧读取代理转发的响应体；读完或关闭响应时关闭连接。"""
+
+    def __init__(self, sock):
+        self._sock = sock
+
+    def __iter__(self):
+        while True:
+            frame = _check_reply(recv_frame(self._sock))
+            if frame.get("end"):
+                return
+            yield base64.b64decode(frame["chunk"])
+
+    def close(self):
+        self._sock.close()
+
+
+class BrokerTransport(httpx.BaseTransport):
+    """httpx 传输层：把请求转发给代理执行，以流的形式返回代理收到的原始响应。"""
+
+    def __init__(self, socket_path):
+        self.socket_path = socket_path
+
+    def handle_request(self, request):
+        content = request.read()
+        sock = connect(self.socket_path)
+        try:
+            send_frame(sock, {
+                "op": "http",
+                "method": request.method,
+                "url": str(request.url),
+                "headers": [[k, v] for k, v in request.headers.multi_items()
+                            if k.lower() not in ("host", "content-length")],
+                "content": base64.b64encode(content).decode("ascii") if content else None,
+            })
+            head = _check_reply(recv_frame(sock))
+        except BaseException:
+            sock.close()
+            raise
+        # 响应体随读取逐帧到达，iter_bytes/iter_values 无需等待整个响应
+        return httpx.Response(head["status"], headers=head["headers"], stream=_FrameStream(sock), request=request)
+
+
+class BrokeredGraphClient(GraphClient):
+    """
+    通过代理访问 Graph 的客户端：访问令牌由代理附加，本进程不再单独认证与刷新令牌。
+    写后队列、搜索索引与预取仍在本进程中运行；写后队列使用本进程独立的文件。
+    """
+
+    per_process_write_queue = True
+
+    def __init__(self, client_id, socket_path=None, **kwargs):
+        self.socket_path = socket_path or default_socket_path()
+        super().__init__(client_id, transport=BrokerTransport(self.socket_path), **kwargs)
+
+    def get_token(self):
+        return BROKER_TOKEN
+
+    @property
+    def is_authenticated(self):
+        return call(self.socket_path, {"op": "status"})["authenticated"]
+
+    def get_metrics(self):
+        metrics = super().get_metrics()
+        try:
+            metrics["broker"] = call(self.socket_path, {"op": "metrics"})
+        except Exception as e:
+            metrics["broker"] = {"error": str(e)}
+        return metrics
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Microsoft 365 MCP 本地缓存代理")
+    parser.add_argument("--socket", help="Unix 域套接字路径")
+    parser.add_argument("--idle", type=float, help="空闲多少秒后退出")
+    args = parser.parse_args()
+    logging.basicConfig(level=logging.INFO)
+    serve(args.socket, args.idle)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,95 @@
+from datetime import datetime, timedelta
+
+from ..models import Event, Task, Message
+from ..utils.output import compact_item
+from . import calendar_tools, email_tools, tasks_tools
+
+# 简报中各部分最多获取的条数
+AGENDA_EVENT_LIMIT = 50
+AGENDA_TASK_LIMIT = 100
+_EVENT_FIELDS = "id,subject,start,end,location,bodyPreview"
+_MESSAGE_FIELDS = "id,subject,from,receivedDateTime,bodyPreview"
+
+
+def _tasks_url(list_id):
+    # To Do 不支持按截止时间筛选，服务端只排除已完成的任务，到期筛选在本地进行
+    return f"/me/todo/lists/{list_id}/tasks?$filter=status ne 'completed'&$top={AGENDA_TASK_LIMIT}"
+
+
+def _error_message(response):
+    body = response.get("body")
+    error = body.get("error", {}) if isinstance(body, dict) else {}
+    return f"Microsoft Graph API 错误 ({error.get('code', 'UnknownError')}): {error.get('message', response['status'])}"
+
+
+def get_agenda(client, calendar=True, tasks=True, email=True, email_limit=10):
+    """
+    今日简报：当前时间、今天的日程、今天到期及已逾期的未完成待办、收件箱中的未读邮件。
+    各部分通过一次 $batch 请求获取；默认待办列表 ID 尚未缓存时需要额外一次请求。
+    某一部分失败时只在 errors 中报告，不影响其他部分。
+    """
+    now = datetime.now().replace(microsecond=0)
+    day_start = now.replace(hour=0, minute=0, second=0)
+    day_end = day_start + timedelta(days=1)
+    today, tomorrow = day_start.isoformat(), day_end.isoformat()
+
+    sections, requests = [], []
+    if calendar:
+        sections.append("events")
+        requests.append({"method": "GET", "url": (
+            f"/me/calendar/calendarView?startDateTime={today}&endDateTime={tomorrow}"
+            f"&$select={_EVENT_FIELDS}&$orderby=start/dateTime&$top={AGENDA_EVENT_LIMIT}"
+        )})
+    list_id = tasks_tools._default_list_ids.get(client) if tasks else None
+    if tasks:
+        sections.append("tasks")
+        requests.append({"method": "GET", "url": _tasks_url(list_id) if list_id else "/me/todo/lists"})
+    if email:
+        sections.append("unread_emails")
+        requests.append({"method": "GET", "url": (
+            f"/me/mailFolders/inbox/messages?$filter=isRead eq false&$select={_MESSAGE_FIELDS}&$top={email_limit}"
+        )})
+
+    result = {"now": now.isoformat(), "day_of_week": now.strftime("%A")}
+    errors = {}
+    for section, response in zip(sections, client.batch(requests) if requests else []):
+        if response["status"] >= 400:
+            errors[section] = _error_message(response)
+            continue
+        body = response.get("body") or {}
+        if section == "tasks" and not list_id:
+            list_id = tasks_tools._remember_default_list(client, body.get("value", []))
+            if not list_id:
+                result["tasks"] = []
+                continue
+            body = client.request("GET", _tasks_url(list_id)).json()
+        items = body.get("value", [])
+        queue = getattr(client, "write_queue", None)
+
+        if section == "events":
+            if queue:
+                items = queue.observe(items, "/me/events",
+                                      include_created=lambda event: Event.from_graph(event).overlaps(today, tomorrow))
+            events = sorted((Event.from_graph(event) for event in items), key=lambda event: event.start)
+            calendar_tools._index_events(client, events)
+            result["events"] = [compact_item(event.to_dict()) for event in events]
+        elif section == "tasks":
+            if queue:
+                items = queue.observe(items, f"/me/todo/lists/{list_id}/tasks", include_created=lambda task: True)
+            all_tasks = [Task.from_graph(task) for task in items]
+            tasks_tools._index_tasks(client, all_tasks)
+            result["tasks"] = [
+                compact_item({**task.to_dict(), "overdue": task.due < today},
+                             ["id", "title", "status", "due", "importance", "overdue"])
+                for task in sorted(all_tasks, key=lambda task: task.due or "")
+                if not task.is_completed and task.due and task.due < tomorrow
+            ]
+        else:
+            messages = [Message.from_graph(msg) for msg in items]
+            email_tools._index_messages(client, messages)
+            result["unread_emails"] = [compact_item(msg.to_dict()) for msg in messages]
+        if body.get("@odata.nextLink"):
+            result.setdefault("truncated", []).append(section)
+    if errors:
+        result["errors"] = errors
+    return result
@@ -0,0 +1,236 @@
+from datetime import datetime, timedelta
+
+from ..utils import autotune
+from ..utils.recurrence import parse_local
+from . import calendar_tools, tasks_tools
+
+# 单次分析允许的最长时间范围 (天)
+MAX_ANALYTICS_DAYS = 731
+WEEKDAYS = ["周一", "周二", "周三", "周四", "周五", "周六", "周日"]
+NO_CATEGORY = "(无分类)"
+CALENDAR_GROUPS = ("category", "week", "weekday", "month")
+TASK_GROUPS = ("month", "category")
+_EVENT_FIELDS = "start,end,categories,isAllDay,isCancelled,showAs"
+_TASK_FIELDS = "status,createdDateTime,completedDateTime,dueDateTime,categories"
+# Graph 以 UTC 返回的时间 (任务的创建时间等) 转换为本地时间 (UTC+8) 的偏移
+_UTC_OFFSET_HOURS = 8
+
+
+def _numpy():
+    try:
+        import numpy
+    except ImportError:
+        raise RuntimeError("统计分析需要 numpy。请执行 uv pip install -e \".[analytics]\"。")
+    return numpy
+
+
+def _range(start_date, end_date):
+    start, end = parse_local(start_date), parse_local(end_date)
+    if end <= start:
+        raise ValueError("end_date 必须晚于 start_date")
+    if end - start > timedelta(days=MAX_ANALYTICS_DAYS):
+        raise ValueError(f"分析的时间范围不能超过 {MAX_ANALYTICS_DAYS} 天")
+    return start, end
+
+
+def _iter_all(client, endpoint):
+    while endpoint:
+        meta = {}
+        yield from client.iter_values("GET", endpoint, meta=meta)
+        endpoint = meta.get("@odata.nextLink")
+
+
+def _times(np, values):
+    """将 ISO 时间字符串列表 (可带 7 位小数秒，缺失为 None) 一次性转换为 datetime64[s] 数组。"""
+    return np.array([v[:19] if v else "NaT" for v in values], dtype="datetime64[s]")
+
+
+def _weekday(np, times):
+    # 1970-01-01 是星期四；周一为 0
+    return (times.astype("datetime64[D]").astype(np.int64) + 3) % 7
+
+
+def _group(np, keys, values=None):
+    """按键分组：返回 (唯一键, 计数, 合计)。"""
+    unique, inverse = np.unique(keys, return_inverse=True)
+    counts = np.bincount(inverse, minlength=len(unique))
+    sums = np.bincount(inverse, weights=values, minlength=len(unique)) if values is not None else None
+    return unique, counts, sums
+
+
+def _table(columns, rows):
+    return {"columns": columns, "rows": rows}
+
+
+def _categories(np, items, field="categories"):
+    """
+    分类按字典编码展开：一个对象有多个分类时在每个分类下各计一次。
+    :return: (对象下标数组, 分类名数组)
+    """
+    index, names = [], []
+    for i, item in enumerate(items):
+        for name in item.get(field) or [NO_CATEGORY]:
+            index.append(i)
+            names.append(name)
+    return np.array(index, dtype=np.int64), np.array(names, dtype=object)
+
+
+def calendar_analytics(client, start_date, end_date, group_by=None, heatmap=False):
+    """
+    统计时间范围内的日程时长：总时长、按分类/周/星期/月汇总的小时数与事件数，可选按星期 x 小时的忙碌热力图。
+    事件逐页读取后转换为列存数组，汇总以向量化方式计算。全天、已取消与显示为空闲的事件不计入；
+    跨越范围边界的事件只统计范围内的部分，分组按开始时间归入。
+    """
+    np = _numpy()
+    range_start, range_end = _range(start_date, end_date)
+    group_by = list(group_by or ("category", "week", "weekday"))
+    for name in group_by:
+        if name not in CALENDAR_GROUPS:
+            raise ValueError(f"不支持的分组: {name}。可选: {', '.join(CALENDAR_GROUPS)}")
+
+    top = autotune.page_size(client, "calendarView", calendar_tools.EVENT_PAGE_SIZE)
+    events = [
+        {"start": e["start"]["dateTime"], "end": e["end"]["dateTime"], "categories": e.get("categories")}
+        for e in _iter_all(client, (
+            f"/me/calendar/calendarView?startDateTime={range_start.isoformat()}&endDateTime={range_end.isoformat()}"
+            f"&$select={_EVENT_FIELDS}&$top={top}"
+        ))
+        if not e.get("isAllDay") and not e.get("isCancelled") and e.get("showAs") != "free"
+    ]
+    lo, hi = np.datetime64(range_start, "s"), np.datetime64(range_end, "s")
+    starts = np.maximum(_times(np, [e["start"] for e in events]), lo)
+    ends = np.minimum(_times(np, [e["end"] for e in events]), hi)
+    keep = ends > starts
+    hours = np.where(keep, (ends - starts).astype(np.int64) / 3600.0, 0.0)
+
+    # 合并重叠后的实际忙碌时间：按分钟做差分计数
+    minutes = int(-(-(hi - lo).astype(np.int64) // 60))
+    diff = np.zeros(minutes + 1, dtype=np.int32)
+    np.add.at(diff, ((starts[keep] - lo).astype(np.int64) // 60), 1)
+    np.add.at(diff, (-(-(ends[keep] - lo).astype(np.int64) // 60)), -1)
+    busy = np.cumsum(diff[:-1]) > 0
+
+    result = {
+        "start_date": range_start.isoformat(), "end_date": range_end.isoformat(),
+        "events": int(keep.sum()),
+        "total_hours": round(float(hours.sum()), 2),
+        "busy_hours": round(float(busy.sum()) / 60, 2),
+    }
+    for name in group_by:
+        if name == "category":
+            index, names = _categories(np, events)
+            mask = keep[index]
+            keys, counts, sums = _group(np, names[mask], hours[index][mask])
+            order = np.argsort(-sums) if len(keys) else []
+            result["by_category"] = _table(
+                ["category", "hours", "events"],
+                [[str(keys[i]), round(float(sums[i]), 2), int(counts[i])] for i in order]
+            )
+            continue
+        if name == "weekday":
+            keys, counts, sums = _group(np, _weekday(np, starts[keep]), hours[keep])
+            labels = [WEEKDAYS[int(k)] for k in keys]
+        else:
+            days = starts[keep].astype("datetime64[D]")
+            if name == "week":
+                # 以周一所在日期标识一周
+                days = days - _weekday(np, starts[keep]).astype("timedelta64[D]")
+            else:
+                days = days.astype("datetime64[M]")
+            keys, counts, sums = _group(np, days, hours[keep])
+            labels = [str(k) for k in keys]
+        result[f"by_{name}"] = _table(
+            [name, "hours", "events"],
+            [[label, round(float(s), 2), int(c)] for label, s, c in zip(labels, sums, counts)]
+        )
+
+    if heatmap:
+        # 按整点对齐后逐小时汇总忙碌分钟数，再累加到 (星期, 小时) 格子
+        offset = int(lo.astype("datetime64[m]").astype(np.int64) % 60)
+        padded = np.concatenate([np.zeros(offset, dtype=bool), busy])
+        padded = np.concatenate([padded, np.zeros(-len(padded) % 60, dtype=bool)])
+        hourly = padded.reshape(-1, 60).sum(axis=1) / 60.0
+        slots = lo.astype("datetime64[h]") + np.arange(len(hourly)).astype("timedelta64[h]")
+        grid = np.zeros((7, 24))
+        np.add.at(grid, (_weekday(np, slots), slots.astype(np.int64) % 24), hourly)
+        result["heatmap"] = {
+            "unit": "hours",
+            "rows": WEEKDAYS,
+            "columns": list(range(24)),
+            "values": np.round(grid, 1).tolist(),
+        }
+    return result
+
+
+def _local_times(np, values):
+    """DateTimeTimeZone 或 UTC 字符串 -> 本地时间 datetime64 数组 (缺失为 NaT)。"""
+    raw, utc = [], []
+    for value in values:
+        if isinstance(value, dict):
+            raw.append(value.get("dateTime"))
+            utc.append(value.get("timeZone") in ("UTC", "Etc/UTC"))
+        else:
+            raw.append(value)
+            utc.append(bool(value))
+    times = _times(np, raw)
+    return np.where(np.array(utc, dtype=bool), times + np.timedelta64(_UTC_OFFSET_HOURS, "h"), times)
+
+
+def task_analytics(client, start_date, end_date, group_by=None, now=None):
+    """
+    统计时间范围内创建的待办任务：完成率、当前逾期数、完成耗时 (天) 的均值/中位数/90 分位，
+    以及按月 (创建时间) 与分类的汇总。任务逐页读取后转换为列存数组，汇总以向量化方式计算。
+    """
+    np = _numpy()
+    range_start, range_end = _range(start_date, end_date)
+    group_by = list(group_by or TASK_GROUPS)
+    for name in group_by:
+        if name not in TASK_GROUPS:
+            raise ValueError(f"不支持的分组: {name}。可选: {', '.join(TASK_GROUPS)}")
+    list_id = tasks_tools._get_default_todo_list_id(client)
+    if not list_id:
+        raise RuntimeError("未找到默认待办列表")
+
+    # To Do 不支持按创建时间筛选，读取全部任务后在本地按范围过滤
+    top = autotune.page_size(client, "tasks", tasks_tools.TASK_PAGE_SIZE)
+    tasks = list(_iter_all(client, f"/me/todo/lists/{list_id}/tasks?$select={_TASK_FIELDS}&$top={top}"))
+    created = _local_times(np, [t.get("createdDateTime") for t in tasks])
+    completed_at = _local_times(np, [t.get("completedDateTime") for t in tasks])
+    due = _local_times(np, [t.get("dueDateTime") for t in tasks])
+    done = np.array([t.get("status") == "completed" for t in tasks], dtype=bool)
+
+    in_range = (created >= np.datetime64(range_start, "s")) & (created < np.datetime64(range_end, "s"))
+    # 与 get_agenda 一致：今天到期的任务不算逾期
+    today = np.datetime64(now or datetime.now().replace(microsecond=0), "s").astype("datetime64[D]")
+    overdue = in_range & ~done & ~np.isnat(due) & (due < today)
+    latency_mask = in_range & done & ~np.isnat(completed_at)
+    latency = (completed_at[latency_mask] - created[latency_mask]).astype(np.int64) / 86400.0
+
+    total = int(in_range.sum())
+    finished = int((in_range & done).sum())
+    result = {
+        "start_date": range_start.isoformat(), "end_date": range_end.isoformat(),
+        "created": total,
+        "completed": finished,
+        "completion_rate": round(finished / total, 3) if total else None,
+        "open": total - finished,
+        "overdue": int(overdue.sum()),
+        "completion_days": {
+            "mean": round(float(latency.mean()), 2),
+            "median": round(float(np.median(latency)), 2),
+            "p90": round(float(np.percentile(latency, 90)), 2),
+        } if len(latency) else None,
+    }
+
+    for name in group_by:
+        if name == "month":
+            keys, mask, flags = created.astype("datetime64[M]"), in_range, done
+        else:
+            index, keys = _categories(np, tasks)
+            mask, flags = in_range[index], done[index]
+        unique, counts, completed = _group(np, keys[mask], flags[mask].astype(float))
+        result[f"by_{name}"] = _table(
+            [name, "created", "completed", "completion_rate"],
+            [[str(k), int(c), int(d), round(float(d) / c, 3)] for k, c, d in zip(unique, counts, completed)]
+        )
+    return result
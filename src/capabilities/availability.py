@@ -0,0 +1,168 @@
+import re
+from concurrent.futures import ThreadPoolExecutor
+from datetime import timedelta
+
+from ..utils.recurrence import parse_local
+from . import calendar_tools
+
+# getSchedule 单次请求的邮箱数与时间窗口上限
+MAX_SCHEDULES_PER_REQUEST = 20
+MAX_SCHEDULE_WINDOW_DAYS = 62
+# 单次工具调用最多查询的邮箱/会议室数与并发请求数
+MAX_BULK_SCHEDULES = 100
+SCHEDULE_PARALLEL_REQUESTS = 4
+# 结果中最多列出的空闲时段数
+MAX_FREE_SLOTS = 100
+# availabilityView 中视为占用的状态：1 暂定、2 忙碌、3 外出；0 空闲与 4 在其他地点工作视为可用
+_BUSY_BITS = str.maketrans("01234", "01110")
+
+
+def _parse_working_hours(value):
+    match = re.fullmatch(r"\s*(\d{1,2}):(\d{2})\s*-\s*(\d{1,2}):(\d{2})\s*", value or "")
+    if not match:
+        raise ValueError(f"working_hours 格式无效: {value}，应为 'HH:MM-HH:MM'")
+    h1, m1, h2, m2 = map(int, match.groups())
+    begin, end = h1 * 60 + m1, h2 * 60 + m2
+    if not (0 <= begin < end <= 24 * 60):
+        raise ValueError(f"working_hours 范围无效: {value}")
+    return begin, end
+
+
+def _chunks(start, end, interval):
+    """把时间范围切分为不超过 getSchedule 窗口上限、且长度为时间槽整数倍的若干段。"""
+    span = timedelta(minutes=(MAX_SCHEDULE_WINDOW_DAYS * 24 * 60 // interval) * interval)
+    chunks, cursor = [], start
+    while cursor < end:
+        chunks.append((cursor, min(cursor + span, end)))
+        cursor += span
+    return chunks
+
+
+def _slots(begin, end, interval):
+    return -(-int((end - begin).total_seconds()) // (interval * 60))
+
+
+def _bitmap(view):
+    """availabilityView -> 占用位图 (第 i 位对应第 i 个时间槽)。"""
+    return int(view.translate(_BUSY_BITS)[::-1] or "0", 2)
+
+
+def _runs(bitmap, count):
+    """位图中连续为 1 的区间 [(起始槽, 结束槽)]。"""
+    bits = format(bitmap, f"0{count}b")[::-1] if count else ""
+    return [m.span() for m in re.finditer("1+", bits)]
+
+
+def _free_ranges(free, count, start, interval, min_duration):
+    ranges = []
+    for first, last in _runs(free, count):
+        minutes = (last - first) * interval
+        if minutes >= min_duration:
+            ranges.append({
+                "start": (start + timedelta(minutes=first * interval)).isoformat(),
+                "end": (start + timedelta(minutes=last * interval)).isoformat(),
+                "minutes": minutes,
+            })
+    return ranges
+
+
+def _working_mask(start, count, interval, working_hours):
+    """时间槽完全落在每天工作时间内的位图。"""
+    if not working_hours:
+        return (1 << count) - 1
+    begin, end = _parse_working_hours(working_hours)
+    mask = 0
+    for i in range(count):
+        slot = start + timedelta(minutes=i * interval)
+        minute = slot.hour * 60 + slot.minute
+        if begin <= minute and minute + interval <= end:
+            mask |= 1 << i
+    return mask
+
+
+def _try(fn, arg):
+    try:
+        return fn(arg)
+    except Exception as e:
+        return e
+
+
+def get_bulk_availability(client, schedules, start, end, interval=30, min_duration=30,
+                          working_hours=None, per_schedule_free=False):
+    """
+    批量查询多个邮箱或会议室的忙闲，并计算所有人共同的空闲时段。
+    按 getSchedule 的邮箱数与时间窗口上限切分为多个请求并发执行，再把各段 availabilityView 拼接为每人的占用位图。
+    :param working_hours: 只在每天的该时间段内寻找空闲，如 '09:00-18:00'。
+    :param per_schedule_free: 同时返回每个邮箱/会议室各自的空闲时段。
+    """
+    schedules = list(dict.fromkeys(s.strip() for s in schedules if s and s.strip()))
+    if not schedules:
+        raise ValueError("schedules 不能为空")
+    if len(schedules) > MAX_BULK_SCHEDULES:
+        raise ValueError(f"一次最多查询 {MAX_BULK_SCHEDULES} 个邮箱或会议室")
+    if not 5 <= interval <= 1440:
+        raise ValueError("interval 必须在 5 到 1440 分钟之间")
+    begin, finish = parse_local(start), parse_local(end)
+    if finish <= begin:
+        raise ValueError("end 必须晚于 start")
+    count = _slots(begin, finish, interval)
+    working = _working_mask(begin, count, interval, working_hours)
+
+    groups = [schedules[i:i + MAX_SCHEDULES_PER_REQUEST] for i in range(0, len(schedules), MAX_SCHEDULES_PER_REQUEST)]
+    chunks = _chunks(begin, finish, interval)
+    jobs = [(group, index) for group in groups for index in range(len(chunks))]
+
+    def fetch(job):
+        group, index = job
+        chunk_start, chunk_end = chunks[index]
+        return calendar_tools.get_user_schedules(
+            client, group, chunk_start.isoformat(), chunk_end.isoformat(), interval
+        ).get("value", [])
+
+    views = {s.lower(): [""] * len(chunks) for s in schedules}
+    errors = {}
+    with ThreadPoolExecutor(max_workers=min(len(jobs), SCHEDULE_PARALLEL_REQUESTS)) as pool:
+        outcomes = list(pool.map(lambda job: _try(fetch, job), jobs))
+    if all(isinstance(outcome, Exception) for outcome in outcomes):
+        raise outcomes[0]
+    for (group, index), outcome in zip(jobs, outcomes):
+        if isinstance(outcome, Exception):
+            errors.update((s, str(outcome)) for s in group)
+            continue
+        for item in outcome:
+            schedule_id = (item.get("scheduleId") or "").lower()
+            if item.get("error"):
+                errors[item.get("scheduleId")] = item["error"].get("message") or str(item["error"])
+            elif schedule_id in views:
+                # 缺失的时间槽按忙碌处理
+                expected = _slots(*chunks[index], interval)
+                views[schedule_id][index] = (item.get("availabilityView") or "")[:expected].ljust(expected, "2")
+
+    failed = {s.lower() for s in errors}
+    busy_any, results = 0, []
+    for schedule in schedules:
+        if schedule.lower() in failed:
+            continue
+        parts = views[schedule.lower()]
+        if any(not part for part in parts):
+            errors[schedule] = "Graph 未返回该邮箱的忙闲数据"
+            continue
+        busy = _bitmap("".join(parts))
+        busy_any |= busy
+        entry = {"schedule": schedule, "busy_hours": round(bin(busy).count("1") * interval / 60, 2)}
+        if per_schedule_free:
+            entry["free"] = _free_ranges(~busy & working, count, begin, interval, min_duration)[:MAX_FREE_SLOTS]
+        results.append(entry)
+
+    common = _free_ranges(~busy_any & working, count, begin, interval, min_duration) if results else []
+    result = {
+        "start": start, "end": end, "interval": interval,
+        "schedules": results,
+        "common_free": common[:MAX_FREE_SLOTS],
+    }
+    if len(common) > MAX_FREE_SLOTS:
+        result["common_free_truncated"] = True
+    if errors:
+        # 查询失败的邮箱不参与共同空闲时段的计算
+        result["errors"] = errors
+    return result
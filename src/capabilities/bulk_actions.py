@@ -0,0 +1,244 @@
+import hashlib
+import itertools
+import os
+import time
+from concurrent.futures import ThreadPoolExecutor, wait, FIRST_COMPLETED
+from urllib.parse import quote
+
+from ..utils.json_stream import loads, dumps
+from ..utils.scheduler import scheduler
+from ..utils.token_cache import atomic_write
+from .mail_folders import resolve_folder
+from .tasks_tools import _get_default_todo_list_id, _invalidate_prefetch
+
+# 每个 $batch 包含的写操作数、同时在途的批次数与限流/5xx 的最大重试次数
+BULK_BATCH_SIZE = 20
+BULK_PARALLEL_BATCHES = 4
+BULK_MAX_RETRIES = 5
+# 筛选时每页读取的条数 (只取 ID 等少量字段)
+BULK_PAGE_SIZE = 100
+# 结果中最多列出的失败明细数与试运行时的样例数
+MAX_REPORTED_FAILURES = 100
+DRY_RUN_SAMPLES = 10
+PROGRESS_EVERY = 100
+
+# 各类对象支持的操作
+BULK_ACTIONS = {
+    "email": ("mark_read", "mark_unread", "move", "delete", "categorize"),
+    "task": ("complete", "delete", "categorize"),
+}
+
+
+def send_batch(client, items, max_retries=BULK_MAX_RETRIES):
+    """
+    通过一次 $batch 发送一批写操作；限流与 5xx 的子请求按 Retry-After 退避后重试。
+    :param items: [{"info": 用于失败明细的信息, "request": $batch 子请求}]
+    :return: (成功的 [(item, response)], 失败明细列表)
+    """
+    succeeded, failures = [], []
+    for attempt in range(max_retries + 1):
+        try:
+            responses = client.batch([item["request"] for item in items])
+        except Exception as e:
+            failures.extend({**item["info"], "error": str(e)} for item in items)
+            break
+        retry, delay = [], 0.0
+        for item, response in zip(items, responses):
+            status = response["status"]
+            if status < 300:
+                succeeded.append((item, response))
+            elif (status == 429 or status >= 500) and attempt < max_retries:
+                retry.append(item)
+                retry_after = (response.get("headers") or {}).get("Retry-After")
+                delay = max(delay, float(retry_after) if retry_after else 2 ** attempt)
+                if status == 429:
+                    scheduler.throttled(retry_after)
+            else:
+                error = (response.get("body") or {}).get("error") or {}
+                failures.append({**item["info"], "status": status,
+                                 "error": f"{error.get('code', 'UnknownError')}: {error.get('message', '')}"})
+        if not retry:
+            break
+        time.sleep(delay)
+        items = retry
+    return succeeded, failures
+
+
+def _checkpoint_dir(client):
+    return os.getenv("M365_PIPELINE_DIR") or os.path.join(
+        os.path.dirname(os.path.abspath(getattr(client, "token_path", None) or "graph_token.json")), "pipelines"
+    )
+
+
+class _Plan:
+    """一次批量操作的筛选来源与写操作构造方式。"""
+
+    def __init__(self, client, kind, filter, action, folder=None, destination=None, categories=None):
+        if kind not in BULK_ACTIONS:
+            raise ValueError(f"不支持的对象类型: {kind}。可选: {', '.join(BULK_ACTIONS)}")
+        if action not in BULK_ACTIONS[kind]:
+            raise ValueError(f"{kind} 不支持操作 {action}。可选: {', '.join(BULK_ACTIONS[kind])}")
+        if not (filter or "").strip():
+            raise ValueError("filter 不能为空：批量操作必须限定筛选条件")
+        if action == "move" and not destination:
+            raise ValueError("move 操作需要提供 destination (目标文件夹)")
+        if action == "categorize" and not categories:
+            raise ValueError("categorize 操作需要提供 categories")
+        self.kind, self.filter, self.action = kind, filter.strip(), action
+        self.categories = list(categories or [])
+        self.destination_id = resolve_folder(client, destination) if action == "move" else None
+
+        if kind == "email":
+            self.collection = f"/me/mailFolders/{resolve_folder(client, folder)}/messages" if folder else "/me/messages"
+            self.item_url = "/me/messages/{}"
+            self.fields = "id,subject,categories"
+        else:
+            list_id = _get_default_todo_list_id(client)
+            if not list_id:
+                raise RuntimeError("未找到默认待办列表")
+            self.collection = f"/me/todo/lists/{list_id}/tasks"
+            self.item_url = self.collection + "/{}"
+            self.fields = "id,title,categories"
+        self.key = hashlib.sha1(dumps(
+            [kind, self.collection, self.filter, action, self.destination_id, self.categories]
+        ).encode("utf-8")).hexdigest()[:16]
+
+    def matches(self, client):
+        """逐页产出匹配筛选条件的对象 ({id, title, categories})，不缓冲整个结果集。"""
+        link = f"{self.collection}?$filter={quote(self.filter)}&$select={self.fields}&$top={BULK_PAGE_SIZE}"
+        while link:
+            meta = {}
+            for item in client.iter_values("GET", link, meta=meta):
+                yield {"id": item["id"], "title": item.get("subject", item.get("title")),
+                       "categories": item.get("categories") or []}
+            link = meta.get("@odata.nextLink")
+
+    def request(self, item):
+        url = self.item_url.format(item["id"])
+        if self.action == "delete":
+            return {"method": "DELETE", "url": url}
+        if self.action == "move":
+            return {"method": "POST", "url": f"{url}/move", "body": {"destinationId": self.destination_id}}
+        if self.action == "categorize":
+            # 在原有分类基础上追加，不覆盖
+            body = {"categories": list(dict.fromkeys(item["categories"] + self.categories))}
+        elif self.action == "complete":
+            body = {"status": "completed"}
+        else:
+            body = {"isRead": self.action == "mark_read"}
+        return {"method": "PATCH", "url": url, "body": body}
+
+
+def _apply_batch(client, plan, items):
+    batch = [{"info": {"id": item["id"], "title": item["title"]}, "request": plan.request(item)} for item in items]
+    succeeded, failures = send_batch(client, batch)
+    done = [item["info"]["id"] for item, _ in succeeded]
+    if plan.action == "delete":
+        # 续跑时之前已删除的对象返回 404，视为已完成
+        missing = [f for f in failures if f.get("status") == 404]
+        done += [f["id"] for f in missing]
+        failures = [f for f in failures if f.get("status") != 404]
+    return done, failures
+
+
+def _sync_local_state(client, plan, done_ids):
+    index = getattr(client, "search_index", None)
+    if index and done_ids:
+        for item_id in done_ids:
+            if plan.action in ("delete", "move"):
+                # 移动后邮件获得新的 ID，下次列出时重新索引
+                index.remove(plan.kind, item_id)
+            elif plan.action == "complete":
+                index.update(plan.kind, item_id, meta={"status": "completed"})
+    if plan.kind == "task" and done_ids:
+        _invalidate_prefetch(client)
+
+
+def run_pipeline(client, kind, filter, action, folder=None, destination=None, categories=None,
+                 dry_run=False, limit=None, restart=False, progress=None):
+    """
+    按服务器端筛选条件 ($filter) 批量处理邮件或待办任务：逐页读取匹配项，按批通过 $batch 并发执行写操作，
+    同时在途的批次有上限。
+    匹配项先写入本地检查点 (只含 ID 等少量字段)，再按顺序处理；处理过程中修改或移走的对象不会影响分页。
+    中断后以相同参数再次调用即从检查点继续，不重复处理已完成的对象。
+    :param dry_run: 为 True 时只统计匹配数并返回少量样例，不执行任何写操作。
+    :param limit: 最多处理的对象数。
+    :param restart: 丢弃已有的检查点，重新筛选。
+    :param progress: 可选回调 progress(已处理数)。
+    """
+    plan = _Plan(client, kind, filter, action, folder, destination, categories)
+    matches = plan.matches(client)
+    if limit:
+        matches = itertools.islice(matches, limit)
+
+    if dry_run:
+        count, samples = 0, []
+        for item in matches:
+            count += 1
+            if len(samples) < DRY_RUN_SAMPLES:
+                samples.append({"id": item["id"], "title": item["title"]})
+        return {"status": "success", "dry_run": True, "kind": kind, "action": action,
+                "matched": count, "samples": samples}
+
+    directory = _checkpoint_dir(client)
+    os.makedirs(directory, exist_ok=True)
+    spool_path = os.path.join(directory, f"{plan.key}.jsonl")
+    state_path = os.path.join(directory, f"{plan.key}.json")
+    state = None
+    if not restart and os.path.exists(state_path):
+        with open(state_path, "rb") as f:
+            state = loads(f.read())
+    resumed = state is not None
+    if state is None:
+        # 筛选阶段只读，中断后重新筛选即可
+        matched = 0
+        with open(spool_path, "w", encoding="utf-8") as f:
+            for item in matches:
+                f.write(dumps(item) + "\n")
+                matched += 1
+        state = {"matched": matched, "done": 0, "succeeded": 0, "failed": 0, "failures": []}
+        atomic_write(state_path, dumps(state).encode("utf-8"))
+
+    def save():
+        atomic_write(state_path, dumps(state).encode("utf-8"))
+
+    with open(spool_path, "r", encoding="utf-8") as f:
+        items = (loads(line) for line in itertools.islice(f, state["done"], None))
+        with ThreadPoolExecutor(max_workers=BULK_PARALLEL_BATCHES) as pool:
+            # 按提交顺序记录批次；只有连续完成的前缀才推进检查点
+            pending, finished = [], {}
+
+            def collect(done):
+                for future in done:
+                    finished[future] = future.result()
+                while pending and pending[0][0] in finished:
+                    future, size = pending.pop(0)
+                    done_ids, failures = finished.pop(future)
+                    _sync_local_state(client, plan, done_ids)
+                    state["done"] += size
+                    state["succeeded"] += len(done_ids)
+                    state["failed"] += len(failures)
+                    state["failures"].extend(failures[:MAX_REPORTED_FAILURES - len(state["failures"])])
+                    if progress and state["done"] // PROGRESS_EVERY != (state["done"] - size) // PROGRESS_EVERY:
+                        progress(state["done"])
+                save()
+
+            while True:
+                chunk = list(itertools.islice(items, BULK_BATCH_SIZE))
+                if not chunk:
+                    break
+                in_flight = [future for future, _ in pending if future not in finished]
+                if len(in_flight) >= BULK_PARALLEL_BATCHES:
+                    done, _ = wait(in_flight, return_when=FIRST_COMPLETED)
+                    collect(done)
+                pending.append((pool.submit(_apply_batch, client, plan, chunk), len(chunk)))
+            collect(wait([future for future, _ in pending]).done)
+
+    os.remove(spool_path)
+    os.remove(state_path)
+    return {
+        "status": "success" if not state["failed"] else "partial",
+        "kind": kind, "action": action, "resumed": resumed,
+        "matched": state["matched"], "succeeded": state["succeeded"], "failed": state["failed"],
+        "failures": state["failures"],
+    }
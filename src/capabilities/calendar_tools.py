@@ -1,27 +1,154 @@
-def list_events(client, start_date=None, end_date=None):
-    """列出主日历中的事件。"""
-    from datetime import datetime, timedelta
+import itertools
+import os
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor, wait, FIRST_COMPLETED
+from datetime import datetime, timedelta
+
+from ..models import Event
+from ..utils import autotune, ics
+from ..utils.recurrence import expand_series, parse_local, LOCAL_TZ
+from .bulk_actions import send_batch
+
+# calendarView 每页返回的事件数 (启用自动调节时作为初始值)
+EVENT_PAGE_SIZE = 50
+
+# 本地展开循环事件时，系列主事件 (含例外) 缓存的有效期 (秒)
+SERIES_CACHE_TTL = 600
+_EVENT_FIELDS = "id,subject,start,end,location,bodyPreview,type"
+_series_cache = {}
+_series_lock = threading.Lock()
+
+# ICS 导出时获取的字段
+_ICS_EXPORT_FIELDS = (
+    "id,iCalUId,subject,start,end,location,body,bodyPreview,isAllDay,categories,"
+    "showAs,sensitivity,isReminderOn,reminderMinutesBeforeStart,lastModifiedDateTime"
+)
+# ICS 导入：每个 $batch 创建的事件数、同时进行的批次数、单个事件因限流或 5xx 的最大重试次数
+IMPORT_BATCH_SIZE = 20
+IMPORT_PARALLEL_BATCHES = 4
+IMPORT_MAX_RETRIES = 5
+# 结果中最多列出的失败明细数 (总数始终完整)
+MAX_REPORTED_FAILURES = 100
+# 每处理多少个事件报告一次进度
+PROGRESS_EVERY = 100
+
+def list_events_page(client, start_date=None, end_date=None, next_link=None, models=False):
+    """
+    获取主日历事件的一页。
+    :param next_link: 上一页返回的 @odata.nextLink；提供时忽略时间范围参数。
+    :param models: 为 True 时返回 Event 对象 (供缓存使用)，否则返回 dict。
+    :return: (事件列表, 下一页的 nextLink 或 None)
+    """
+    if next_link:
+        endpoint = next_link
+    else:
+        if not start_date:
+            start_date = datetime.now().isoformat()
+        if not end_date:
+            end_date = (datetime.fromisoformat(start_date) + timedelta(days=7)).isoformat()
+        # 使用 calendarView 以获取展开后的循环事件
+        top = autotune.page_size(client, "calendarView", EVENT_PAGE_SIZE)
+        endpoint = f"/me/calendar/calendarView?startDateTime={start_date}&endDateTime={end_date}&$top={top}"
     
+    # 流式解析响应，逐项整形，避免缓冲整个页面
+    meta = {}
+    items = client.iter_values("GET", endpoint, meta=meta)
+    queue = getattr(client, "write_queue", None)
+    if queue:
+        # 叠加尚未提交的写操作；范围内新建的日程只追加在第一页
+        include_created = None
+        if not next_link:
+            window_start, window_end = parse_local(start_date), parse_local(end_date)
+            include_created = lambda body: (parse_local(body["start"]["dateTime"]) < window_end
+                                            and parse_local(body["end"]["dateTime"]) > window_start)
+        items = queue.observe(items, "/me/events", include_created=include_created)
+    events = [Event.from_graph(event) for event in items]
+    _index_events(client, events)
+    return (events if models else [event.to_dict() for event in events]), meta.get("@odata.nextLink")
+
+def _index_events(client, events):
+    index = getattr(client, "search_index", None)
+    if index:
+        for event in events:
+            text = " ".join(filter(None, [event.location, event.body]))
+            index.add("event", event.id, event.subject, text, {"start": event.start, "end": event.end})
+
+def list_events(client, start_date=None, end_date=None):
+    """列出主日历中的事件 (第一页)。"""
+    return list_events_page(client, start_date, end_date)[0]
+
+def _collect(client, endpoint):
+    """跟随 nextLink 读取集合的全部页面。"""
+    items = []
+    while endpoint:
+        meta = {}
+        items.extend(client.iter_values("GET", endpoint, meta=meta))
+        endpoint = meta.get("@odata.nextLink")
+    return items
+
+def _load_series_masters(client):
+    """获取全部系列主事件及其取消/修改的实例，在有效期内复用缓存。"""
+    key = id(client)
+    with _series_lock:
+        entry = _series_cache.get(key)
+        if entry and time.monotonic() - entry[0] < SERIES_CACHE_TTL:
+            return entry[1]
+        endpoint = (
+            "/me/calendar/events?$filter=type eq 'seriesMaster'"
+            f"&$select={_EVENT_FIELDS},recurrence,cancelledOccurrences"
+            "&$expand=exceptionOccurrences&$top=100"
+        )
+        masters = _collect(client, endpoint)
+        _series_cache[key] = (time.monotonic(), masters)
+        return masters
+
+def invalidate_series_cache(client):
+    with _series_lock:
+        _series_cache.pop(id(client), None)
+
+def _invalidate_caches(client):
+    """日程变更后丢弃系列主事件缓存与预取的日程/忙闲数据。"""
+    invalidate_series_cache(client)
+    if getattr(client, "prefetcher", None):
+        client.prefetcher.invalidate("calendar", "schedule")
+
+def list_events_expanded(client, start_date=None, end_date=None):
+    """
+    列出时间范围内的事件，循环事件在本地展开。
+    只传输系列主事件 (缓存复用) 与范围内的单次事件，而不是服务器展开的全部实例，适合长时间范围查询。
+    本地展开的实例没有实例 ID，可通过 series_id 定位所属系列。
+    """
     if not start_date:
         start_date = datetime.now().isoformat()
     if not end_date:
         end_date = (datetime.fromisoformat(start_date) + timedelta(days=7)).isoformat()
-    
-    # 使用 calendarView 以获取展开后的循环事件
-    endpoint = f"/me/calendar/calendarView?startDateTime={start_date}&endDateTime={end_date}"
-    response = client.request("GET", endpoint)
-    data = response.json()
-    
+    window_start, window_end = parse_local(start_date), parse_local(end_date)
+
+    # $filter 按 UTC 比较，这里放宽一天，再按本地时间精确过滤
+    utc_start = (window_start.replace(tzinfo=LOCAL_TZ) - timedelta(days=1)).strftime("%Y-%m-%dT%H:%M:%S")
+    utc_end = (window_end.replace(tzinfo=LOCAL_TZ) + timedelta(days=1)).strftime("%Y-%m-%dT%H:%M:%S")
+    endpoint = (
+        "/me/calendar/events?$filter=type eq 'singleInstance'"
+        f" and start/dateTime lt '{utc_end}' and end/dateTime gt '{utc_start}'"
+        f"&$select={_EVENT_FIELDS}&$top={EVENT_PAGE_SIZE}"
+    )
+    events = [
+        event for event in _collect(client, endpoint)
+        if parse_local(event["start"]["dateTime"]) < window_end
+        and parse_local(event["end"]["dateTime"]) > window_start
+    ]
+    for master in _load_series_masters(client):
+        if master.get("recurrence"):
+            events.extend(expand_series(master, window_start, window_end))
+
+    events.sort(key=lambda event: event["start"]["dateTime"])
+    models = [Event.from_graph(event) for event in events]
+    # 本地展开的实例没有 ID，不会进入索引
+    _index_events(client, models)
     return [
-        {
-            "id": event.get("id"),
-            "subject": event.get("subject"),
-            "start": event.get("start", {}).get("dateTime"),
-            "end": event.get("end", {}).get("dateTime"),
-            "location": event.get("location", {}).get("displayName"),
-            "body": event.get("bodyPreview")
-        }
-        for event in data.get("value", [])
+        {**model.to_dict(), "series_id": event.get("seriesMasterId")}
+        for model, event in zip(models, events)
     ]
 
 def create_event(client, subject, start, end, body=None, body_type="HTML", location=None, is_all_day=False, importance="normal", categories=None, is_reminder_on=True, reminder_minutes=15):
@@ -44,9 +171,15 @@ def create_event(client, subject, start, end, body=None, body_type="HTML", locat
         payload["location"] = {"displayName": location}
     if categories:
         payload["categories"] = categories
+
+    if getattr(client, "write_queue", None):
+        local_id = client.write_queue.create("/me/events", payload)
+        _invalidate_caches(client)
+        return {"status": "queued", "id": local_id}
         
     response = client.request("POST", "/me/events", json=payload)
     data = response.json()
+    _invalidate_caches(client)
     return {"status": "success", "id": data.get("id")}
 
 def update_event(client, event_id, **kwargs):
@@ -79,13 +212,31 @@ def update_event(client, event_id, **kwargs):
     if not payload:
         return {"status": "error", "message": "未提供需要更新的字段"}
         
+    if getattr(client, "write_queue", None):
+        # 排队的修改可能提交失败，索引在提交后重新读取时更新
+        client.write_queue.patch(f"/me/events/{event_id}", payload)
+        _invalidate_caches(client)
+        return {"status": "queued"}
+
     client.request("PATCH", f"/me/events/{event_id}", json=payload)
+    if getattr(client, "search_index", None):
+        client.search_index.update("event", event_id, title=payload.get("subject"),
+                                   meta={k: kwargs[k] for k in ("start", "end") if k in kwargs} or None)
+    _invalidate_caches(client)
     return {"status": "success"}
 
 def delete_event(client, event_id):
     """删除日程。"""
-    client.request("DELETE", f"/me/events/{event_id}")
-    return {"status": "success"}
+    queue = getattr(client, "write_queue", None)
+    if queue:
+        queue.delete(f"/me/events/{event_id}")
+    else:
+        client.request("DELETE", f"/me/events/{event_id}")
+    # 删除成功 (或已排队) 后再移出索引
+    if getattr(client, "search_index", None):
+        client.search_index.remove("event", event_id)
+    _invalidate_caches(client)
+    return {"status": "queued" if queue else "success"}
 
 def get_user_schedules(client, schedules, start, end, availability_view_interval=30):
     """
@@ -104,3 +255,131 @@ def get_user_schedules(client, schedules, start, end, availability_view_interval
     
     response = client.request("POST", "/me/calendar/getSchedule", json=payload)
     return response.json()
+
+def export_ics(client, path, start_date, end_date, progress=None):
+    """
+    将时间范围内的事件 (循环事件按实例) 流式导出为 .ics 文件：逐页读取、逐个转换、逐个写入，内存占用与事件数无关。
+    :param progress: 可选回调 progress(已导出数)。
+    """
+    endpoint = (
+        f"/me/calendar/calendarView?startDateTime={start_date}&endDateTime={end_date}"
+        f"&$select={_ICS_EXPORT_FIELDS}&$top={autotune.page_size(client, 'calendarView', EVENT_PAGE_SIZE)}"
+    )
+
+    def events():
+        link, count = endpoint, 0
+        while link:
+            meta = {}
+            for event in client.iter_values("GET", link, meta=meta):
+                yield event
+                count += 1
+                if progress and count % PROGRESS_EVERY == 0:
+                    progress(count)
+            link = meta.get("@odata.nextLink")
+
+    temp_path = f"{path}.tmp"
+    with open(temp_path, "w", encoding="utf-8", newline="") as f:
+        count = ics.write_calendar(f, events())
+    os.replace(temp_path, path)
+    return {"status": "success", "path": os.path.abspath(path), "exported": count}
+
+def _delete_excluded(client, event_id, exdates):
+    """删除循环事件中被 EXDATE 排除的实例，返回未能删除的日期。"""
+    # 查询窗口前后各放宽一天，避免时区差异漏掉实例
+    window_start = min(moment for moment, _ in exdates) - timedelta(days=1)
+    window_end = max(moment for moment, _ in exdates) + timedelta(days=2)
+    instances = _collect(client, (
+        f"/me/events/{event_id}/instances?startDateTime={window_start.isoformat()}"
+        f"&endDateTime={window_end.isoformat()}&$select=id,start"
+    ))
+    starts = [(parse_local(instance["start"]["dateTime"][:19]), instance["id"]) for instance in instances]
+    requests, missing = [], []
+    for moment, all_day in exdates:
+        instance_id = next((i for start, i in starts
+                            if (start.date() == moment.date() if all_day else start == moment)), None)
+        if instance_id is None:
+            missing.append(moment.isoformat())
+        else:
+            requests.append({"info": {"date": moment.isoformat()},
+                             "request": {"method": "DELETE", "url": f"/me/events/{instance_id}"}})
+    _, failures = send_batch(client, requests, max_retries=IMPORT_MAX_RETRIES) if requests else (None, [])
+    return missing + [failure["date"] for failure in failures]
+
+def _create_batch(client, items):
+    """
+    通过一次 $batch 创建一批事件；限流与 5xx 的事件按 Retry-After 退避后重试。
+    带有 EXDATE 的循环事件创建后再删除被排除的实例。返回 (成功数, 失败列表)。
+    """
+    succeeded, failures = send_batch(
+        client,
+        [{"info": item["info"], "exdates": item.get("exdates"),
+          "request": {"method": "POST", "url": "/me/events", "body": item["payload"]}}
+         for item in items],
+        max_retries=IMPORT_MAX_RETRIES,
+    )
+    for item, response in succeeded:
+        if not item["exdates"]:
+            continue
+        try:
+            remaining = _delete_excluded(client, response["body"]["id"], item["exdates"])
+        except Exception as e:
+            remaining = [str(e)]
+        if remaining:
+            failures.append({**item["info"], "id": response["body"]["id"],
+                             "error": f"事件已创建，但未能删除 EXDATE 排除的实例: {', '.join(remaining)}"})
+    return len(succeeded), failures
+
+def import_ics(client, path, dry_run=False, progress=None):
+    """
+    从 .ics 文件流式导入事件：逐个解析、校验并转换，按批通过 $batch 并发创建。
+    同时在途的批次有上限，内存占用与文件大小无关；内容无效或创建失败的事件逐个记录在结果中。
+    :param dry_run: 为 True 时只解析与校验，不创建事件。
+    :param progress: 可选回调 progress(已处理数)。
+    """
+    stats = {"total": 0, "created": 0, "failed": 0}
+    failures = []
+
+    def record(failed):
+        stats["failed"] += len(failed)
+        failures.extend(failed[:MAX_REPORTED_FAILURES - len(failures)])
+
+    def validated(f):
+        for index, props in ics.iter_vevents(f):
+            stats["total"] += 1
+            if progress and stats["total"] % PROGRESS_EVERY == 0:
+                progress(stats["total"])
+            info = {"index": index, "uid": ics.first(props, "UID")[1],
+                    "summary": ics.unescape_text(ics.first(props, "SUMMARY", "")[1])}
+            try:
+                yield {"info": info, "payload": ics.vevent_to_graph(props), "exdates": ics.excluded_dates(props)}
+            except ValueError as e:
+                record([{**info, "error": str(e)}])
+
+    with open(path, "r", encoding="utf-8-sig") as f:
+        items = validated(f)
+        if dry_run:
+            valid = sum(1 for _ in items)
+            return {"status": "success", "dry_run": True, **stats, "valid": valid, "failures": failures}
+
+        with ThreadPoolExecutor(max_workers=IMPORT_PARALLEL_BATCHES) as pool:
+            pending = set()
+
+            def collect(done):
+                for future in done:
+                    created, failed = future.result()
+                    stats["created"] += created
+                    record(failed)
+
+            while True:
+                chunk = list(itertools.islice(items, IMPORT_BATCH_SIZE))
+                if not chunk:
+                    break
+                if len(pending) >= IMPORT_PARALLEL_BATCHES:
+                    done, pending = wait(pending, return_when=FIRST_COMPLETED)
+                    collect(done)
+                pending.add(pool.submit(_create_batch, client, chunk))
+            collect(pending)
+
+    if stats["created"]:
+        _invalidate_caches(client)
+    return {"status": "success" if not stats["failed"] else "partial", **stats, "failures": failures}
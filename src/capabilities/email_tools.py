@@ -1,47 +1,362 @@
+import base64
+import os
+import threading
+import time
+import weakref
+from collections import OrderedDict
+from concurrent.futures import ThreadPoolExecutor
+from datetime import datetime, timezone
+
+import httpx
+
+from ..models import Message
+from ..utils.html_text import html_to_text
+from .bulk_actions import send_batch
+from .mail_folders import resolve_folder
+
+# 小于该大小的附件直接以内联 base64 方式上传，否则使用上传会话
+INLINE_ATTACHMENT_LIMIT = 3 * 1024 * 1024
+# 上传会话的分块大小必须是 320 KiB 的整数倍
+UPLOAD_CHUNK_SIZE = 320 * 1024 * 10
+DOWNLOAD_CHUNK_SIZE = 1024 * 1024
+MAX_PARALLEL_UPLOADS = 3
+MAX_UPLOAD_RETRIES = 5
+# get_email 默认单次返回的正文字符数
+EMAIL_BODY_WINDOW = 8000
+# 每个账号缓存的邮件正文总字符数上限
+EMAIL_BODY_CACHE_CHARS = 4 * 1024 * 1024
+_EMAIL_FIELDS = "subject,from,toRecipients,ccRecipients,receivedDateTime,hasAttachments,changeKey,body"
+
+# 进行中的上传会话：(邮件 ID, 文件路径, 大小, 修改时间) -> {"url", "expires"}，用于失败后续传
+_upload_sessions = {}
+_upload_sessions_lock = threading.Lock()
+
+def list_emails_page(client, limit=10, next_link=None):
+    """
+    获取最近邮件的一页。
+    :param next_link: 上一页返回的 @odata.nextLink；提供时忽略 limit。
+    :return: (邮件列表, 下一页的 nextLink 或 None)
+    """
+    meta = {}
+    endpoint = next_link or f"/me/messages?$top={limit}"
+    messages = [Message.from_graph(msg) for msg in client.iter_values("GET", endpoint, meta=meta)]
+    _index_messages(client, messages)
+    return [msg.to_dict() for msg in messages], meta.get("@odata.nextLink")
+
+def _index_messages(client, messages):
+    index = getattr(client, "search_index", None)
+    if index:
+        for msg in messages:
+            text = " ".join(filter(None, [msg.sender, msg.body_preview]))
+            index.add("email", msg.id, msg.subject, text, {"sender": msg.sender, "received": msg.received})
+
+class _BodyCache:
+    """按邮件 ID 缓存转换后的纯文本正文及其 changeKey；按字符总数做 LRU 淘汰。"""
+
+    def __init__(self, limit=EMAIL_BODY_CACHE_CHARS):
+        self.limit = limit
+        self._lock = threading.Lock()
+        self._entries = OrderedDict()
+        self._chars = 0
+
+    def get(self, message_id):
+        with self._lock:
+            entry = self._entries.get(message_id)
+            if entry is not None:
+                self._entries.move_to_end(message_id)
+            return entry
+
+    def put(self, message_id, entry):
+        with self._lock:
+            old = self._entries.pop(message_id, None)
+            if old is not None:
+                self._chars -= len(old["text"])
+            self._entries[message_id] = entry
+            self._chars += len(entry["text"])
+            while self._chars > self.limit and len(self._entries) > 1:
+                _, evicted = self._entries.popitem(last=False)
+                self._chars -= len(evicted["text"])
+
+_body_caches = weakref.WeakKeyDictionary()
+_body_caches_lock = threading.Lock()
+
+def _body_cache(client):
+    with _body_caches_lock:
+        cache = _body_caches.get(client)
+        if cache is None:
+            cache = _body_caches[client] = _BodyCache()
+        return cache
+
+def _addresses(recipients):
+    return [(r.get("emailAddress") or {}).get("address") for r in recipients or []]
+
+def _load_message(client, message_id):
+    """获取邮件正文 (请求 Graph 直接返回纯文本；仍为 HTML 时在本地转换)。"""
+    msg = client.request(
+        "GET", f"/me/messages/{message_id}?$select={_EMAIL_FIELDS}",
+        headers={"Prefer": 'outlook.body-content-type="text"'}
+    ).json()
+    body = msg.get("body") or {}
+    text = body.get("content") or ""
+    if (body.get("contentType") or "").lower() == "html":
+        text = html_to_text(text)
+    return {
+        "change_key": msg.get("changeKey"),
+        "text": text,
+        "header": {
+            "id": message_id,
+            "subject": msg.get("subject"),
+            "from": ((msg.get("from") or {}).get("emailAddress") or {}).get("address"),
+            "to": _addresses(msg.get("toRecipients")),
+            "cc": _addresses(msg.get("ccRecipients")),
+            "received": msg.get("receivedDateTime"),
+            "has_attachments": msg.get("hasAttachments"),
+        },
+    }
+
+def get_email(client, message_id, offset=0, max_chars=EMAIL_BODY_WINDOW):
+    """
+    读取邮件的完整正文 (纯文本)。正文按邮件 ID 缓存，再次读取时只查询 changeKey，
+    邮件未变化则直接使用缓存，不重新下载正文。
+    :param offset: 返回正文的起始字符位置，用于分段读取很长的邮件。
+    :param max_chars: 单次返回的最大字符数。
+    :return: 邮件头信息与正文片段；还有剩余内容时包含 next_offset。
+    """
+    cache = _body_cache(client)
+    entry = cache.get(message_id)
+    if entry is not None:
+        change_key = client.request("GET", f"/me/messages/{message_id}?$select=changeKey").json().get("changeKey")
+        if change_key != entry["change_key"]:
+            entry = None
+    if entry is None:
+        entry = _load_message(client, message_id)
+        cache.put(message_id, entry)
+
+    text = entry["text"]
+    offset = max(offset, 0)
+    end = min(offset + max_chars, len(text))
+    result = {**entry["header"], "body_length": len(text), "offset": offset, "body": text[offset:end]}
+    if end < len(text):
+        result["next_offset"] = end
+    return result
+
 def list_emails(client, limit=10):
     """列出最近的邮件。"""
-    response = client.request("GET", f"/me/messages?$top={limit}")
-    data = response.json()
-    
+    return list_emails_page(client, limit)[0]
+
+def _message_payload(to_recipients, subject, body):
+    if isinstance(to_recipients, str):
+        to_recipients = [to_recipients]
+    return {
+        "subject": subject,
+        "body": {
+            "contentType": "Text",
+            "content": body
+        },
+        "toRecipients": [
+            {"emailAddress": {"address": addr}} for addr in to_recipients
+        ]
+    }
+
+def send_email(client, to_recipients, subject, body, attachments=None):
+    """
+    发送电子邮件。
+    :param attachments: 本地文件路径列表。带附件时先创建草稿、上传附件，再发送草稿。
+    """
+    if attachments:
+        draft = create_draft(client, to_recipients, subject, body, attachments)
+        client.request("POST", f"/me/messages/{draft['id']}/send")
+        return {"status": "success", "attachments": draft["attachments"]}
+        
+    payload = {"message": _message_payload(to_recipients, subject, body)}
+    client.request("POST", "/me/sendMail", json=payload)
+    return {"status": "success"}
+
+def create_draft(client, to_recipients, subject, body, attachments=None):
+    """创建邮件草稿并上传附件 (多个附件并行上传)。"""
+    response = client.request("POST", "/me/messages", json=_message_payload(to_recipients, subject, body))
+    draft_id = response.json().get("id")
+
+    uploaded = []
+    if attachments:
+        with ThreadPoolExecutor(max_workers=min(len(attachments), MAX_PARALLEL_UPLOADS)) as pool:
+            futures = [pool.submit(add_attachment, client, draft_id, path) for path in attachments]
+            try:
+                uploaded = [future.result() for future in futures]
+            except Exception as e:
+                raise RuntimeError(f"附件上传失败 (草稿 ID: {draft_id}，可调用 add_email_attachment 续传): {e}")
+    return {"status": "success", "id": draft_id, "attachments": uploaded}
+
+def list_attachments(client, message_id):
+    """列出邮件的附件 (不含内容)。"""
+    endpoint = f"/me/messages/{message_id}/attachments?$select=id,name,contentType,size,isInline"
     return [
         {
-            "id": msg.get("id"),
-            "subject": msg.get("subject"),
-            "sender": msg.get("from", {}).get("emailAddress", {}).get("address"),
-            "received": msg.get("receivedDateTime"),
-            "body_preview": msg.get("bodyPreview")
+            "id": att.get("id"),
+            "name": att.get("name"),
+            "content_type": att.get("contentType"),
+            "size": att.get("size"),
+            "is_inline": att.get("isInline")
         }
-        for msg in data.get("value", [])
+        for att in client.iter_values("GET", endpoint)
     ]
 
-def send_email(client, to_recipients, subject, body):
-    """发送电子邮件。"""
-    if isinstance(to_recipients, str):
-        to_recipients = [to_recipients]
-        
-    payload = {
-        "message": {
-            "subject": subject,
-            "body": {
-                "contentType": "Text",
-                "content": body
-            },
-            "toRecipients": [
-                {"emailAddress": {"address": addr}} for addr in to_recipients
-            ]
+def download_attachment(client, message_id, attachment_id, save_path):
+    """
+    将附件内容分块流式写入磁盘，不在内存中保留整个文件。
+    :param save_path: 目标文件路径；若为已存在的目录，则使用附件原文件名保存到该目录。
+    """
+    if os.path.isdir(save_path):
+        meta = client.request("GET", f"/me/messages/{message_id}/attachments/{attachment_id}?$select=name").json()
+        save_path = os.path.join(save_path, os.path.basename(meta.get("name") or attachment_id))
+
+    # 先写入临时文件，完成后再重命名，避免中断时留下不完整的文件
+    partial_path = save_path + ".part"
+    size = 0
+    try:
+        with open(partial_path, "wb") as f:
+            for chunk in client.iter_bytes("GET", f"/me/messages/{message_id}/attachments/{attachment_id}/$value",
+                                           chunk_size=DOWNLOAD_CHUNK_SIZE):
+                f.write(chunk)
+                size += len(chunk)
+        os.replace(partial_path, save_path)
+    except BaseException:
+        if os.path.exists(partial_path):
+            os.remove(partial_path)
+        raise
+    return {"status": "success", "path": save_path, "size": size}
+
+def add_attachment(client, message_id, file_path):
+    """
+    为草稿邮件添加附件。超过 3 MB 的文件通过上传会话分块上传，
+    同一文件的中断上传会从服务器记录的断点继续。
+    """
+    size = os.path.getsize(file_path)
+    name = os.path.basename(file_path)
+
+    if size <= INLINE_ATTACHMENT_LIMIT:
+        with open(file_path, "rb") as f:
+            content = base64.b64encode(f.read()).decode("ascii")
+        payload = {
+            "@odata.type": "#microsoft.graph.fileAttachment",
+            "name": name,
+            "contentBytes": content
         }
+        client.request("POST", f"/me/messages/{message_id}/attachments", json=payload)
+        return {"name": name, "size": size}
+
+    session_key = (message_id, os.path.abspath(file_path), size, os.path.getmtime(file_path))
+    with _upload_sessions_lock:
+        session = _upload_sessions.get(session_key)
+    offset = 0
+    if session and session["expires"] is not None and session["expires"] <= time.time():
+        session = None
+    if session:
+        try:
+            offset = _next_expected_offset(client, session["url"])
+        except RuntimeError as e:
+            if not _session_gone(e):
+                raise
+            session = None
+    if session is None:
+        session = _create_upload_session(client, message_id, session_key, name, size)
+        offset = 0
+
+    try:
+        _upload_chunks(client, session["url"], file_path, size, offset)
+    except RuntimeError as e:
+        if not _session_gone(e):
+            raise
+        # 会话在上传过程中过期：重新创建会话并从头上传
+        session = _create_upload_session(client, message_id, session_key, name, size)
+        _upload_chunks(client, session["url"], file_path, size, 0)
+    with _upload_sessions_lock:
+        _upload_sessions.pop(session_key, None)
+    return {"name": name, "size": size}
+
+def _create_upload_session(client, message_id, session_key, name, size):
+    payload = {"AttachmentItem": {"attachmentType": "file", "name": name, "size": size}}
+    body = client.request("POST", f"/me/messages/{message_id}/attachments/createUploadSession", json=payload).json()
+    expires = body.get("expirationDateTime")
+    session = {
+        "url": body["uploadUrl"],
+        "expires": datetime.strptime(expires[:19], "%Y-%m-%dT%H:%M:%S").replace(tzinfo=timezone.utc).timestamp()
+        if expires else None,
     }
-    
-    client.request("POST", "/me/sendMail", json=payload)
-    return {"status": "success"}
+    with _upload_sessions_lock:
+        _upload_sessions[session_key] = session
+    return session
+
+def _session_gone(error):
+    """上传会话已过期或不存在 (404/410)。"""
+    return getattr(error, "status_code", None) in (404, 410)
+
+def _next_expected_offset(client, upload_url):
+    """查询上传会话中服务器期望的下一个字节位置；上传已完成时返回 None。"""
+    ranges = client.request_upload_url("GET", upload_url).json().get("nextExpectedRanges") or []
+    return int(ranges[0].split("-")[0]) if ranges else None
+
+def _upload_chunks(client, upload_url, file_path, size, offset):
+    """分块上传；网络错误后查询断点并重试 (查询本身也在重试范围内)，会话过期 (404/410) 时抛出。"""
+    failures, resync = 0, False
+    with open(file_path, "rb") as f:
+        while True:
+            try:
+                if resync:
+                    # 以服务器实际收到的范围为准，从断点续传
+                    offset = _next_expected_offset(client, upload_url)
+                    resync = False
+                if offset is None or offset >= size:
+                    return
+                f.seek(offset)
+                chunk = f.read(UPLOAD_CHUNK_SIZE)
+                end = offset + len(chunk) - 1
+                headers = {"Content-Length": str(len(chunk)), "Content-Range": f"bytes {offset}-{end}/{size}"}
+                response = client.request_upload_url("PUT", upload_url, content=chunk, headers=headers)
+            except (httpx.TransportError, RuntimeError) as e:
+                if _session_gone(e):
+                    raise
+                failures += 1
+                if failures > MAX_UPLOAD_RETRIES:
+                    raise
+                time.sleep(min(2 ** failures, 30))
+                resync = True
+                continue
+            failures = 0
+            if response.status_code == 201:
+                return
+            ranges = response.json().get("nextExpectedRanges") or []
+            offset = int(ranges[0].split("-")[0]) if ranges else end + 1
 
 def delete_email(client, message_id):
     """删除邮件。"""
     client.request("DELETE", f"/me/messages/{message_id}")
+    if getattr(client, "search_index", None):
+        client.search_index.remove("email", message_id)
     return {"status": "success"}
 
-def move_email(client, message_id, folder_id):
-    """将邮件移动到指定文件夹。"""
-    payload = {"destinationId": folder_id}
-    client.request("POST", f"/me/messages/{message_id}/move", json=payload)
-    return {"status": "success"}
\ No newline at end of file
+def move_emails(client, message_ids, folder):
+    """
+    将多封邮件移动到文件夹 (ID、路径、名称或知名文件夹名称)，通过 $batch 合并请求。
+    :return: 成功移动的邮件 (原 ID -> 新 ID) 与失败明细。
+    """
+    folder_id = resolve_folder(client, folder)
+    # 同一邮箱的并发移动常被限流：限流与 5xx 的子请求按 Retry-After 退避后重试
+    succeeded, failed = send_batch(client, [
+        {"info": {"id": message_id},
+         "request": {"method": "POST", "url": f"/me/messages/{message_id}/move", "body": {"destinationId": folder_id}}}
+        for message_id in dict.fromkeys(message_ids)
+    ])
+    moved, index = {}, getattr(client, "search_index", None)
+    for item, response in succeeded:
+        message_id, body = item["info"]["id"], response.get("body") or {}
+        moved[message_id] = body.get("id")
+        if index:
+            # 移动后邮件获得新的 ID
+            index.remove("email", message_id)
+            _index_messages(client, [Message.from_graph(body)])
+    return {"status": "success" if not failed else "partial", "folder_id": folder_id, "moved": moved, "failed": failed}
+
+def archive_emails(client, message_ids):
+    """将多封邮件移动到存档文件夹。"""
+    return move_emails(client, message_ids, "archive")
\ No newline at end of file
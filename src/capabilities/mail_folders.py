@@ -0,0 +1,129 @@
+import threading
+import time
+import weakref
+
+# 文件夹树的有效期 (秒)；过期后下次解析前通过 delta 增量刷新
+FOLDER_TREE_TTL = 300
+_DELTA_ENDPOINT = "/me/mailFolders/delta?$select=displayName,parentFolderId"
+# Graph 接受的知名文件夹名称，可直接作为文件夹 ID 使用
+WELL_KNOWN_FOLDERS = {
+    "inbox": "inbox", "收件箱": "inbox",
+    "archive": "archive", "存档": "archive", "归档": "archive",
+    "deleteditems": "deleteditems", "已删除邮件": "deleteditems",
+    "sentitems": "sentitems", "已发送邮件": "sentitems",
+    "drafts": "drafts", "草稿": "drafts",
+    "junkemail": "junkemail", "垃圾邮件": "junkemail",
+    "outbox": "outbox", "发件箱": "outbox",
+}
+
+_trees = weakref.WeakKeyDictionary()
+_trees_lock = threading.Lock()
+
+
+class FolderTree:
+    """
+    邮件文件夹树缓存。首次使用时通过 mailFolders delta 一次性获取所有层级的文件夹，
+    之后用 deltaLink 增量刷新；按路径或名称解析文件夹 ID 只需一次字典查找。
+    """
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._folders = {}
+        self._delta_link = None
+        self._loaded_at = None
+        self._by_path = {}
+        self._by_name = {}
+        self._paths = {}
+
+    def _sync(self, client):
+        """拉取 delta 变更 (首次为全部文件夹) 并重建索引。deltaLink 失效时重新全量获取。"""
+        endpoint = self._delta_link or _DELTA_ENDPOINT
+        try:
+            changes, link = self._read_delta(client, endpoint)
+        except RuntimeError:
+            if not self._delta_link:
+                raise
+            # 同步状态过期 (如 410 syncStateNotFound)：重新全量获取
+            self._folders, self._delta_link = {}, None
+            changes, link = self._read_delta(client, _DELTA_ENDPOINT)
+        for folder in changes:
+            if "@removed" in folder:
+                self._folders.pop(folder["id"], None)
+            else:
+                self._folders[folder["id"]] = {**self._folders.get(folder["id"], {}), **folder}
+        self._delta_link = link
+        self._loaded_at = time.monotonic()
+        self._reindex()
+
+    def _read_delta(self, client, endpoint):
+        changes = []
+        while True:
+            meta = {}
+            changes.extend(client.iter_values("GET", endpoint, meta=meta))
+            if meta.get("@odata.nextLink"):
+                endpoint = meta["@odata.nextLink"]
+                continue
+            return changes, meta.get("@odata.deltaLink")
+
+    def _reindex(self):
+        paths = {}
+
+        def path(folder_id, depth=0):
+            if folder_id not in paths:
+                folder = self._folders[folder_id]
+                parent = folder.get("parentFolderId")
+                # 顶层文件夹的父级是不在列表中的邮箱根文件夹
+                prefix = path(parent, depth + 1) + "/" if parent in self._folders and depth < 32 else ""
+                paths[folder_id] = prefix + (folder.get("displayName") or "")
+            return paths[folder_id]
+
+        self._by_path, self._by_name = {}, {}
+        for folder_id, folder in self._folders.items():
+            self._by_path[path(folder_id).lower()] = folder_id
+            self._by_name.setdefault((folder.get("displayName") or "").lower(), []).append(folder_id)
+        self._paths = paths
+
+    def _lookup(self, key):
+        if key in self._folders:
+            return key
+        if key.lower() in self._by_path:
+            return self._by_path[key.lower()]
+        matches = self._by_name.get(key.lower(), [])
+        if len(matches) > 1:
+            choices = ", ".join(sorted(self._paths[m] for m in matches))
+            raise ValueError(f"邮件文件夹名称 '{key}' 不唯一，请使用完整路径: {choices}")
+        return matches[0] if matches else None
+
+    def resolve(self, client, name):
+        """
+        将文件夹 ID、路径 (如 '收件箱/项目/甲')、名称或知名文件夹名称解析为可用作 destinationId 的 ID。
+        未命中时先增量刷新一次再查找。
+        """
+        key = name.strip().strip("/")
+        if key.lower() in WELL_KNOWN_FOLDERS:
+            return WELL_KNOWN_FOLDERS[key.lower()]
+        with self._lock:
+            if self._loaded_at is None or time.monotonic() - self._loaded_at >= FOLDER_TREE_TTL:
+                self._sync(client)
+            folder_id = self._lookup(key)
+            if folder_id is None:
+                self._sync(client)
+                folder_id = self._lookup(key)
+            if folder_id is None:
+                available = sorted(self._paths.values())
+                listed = ", ".join(available[:30]) + (" ..." if len(available) > 30 else "")
+                raise ValueError(f"未找到邮件文件夹: {name}。可用的文件夹: {listed}")
+            return folder_id
+
+
+def get_folder_tree(client):
+    """返回客户端 (账号) 对应的文件夹树缓存。"""
+    with _trees_lock:
+        tree = _trees.get(client)
+        if tree is None:
+            tree = _trees[client] = FolderTree()
+        return tree
+
+
+def resolve_folder(client, name):
+    return get_folder_tree(client).resolve(client, name)
@@ -1,31 +1,68 @@
+import weakref
+
+from ..models import Task
+from ..utils import autotune
+
+# 待办任务每页返回的数量 (启用自动调节时作为初始值)
+TASK_PAGE_SIZE = 50
+
+# 默认待办列表的 ID 不会变化，按客户端缓存，避免每次操作前都查询列表
+_default_list_ids = weakref.WeakKeyDictionary()
+
 def _get_default_todo_list_id(client):
+    list_id = _default_list_ids.get(client)
+    if list_id:
+        return list_id
     response = client.request("GET", "/me/todo/lists")
-    lists = response.json().get("value", [])
-    for lst in lists:
-        if lst.get("wellKnownName") == "defaultList":
-            return lst.get("id")
-    return lists[0].get("id") if lists else None
+    return _remember_default_list(client, response.json().get("value", []))
 
-def list_tasks(client):
-    """列出默认待办列表中的任务。"""
-    list_id = _get_default_todo_list_id(client)
-    if not list_id:
-        return []
-    
-    response = client.request("GET", f"/me/todo/lists/{list_id}/tasks")
-    data = response.json()
+def _remember_default_list(client, lists):
+    """从 /me/todo/lists 的结果中选出默认列表并缓存其 ID。"""
+    list_id = next((lst.get("id") for lst in lists if lst.get("wellKnownName") == "defaultList"), None)
+    if list_id is None and lists:
+        list_id = lists[0].get("id")
+    if list_id:
+        _default_list_ids[client] = list_id
+    return list_id
+
+def _invalidate_prefetch(client):
+    if getattr(client, "prefetcher", None):
+        client.prefetcher.invalidate("tasks")
+
+def list_tasks_page(client, next_link=None, models=False):
+    """
+    获取默认待办列表中任务的一页。
+    :param next_link: 上一页返回的 @odata.nextLink。
+    :param models: 为 True 时返回 Task 对象 (供缓存使用)，否则返回 dict。
+    :return: (任务列表, 下一页的 nextLink 或 None)
+    """
+    queue = getattr(client, "write_queue", None)
+    list_id = None
+    if not next_link or queue:
+        list_id = _get_default_todo_list_id(client)
+        if not list_id:
+            return [], None
+    endpoint = next_link or f"/me/todo/lists/{list_id}/tasks?$top={autotune.page_size(client, 'tasks', TASK_PAGE_SIZE)}"
     
-    return [
-        {
-            "id": task.get("id"),
-            "title": task.get("title"),
-            "status": task.get("status"),
-            "due": task.get("dueDateTime", {}).get("dateTime"),
-            "importance": task.get("importance"),
-            "is_completed": task.get("status") == "completed"
-        }
-        for task in data.get("value", [])
-    ]
+    meta = {}
+    items = client.iter_values("GET", endpoint, meta=meta)
+    if queue:
+        # 叠加尚未提交的写操作；新建的任务只追加在第一页
+        items = queue.observe(items, f"/me/todo/lists/{list_id}/tasks",
+                              include_created=None if next_link else (lambda body: True))
+    tasks = [Task.from_graph(task) for task in items]
+    _index_tasks(client, tasks)
+    return (tasks if models else [task.to_dict() for task in tasks]), meta.get("@odata.nextLink")
+
+def _index_tasks(client, tasks):
+    index = getattr(client, "search_index", None)
+    if index:
+        for task in tasks:
+            index.add("task", task.id, task.title, meta={"status": task.status, "due": task.due})
+
+def list_tasks(client):
+    """列出默认待办列表中的任务 (第一页)。"""
+    return list_tasks_page(client)[0]
 
 def create_task(client, title, body=None, body_type="text", categories=None, due_date=None, start_date=None, reminder_date=None, importance=None, status=None, completed_date=None):
     """
@@ -67,8 +104,14 @@ def create_task(client, title, body=None, body_type="text", categories=None, due
     if completed_date:
         payload["completedDateTime"] = {"dateTime": completed_date, "timeZone": tz}
         
+    if getattr(client, "write_queue", None):
+        local_id = client.write_queue.create(f"/me/todo/lists/{list_id}/tasks", payload)
+        _invalidate_prefetch(client)
+        return {"status": "queued", "id": local_id}
+
     response = client.request("POST", f"/me/todo/lists/{list_id}/tasks", json=payload)
     data = response.json()
+    _invalidate_prefetch(client)
     return {"status": "success", "id": data.get("id")}
 
 def update_task(client, task_id, **kwargs):
@@ -108,11 +151,29 @@ def update_task(client, task_id, **kwargs):
     if not payload:
         return {"status": "error", "message": "未提供需要更新的字段"}
 
+    if getattr(client, "write_queue", None):
+        # 排队的修改可能提交失败，索引在提交后重新读取时更新
+        client.write_queue.patch(f"/me/todo/lists/{list_id}/tasks/{task_id}", payload)
+        _invalidate_prefetch(client)
+        return {"status": "queued"}
+
     client.request("PATCH", f"/me/todo/lists/{list_id}/tasks/{task_id}", json=payload)
+    if getattr(client, "search_index", None):
+        client.search_index.update("task", task_id, title=payload.get("title"),
+                                   meta={"status": payload["status"]} if "status" in payload else None)
+    _invalidate_prefetch(client)
     return {"status": "success"}
 
 def delete_task(client, task_id):
     """删除任务。"""
     list_id = _get_default_todo_list_id(client)
-    client.request("DELETE", f"/me/todo/lists/{list_id}/tasks/{task_id}")
-    return {"status": "success"}
\ No newline at end of file
+    queue = getattr(client, "write_queue", None)
+    if queue:
+        queue.delete(f"/me/todo/lists/{list_id}/tasks/{task_id}")
+    else:
+        client.request("DELETE", f"/me/todo/lists/{list_id}/tasks/{task_id}")
+    # 删除成功 (或已排队) 后再移出索引
+    if getattr(client, "search_index", None):
+        client.search_index.remove("task", task_id)
+    _invalidate_prefetch(client)
+    return {"status": "queued" if queue else "success"}
\ No newline at end of file
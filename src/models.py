@@ -0,0 +1,102 @@
+import sys
+from datetime import datetime
+
+
+def _intern(value):
+    return sys.intern(value) if isinstance(value, str) else value
+
+
+def _seconds(value):
+    """截取到秒的 ISO 本地时间字符串；Graph 返回的格式固定，截取后按字符串比较即等价于按时间比较。"""
+    if len(value) >= 19:
+        return value[:19]
+    # 写后队列叠加的本地修改可能省略秒
+    return datetime.fromisoformat(value).isoformat(timespec="seconds")
+
+
+class Entity:
+    """
+    缓存中使用的紧凑实体：字段存放在 __slots__ 中 (没有逐实例的 __dict__)，
+    取值高度重复的字段 (状态、地点、发件人等) 驻留为同一个字符串对象。
+    只在返回给 MCP 客户端时通过 to_dict() 转换为 dict。
+    """
+
+    __slots__ = ()
+    # 需要驻留的字段
+    INTERNED = ()
+
+    def __init__(self, *values):
+        for name, value in zip(self.__slots__, values):
+            setattr(self, name, _intern(value) if name in self.INTERNED else value)
+
+    def to_dict(self):
+        return {name: getattr(self, name) for name in self.__slots__}
+
+    def __eq__(self, other):
+        return type(self) is type(other) and all(
+            getattr(self, name) == getattr(other, name) for name in self.__slots__
+        )
+
+    __hash__ = None
+
+    def __repr__(self):
+        fields = ", ".join(f"{name}={getattr(self, name)!r}" for name in self.__slots__)
+        return f"{type(self).__name__}({fields})"
+
+
+class Event(Entity):
+    __slots__ = ("id", "subject", "start", "end", "location", "body")
+    # 循环事件的各实例共享主题与地点
+    INTERNED = ("subject", "location")
+
+    @classmethod
+    def from_graph(cls, event):
+        return cls(
+            event.get("id"),
+            event.get("subject"),
+            (event.get("start") or {}).get("dateTime"),
+            (event.get("end") or {}).get("dateTime"),
+            (event.get("location") or {}).get("displayName"),
+            event.get("bodyPreview"),
+        )
+
+    def overlaps(self, start, end):
+        """是否与 [start, end) 相交；start/end 为精确到秒的 ISO 本地时间字符串，无需逐个解析为 datetime。"""
+        return _seconds(self.start) < end and _seconds(self.end) > start
+
+
+class Task(Entity):
+    __slots__ = ("id", "title", "status", "due", "importance")
+    INTERNED = ("status", "importance")
+
+    @classmethod
+    def from_graph(cls, task):
+        return cls(
+            task.get("id"),
+            task.get("title"),
+            task.get("status"),
+            (task.get("dueDateTime") or {}).get("dateTime"),
+            task.get("importance"),
+        )
+
+    @property
+    def is_completed(self):
+        return self.status == "completed"
+
+    def to_dict(self):
+        return {**super().to_dict(), "is_completed": self.is_completed}
+
+
+class Message(Entity):
+    __slots__ = ("id", "subject", "sender", "received", "body_preview")
+    INTERNED = ("sender",)
+
+    @classmethod
+    def from_graph(cls, msg):
+        return cls(
+            msg.get("id"),
+            msg.get("subject"),
+            ((msg.get("from") or {}).get("emailAddress") or {}).get("address"),
+            msg.get("receivedDateTime"),
+            msg.get("bodyPreview"),
+        )
@@ -0,0 +1,212 @@
+import logging
+import math
+import os
+import threading
+import time
+from datetime import datetime, timedelta
+
+from .capabilities import calendar_tools, tasks_tools
+from .utils.recurrence import parse_local
+from .utils.scheduler import priority
+
+logger = logging.getLogger(__name__)
+
+# 规则名 -> 默认向后预取的天数 (tasks 不使用天数)
+DEFAULT_RULES = {"calendar": 7, "schedule": 7, "tasks": 0}
+# 规则所属的功能模块
+RULE_MODULES = {"calendar": "ENABLE_CALENDAR", "schedule": "ENABLE_CALENDAR", "tasks": "ENABLE_TASKS"}
+# 预取结果在内存中的有效期 (秒)；有效期内重复触发不会再次预取
+PREFETCH_TTL = 120
+# 预取日程时最多跟随的页数，超过则放弃 (无法保证结果完整)
+MAX_PREFETCH_PAGES = 10
+SCHEDULE_INTERVAL = 30
+
+
+def parse_rules(value):
+    """解析形如 "calendar=7,schedule=1,tasks" 的规则配置 (数字为从今天起向后预取的天数)。"""
+    if value is None:
+        return dict(DEFAULT_RULES)
+    rules = {}
+    for part in filter(None, (p.strip() for p in value.split(","))):
+        name, _, days = part.partition("=")
+        name = name.strip()
+        if name not in DEFAULT_RULES or (days and not days.strip().isdigit()):
+            raise ValueError(f"M365_PREFETCH_RULES 配置无效: {part}")
+        rules[name] = int(days) if days else DEFAULT_RULES[name]
+    return rules
+
+
+def _naive(value):
+    """解析不带时区的本地时间；带时区的输入无法与本地缓存对齐，返回 None。"""
+    try:
+        moment = datetime.fromisoformat(value)
+    except (TypeError, ValueError):
+        return None
+    return moment if moment.tzinfo is None else None
+
+
+class Prefetcher:
+    """
+    预测性预取：模型按提示词先调用 get_current_time，随后几乎总是查询今天/本周的日程、忙闲与待办。
+    在 get_current_time 或会话开始时，于后台 (prefetch 通道) 预取这些数据，后续落在预取范围内的工具调用直接由内存返回。
+    """
+
+    def __init__(self, client, rules=None):
+        self.client = client
+        self.rules = {
+            name: days for name, days in (rules if rules is not None else DEFAULT_RULES).items()
+            if os.getenv(RULE_MODULES[name], "true").lower() in ("true", "1", "yes")
+        }
+        self._lock = threading.Lock()
+        self._running = False
+        self._entries = {}
+        # 每次失效时递增，防止预取进行中发生的写操作被旧结果覆盖
+        self._generations = dict.fromkeys(self.rules, 0)
+        self._stats = {name: {"prefetched": 0, "hits": 0, "misses": 0} for name in self.rules}
+
+    # --- 预取 ---
+
+    def _window(self, days):
+        """从本周一 0 点起，至少覆盖到下周一，并包含今天起向后 days 天。"""
+        today = datetime.now().replace(hour=0, minute=0, second=0, microsecond=0)
+        start = today - timedelta(days=today.weekday())
+        end = max(start + timedelta(weeks=1), today + timedelta(days=days + 1))
+        return start, end
+
+    def run(self):
+        """执行全部预取规则 (同步)；已在进行中或结果仍新鲜时直接返回。"""
+        with self._lock:
+            fresh = all(
+                name in self._entries and time.monotonic() - self._entries[name]["at"] < PREFETCH_TTL
+                for name in self.rules
+            )
+            if self._running or fresh:
+                return
+            self._running = True
+        try:
+            with priority("prefetch"):
+                for name, days in self.rules.items():
+                    generation = self._generations[name]
+                    try:
+                        self._store(name, generation, getattr(self, f"_fetch_{name}")(days))
+                    except Exception as e:
+                        logger.info("预取 %s 失败：%s", name, e)
+        finally:
+            with self._lock:
+                self._running = False
+
+    def _store(self, name, generation, entry):
+        if entry is None:
+            return
+        with self._lock:
+            if self._generations[name] != generation:
+                return
+            self._entries[name] = {**entry, "at": time.monotonic()}
+            self._stats[name]["prefetched"] += 1
+
+    def _fetch_calendar(self, days):
+        start, end = self._window(days)
+        events, next_link = calendar_tools.list_events_page(
+            self.client, start.isoformat(), end.isoformat(), models=True
+        )
+        for _ in range(MAX_PREFETCH_PAGES - 1):
+            if not next_link:
+                break
+            page, next_link = calendar_tools.list_events_page(self.client, next_link=next_link, models=True)
+            events.extend(page)
+        if next_link:
+            return None
+        return {"start": start, "end": end, "data": events}
+
+    def _fetch_schedule(self, days):
+        start, end = self._window(days)
+        me = self.client.get_me()
+        mailbox = me.get("mail") or me.get("userPrincipalName") or "me"
+        result = calendar_tools.get_user_schedules(
+            self.client, [mailbox], start.isoformat(), end.isoformat(), SCHEDULE_INTERVAL
+        )
+        return {"start": start, "end": end, "data": result}
+
+    def _fetch_tasks(self, days):
+        return {"data": tasks_tools.list_tasks_page(self.client, models=True)}
+
+    # --- 读取 ---
+
+    def _lookup(self, name):
+        if name not in self.rules:
+            return None
+        with self._lock:
+            entry = self._entries.get(name)
+            if entry and time.monotonic() - entry["at"] >= PREFETCH_TTL:
+                del self._entries[name]
+                entry = None
+        return entry
+
+    def _count(self, name, hit):
+        if name in self._stats:
+            with self._lock:
+                self._stats[name]["hits" if hit else "misses"] += 1
+
+    def events(self, start_date=None, end_date=None):
+        """若请求范围落在预取范围内，返回其中的事件列表；否则返回 None。"""
+        entry = self._lookup("calendar")
+        start = _naive(start_date) if start_date else datetime.now().replace(microsecond=0)
+        end = _naive(end_date) if end_date else (start and start + timedelta(days=7))
+        if entry is None or start is None or end is None or not entry["start"] <= start <= end <= entry["end"]:
+            self._count("calendar", False)
+            return None
+        self._count("calendar", True)
+        start, end = start.isoformat(timespec="seconds"), end.isoformat(timespec="seconds")
+        return [event.to_dict() for event in entry["data"] if event.overlaps(start, end)]
+
+    def schedule(self, start_date, end_date, interval):
+        """若请求范围落在预取范围内且时间槽对齐，返回当前用户的忙闲数据；否则返回 None。"""
+        entry = self._lookup("schedule")
+        start, end = _naive(start_date), _naive(end_date)
+        aligned = (
+            entry is not None and start is not None and end is not None
+            and entry["start"] <= start <= end <= entry["end"]
+            and interval == SCHEDULE_INTERVAL
+            and (start - entry["start"]) % timedelta(minutes=interval) == timedelta(0)
+        )
+        if not aligned:
+            self._count("schedule", False)
+            return None
+        self._count("schedule", True)
+
+        offset = (start - entry["start"]) // timedelta(minutes=interval)
+        slots = math.ceil((end - start) / timedelta(minutes=interval))
+        schedules = []
+        for schedule in entry["data"].get("value", []):
+            items = [
+                item for item in schedule.get("scheduleItems") or []
+                if parse_local(item["start"]["dateTime"]) < end and parse_local(item["end"]["dateTime"]) > start
+            ]
+            view = (schedule.get("availabilityView") or "")[offset:offset + slots]
+            schedules.append({**schedule, "availabilityView": view, "scheduleItems": items})
+        return {**entry["data"], "value": schedules}
+
+    def tasks(self):
+        """返回预取的默认待办列表第一页 (任务列表, nextLink)；没有时返回 None。"""
+        entry = self._lookup("tasks")
+        self._count("tasks", entry is not None)
+        if entry is None:
+            return None
+        tasks, next_link = entry["data"]
+        return [task.to_dict() for task in tasks], next_link
+
+    def invalidate(self, *names):
+        """写操作后丢弃受影响的预取结果。"""
+        with self._lock:
+            for name in names:
+                self._entries.pop(name, None)
+                if name in self._generations:
+                    self._generations[name] += 1
+
+    def stats(self):
+        with self._lock:
+            result = {}
+            for name, stats in self._stats.items():
+                lookups = stats["hits"] + stats["misses"]
+                result[name] = {**stats, "hit_rate": round(stats["hits"] / lookups, 3) if lookups else None}
+            return result
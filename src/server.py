@@ -2,6 +2,9 @@ import os
 import ssl
 import sys
 import re
+import logging
+import threading
+import time
 from datetime import datetime
 from typing import Optional, List
 
@@ -14,20 +17,39 @@ except Exception:
 
 from fastmcp import FastMCP
 from .auth import get_client
-from .capabilities import calendar_tools, tasks_tools, email_tools, system_tools
-from .utils.validation import validate_iso_datetime, validate_email, validate_enum
+from .capabilities import calendar_tools, tasks_tools, email_tools, system_tools, agenda_tools, bulk_actions, analytics, availability
+from .utils.validation import validate_iso_datetime, validate_email, validate_enum, validate_file_path
+from .utils import output, profiling, stale_cache
 
 # Initialize FastMCP server
 mcp = FastMCP("Microsoft-365", version="0.1.0")
 
+def tool(stale=False):
+    """
+    注册 MCP 工具；处理函数经过性能分析包装 (由 M365_PROFILE 或 configure_profiling 开启)。
+    stale=True 的读取类工具在 Graph 暂时不可用时返回上次成功获取的数据 (注明时效)。
+    """
+    def decorator(fn):
+        if stale:
+            fn = stale_cache.cache.wrap(fn)
+        return mcp.tool()(profiling.profiled(fn))
+    return decorator
+
 # Module Toggles (Default to enabled)
-def is_enabled(var_name):
-    val = os.getenv(var_name, "true").lower()
+def is_enabled(var_name, default="true"):
+    val = os.getenv(var_name, default).lower()
     return val in ("true", "1", "yes")
 
 ENABLE_CALENDAR = is_enabled("ENABLE_CALENDAR")
 ENABLE_TASKS = is_enabled("ENABLE_TASKS")
 ENABLE_EMAIL = is_enabled("ENABLE_EMAIL")
+ENABLE_WRITE_BEHIND = is_enabled("ENABLE_WRITE_BEHIND", default="false")
+ENABLE_SEARCH_INDEX = is_enabled("ENABLE_SEARCH_INDEX", default="false")
+ENABLE_PREFETCH = is_enabled("ENABLE_PREFETCH")
+ENABLE_WARMUP = is_enabled("ENABLE_WARMUP", default="false")
+ENABLE_BULK_SCHEDULE = is_enabled("ENABLE_BULK_SCHEDULE", default="false")
+
+logger = logging.getLogger(__name__)
 
 # Helper to get authenticated client
 def get_authenticated_client():
@@ -36,10 +58,32 @@ def get_authenticated_client():
         raise RuntimeError("账号未认证。请先运行 m365-auth 进行登录。")
     return client
 
+def start_prefetch():
+    """在后台预取模型接下来大概率会读取的数据；未认证时静默跳过。"""
+    if not ENABLE_PREFETCH:
+        return
+
+    def run():
+        try:
+            client = get_client()
+            if client.prefetcher and client.is_authenticated:
+                client.prefetcher.run()
+        except Exception as e:
+            logger.info("后台预取失败：%s", e)
+    threading.Thread(target=run, name="m365-prefetch", daemon=True).start()
+
 # --- Calendar Tools ---
 if ENABLE_CALENDAR:
-    @mcp.tool()
-    def list_calendar_events(start_date: str = None, end_date: str = None):
+    @tool(stale=True)
+    def list_calendar_events(
+        start_date: str = None, 
+        end_date: str = None,
+        local_expansion: bool = False,
+        output_mode: str = "full",
+        fields: Optional[List[str]] = None,
+        max_bytes: Optional[int] = None,
+        cursor: Optional[str] = None
+    ):
         """
         列出用户主日历中的事件。
         [注意] 调用前请务必先执行 `get_current_time` 获取当前时间。
@@ -48,13 +92,37 @@ if ENABLE_CALENDAR:
         参数:
             start_date (str, 可选): 查询范围的开始时间。ISO 8601 格式 (如 '2025-12-23T00:00:00')。必须是本地时间。
             end_date (str, 可选): 查询范围的结束时间。ISO 8601 格式 (如 '2025-12-23T23:59:59')。必须是本地时间。
+            local_expansion (bool, 可选): 在本地展开循环事件 (仅传输系列规则而非全部实例)。查询数月或更长范围时推荐开启；展开的实例不含实例 ID。默认为 False。
+            output_mode (str, 可选): 输出模式：'full' (完整), 'compact' (精简：去除空值并截断预览), 'table' (列式表格)。默认为 'full'。
+            fields (List[str], 可选): 仅返回这些字段。
+            max_bytes (int, 可选): 单次返回结果的最大字节数，超出部分通过返回的 next_cursor 续取。
+            cursor (str, 可选): 上次返回的 next_cursor，用于继续获取后续结果；提供时沿用原查询条件。
         """
+        if cursor:
+            client = get_authenticated_client()
+            return output.resume(
+                cursor, "list_calendar_events",
+                lambda link: calendar_tools.list_events_page(client, next_link=link),
+                start_date=start_date, end_date=end_date
+            )
         validate_iso_datetime(start_date, "start_date")
         validate_iso_datetime(end_date, "end_date")
+        validate_enum(output_mode, output.OUTPUT_MODES, "output_mode")
         client = get_authenticated_client()
-        return calendar_tools.list_events(client, start_date, end_date)
+        if local_expansion:
+            events = calendar_tools.list_events_expanded(client, start_date, end_date)
+            return output.render(events, "list_calendar_events", output_mode, fields, max_bytes)
+        prefetched = client.prefetcher.events(start_date, end_date) if client.prefetcher else None
+        if prefetched is not None:
+            # 预取的范围已完整获取，无需分页
+            return output.render(prefetched, "list_calendar_events", output_mode, fields, max_bytes)
+        events, next_link = calendar_tools.list_events_page(client, start_date, end_date)
+        return output.render(
+            events, "list_calendar_events", output_mode, fields, max_bytes,
+            next_link=next_link, query={"start_date": start_date, "end_date": end_date}
+        )
 
-    @mcp.tool()
+    @tool()
     def create_calendar_event(
         subject: str, 
         start: str, 
@@ -99,7 +167,7 @@ if ENABLE_CALENDAR:
             reminder_minutes=reminder_minutes
         )
 
-    @mcp.tool()
+    @tool()
     def update_calendar_event(
         event_id: str, 
         subject: Optional[str] = None, 
@@ -153,7 +221,7 @@ if ENABLE_CALENDAR:
         
         return calendar_tools.update_event(client, event_id, **kwargs)
 
-    @mcp.tool()
+    @tool()
     def delete_calendar_event(event_id: str):
         """
         删除日历事件。
@@ -164,8 +232,15 @@ if ENABLE_CALENDAR:
         client = get_authenticated_client()
         return calendar_tools.delete_event(client, event_id)
 
-    @mcp.tool()
-    def get_user_schedules(start: str, end: str, availability_view_interval: int = 30):
+    @tool(stale=True)
+    def get_user_schedules(
+        start: str, 
+        end: str, 
+        availability_view_interval: int = 30,
+        output_mode: str = "full",
+        max_bytes: Optional[int] = None,
+        cursor: Optional[str] = None
+    ):
         """
         [首选] 检查当前用户在特定时间段内是否有空 (UTC+8)。
         当用户询问“我是否有空？”、“是否有冲突？”或“检查我的忙闲”时，请务必【优先】使用此工具而非 list_calendar_events。
@@ -175,28 +250,129 @@ if ENABLE_CALENDAR:
             start (str): 查询范围的开始时间。ISO 8601 格式 (如 '2025-12-23T00:00:00')。必须是本地时间。
             end (str): 查询范围的结束时间。ISO 8601 格式 (如 '2025-12-23T23:59:59')。必须是本地时间。
             availability_view_interval (int, 可选): 响应中每个时间槽的持续分钟数。默认为 30。
+            output_mode (str, 可选): 'full' 返回 Graph 原始忙闲数据；'compact' 或 'table' 仅返回合并后的非空闲时段 (未列出的时间均为空闲)。默认为 'full'。
+            max_bytes (int, 可选): 单次返回结果的最大字节数，超出部分通过返回的 next_cursor 续取。
+            cursor (str, 可选): 上次返回的 next_cursor，用于获取剩余时段；提供时忽略其他参数。
         """
-        client = get_authenticated_client()
-        
-        # Always use the current user
-        me_info = client.request("GET", "/me").json()
-        my_email = me_info.get('mail') or me_info.get('userPrincipalName')
-        final_schedules = [my_email] if my_email else ["me"]
-                
+        if cursor:
+            return output.resume(cursor, "get_user_schedules")
+        validate_enum(output_mode, output.OUTPUT_MODES, "output_mode")
         validate_iso_datetime(start, "start")
         validate_iso_datetime(end, "end")
+        client = get_authenticated_client()
+
+        result = client.prefetcher.schedule(start, end, availability_view_interval) if client.prefetcher else None
+        if result is None:
+            # Always use the current user
+            me_info = client.get_me()
+            my_email = me_info.get('mail') or me_info.get('userPrincipalName')
+            final_schedules = [my_email] if my_email else ["me"]
+            result = calendar_tools.get_user_schedules(client, final_schedules, start, end, availability_view_interval)
+        if output_mode == "full" and not max_bytes:
+            return result
+        slots = output.schedule_slots(result, start, availability_view_interval)
+        return output.render(slots, "get_user_schedules", output_mode, max_bytes=max_bytes)
+
+    if ENABLE_BULK_SCHEDULE:
+        @tool()
+        def get_bulk_availability(
+            schedules: List[str],
+            start: str,
+            end: str,
+            interval: int = 30,
+            min_duration: int = 30,
+            working_hours: Optional[str] = None,
+            per_schedule_free: bool = False
+        ):
+            """
+            批量查询多个同事邮箱或会议室的忙闲 (UTC+8)，并给出所有人共同的空闲时段。
+            适用于为多人会议找时间、在几十个会议室中找空闲会议室等场景；只查询自己的忙闲请使用 get_user_schedules。
+
+            参数:
+                schedules (List[str]): 邮箱地址或会议室地址列表，最多 100 个。
+                start (str): 查询范围的开始时间。ISO 8601 格式 (如 '2025-12-22T00:00:00')。必须是本地时间。
+                end (str): 查询范围的结束时间。ISO 8601 格式 (如 '2025-12-27T00:00:00')。必须是本地时间。
+                interval (int, 可选): 时间槽的分钟数 (5~1440)。默认为 30。
+                min_duration (int, 可选): 只返回不短于该分钟数的空闲时段。默认为 30。
+                working_hours (str, 可选): 只在每天的该时间段内寻找空闲，如 '09:00-18:00'。默认为全天。
+                per_schedule_free (bool, 可选): 同时返回每个邮箱/会议室各自的空闲时段 (如查找可用会议室)。默认为 False。
+            """
+            validate_iso_datetime(start, "start")
+            validate_iso_datetime(end, "end")
+            for address in schedules:
+                validate_email(address, "schedules")
+            client = get_authenticated_client()
+            return availability.get_bulk_availability(
+                client, schedules, start, end, interval=interval, min_duration=min_duration,
+                working_hours=working_hours, per_schedule_free=per_schedule_free
+            )
+
+    @tool()
+    def export_calendar_ics(path: str, start_date: str, end_date: str):
+        """
+        将时间范围内的日程导出为 .ics (iCalendar) 文件，用于迁移或备份。循环事件按实例逐个导出。
+        事件逐页读取并逐个写入文件，适用于数千个事件的大范围导出。
+
+        参数:
+            path (str): 导出文件的本地路径 (所在目录必须存在)。
+            start_date (str): 导出范围的开始时间。ISO 8601 格式 (如 '2025-01-01T00:00:00')。必须是本地时间。
+            end_date (str): 导出范围的结束时间。ISO 8601 格式 (如 '2025-12-31T23:59:59')。必须是本地时间。
+        """
+        validate_iso_datetime(start_date, "start_date")
+        validate_iso_datetime(end_date, "end_date")
+        if not os.path.isdir(os.path.dirname(os.path.abspath(path))):
+            raise ValueError(f"参数 'path' 所在的目录不存在: {path}")
+        client = get_authenticated_client()
+        return calendar_tools.export_ics(
+            client, path, start_date, end_date,
+            progress=lambda count: logger.info("ICS 导出进度：已导出 %d 个事件", count)
+        )
 
-        return calendar_tools.get_user_schedules(client, final_schedules, start, end, availability_view_interval)
+    @tool()
+    def import_calendar_ics(path: str, dry_run: bool = False):
+        """
+        从 .ics (iCalendar) 文件批量导入日程到主日历。事件按批并发创建，遇到限流自动退避重试。
+        返回导入总数、成功数、失败数以及失败事件的明细 (序号、UID、标题与原因)。
+
+        参数:
+            path (str): .ics 文件的本地路径。
+            dry_run (bool, 可选): 只解析并校验文件内容，不创建任何事件。默认为 False。
+        """
+        validate_file_path(path, "path")
+        client = get_authenticated_client()
+        return calendar_tools.import_ics(
+            client, path, dry_run=dry_run,
+            progress=lambda count: logger.info("ICS 导入进度：已处理 %d 个事件", count)
+        )
 
 # --- Tasks Tools ---
 if ENABLE_TASKS:
-    @mcp.tool()
-    def list_tasks():
-        """列出用户默认待办事项列表中的任务。"""
+    @tool(stale=True)
+    def list_tasks(
+        output_mode: str = "full",
+        fields: Optional[List[str]] = None,
+        max_bytes: Optional[int] = None,
+        cursor: Optional[str] = None
+    ):
+        """
+        列出用户默认待办事项列表中的任务。
+
+        参数:
+            output_mode (str, 可选): 输出模式：'full' (完整), 'compact' (精简：去除空值并截断预览), 'table' (列式表格)。默认为 'full'。
+            fields (List[str], 可选): 仅返回这些字段。
+            max_bytes (int, 可选): 单次返回结果的最大字节数，超出部分通过返回的 next_cursor 续取。
+            cursor (str, 可选): 上次返回的 next_cursor，用于继续获取后续结果；提供时沿用原查询条件。
+        """
+        if cursor:
+            client = get_authenticated_client()
+            return output.resume(cursor, "list_tasks", lambda link: tasks_tools.list_tasks_page(client, link))
+        validate_enum(output_mode, output.OUTPUT_MODES, "output_mode")
         client = get_authenticated_client()
-        return tasks_tools.list_tasks(client)
+        prefetched = client.prefetcher.tasks() if client.prefetcher else None
+        tasks, next_link = prefetched or tasks_tools.list_tasks_page(client)
+        return output.render(tasks, "list_tasks", output_mode, fields, max_bytes, next_link=next_link)
 
-    @mcp.tool()
+    @tool()
     def create_task(
         title: str, 
         body: Optional[str] = None, 
@@ -240,7 +416,7 @@ if ENABLE_TASKS:
             status=status, completed_date=completed_date
         )
 
-    @mcp.tool()
+    @tool()
     def update_task(
         task_id: str,
         title: Optional[str] = None, 
@@ -294,7 +470,7 @@ if ENABLE_TASKS:
 
         return tasks_tools.update_task(client, task_id, **kwargs)
 
-    @mcp.tool()
+    @tool()
     def complete_task(task_id: str):
         """
         将任务标记为已完成。
@@ -305,7 +481,7 @@ if ENABLE_TASKS:
         client = get_authenticated_client()
         return tasks_tools.update_task(client, task_id, completed=True)
 
-    @mcp.tool()
+    @tool()
     def delete_task(task_id: str):
         """
         删除任务。
@@ -318,19 +494,50 @@ if ENABLE_TASKS:
 
 # --- Email Tools ---
 if ENABLE_EMAIL:
-    @mcp.tool()
-    def list_emails(limit: int = 10):
+    @tool(stale=True)
+    def list_emails(
+        limit: int = 10,
+        output_mode: str = "full",
+        fields: Optional[List[str]] = None,
+        max_bytes: Optional[int] = None,
+        cursor: Optional[str] = None
+    ):
         """
         列出收件箱中的最近邮件 (UTC+8)。
 
         参数:
-            limit (int, 可选): 返回邮件的最大数量。默认为 10。
+            limit (int, 可选): 每次返回邮件的最大数量。默认为 10。还有更多邮件时结果中包含 next_cursor，传入 cursor 即可继续翻页。
+            output_mode (str, 可选): 输出模式：'full' (完整), 'compact' (精简：去除空值并截断预览), 'table' (列式表格)。默认为 'full'。
+            fields (List[str], 可选): 仅返回这些字段。
+            max_bytes (int, 可选): 单次返回结果的最大字节数，超出部分通过返回的 next_cursor 续取。
+            cursor (str, 可选): 上次返回的 next_cursor，用于继续获取后续结果；提供时沿用原查询条件。
         """
+        if cursor:
+            client = get_authenticated_client()
+            return output.resume(cursor, "list_emails", lambda link: email_tools.list_emails_page(client, next_link=link))
+        validate_enum(output_mode, output.OUTPUT_MODES, "output_mode")
         client = get_authenticated_client()
-        return email_tools.list_emails(client, limit)
+        emails, next_link = email_tools.list_emails_page(client, limit)
+        return output.render(emails, "list_emails", output_mode, fields, max_bytes, next_link=next_link)
+
+    @tool(stale=True)
+    def get_email(message_id: str, offset: int = 0, max_chars: int = 8000):
+        """
+        读取一封邮件的完整正文 (纯文本) 以及发件人、收件人等信息。
+        正文已缓存且邮件未变化时不会重新下载；很长的邮件可分段读取。
 
-    @mcp.tool()
-    def send_email(to: str, subject: str, body: str):
+        参数:
+            message_id (str): 邮件 ID (可从 list_emails 或 search 的结果中获取)。
+            offset (int, 可选): 从正文的第几个字符开始返回。默认为 0。
+            max_chars (int, 可选): 单次返回的最大字符数；结果中包含 next_offset 时表示还有剩余内容。默认为 8000。
+        """
+        if offset < 0 or max_chars <= 0:
+            raise ValueError("offset 不能为负数，max_chars 必须大于 0")
+        client = get_authenticated_client()
+        return email_tools.get_email(client, message_id, offset=offset, max_chars=max_chars)
+
+    @tool()
+    def send_email(to: str, subject: str, body: str, attachments: Optional[List[str]] = None):
         """
         发送电子邮件。
 
@@ -338,12 +545,69 @@ if ENABLE_EMAIL:
             to (str): 收件人邮箱地址。
             subject (str): 邮件主题。
             body (str): 邮件正文内容。
+            attachments (List[str], 可选): 附件的本地文件路径列表。大文件会自动分块上传。
         """
         validate_email(to, "to")
+        for path in attachments or []:
+            validate_file_path(path, "attachments")
         client = get_authenticated_client()
-        return email_tools.send_email(client, to, subject, body)
+        return email_tools.send_email(client, to, subject, body, attachments=attachments)
+
+    @tool()
+    def create_email_draft(to: str, subject: str, body: str, attachments: Optional[List[str]] = None):
+        """
+        创建邮件草稿 (不发送)。
 
-    @mcp.tool()
+        参数:
+            to (str): 收件人邮箱地址。
+            subject (str): 邮件主题。
+            body (str): 邮件正文内容。
+            attachments (List[str], 可选): 附件的本地文件路径列表。大文件会自动分块上传。
+        """
+        validate_email(to, "to")
+        for path in attachments or []:
+            validate_file_path(path, "attachments")
+        client = get_authenticated_client()
+        return email_tools.create_draft(client, to, subject, body, attachments=attachments)
+
+    @tool()
+    def add_email_attachment(message_id: str, file_path: str):
+        """
+        为草稿邮件添加附件。若同一文件之前上传中断，会从断点继续上传。
+
+        参数:
+            message_id (str): 草稿邮件的唯一 ID。
+            file_path (str): 附件的本地文件路径。
+        """
+        validate_file_path(file_path, "file_path")
+        client = get_authenticated_client()
+        return email_tools.add_attachment(client, message_id, file_path)
+
+    @tool(stale=True)
+    def list_email_attachments(message_id: str):
+        """
+        列出邮件的附件 (名称、类型、大小)。
+
+        参数:
+            message_id (str): 邮件的唯一 ID。
+        """
+        client = get_authenticated_client()
+        return email_tools.list_attachments(client, message_id)
+
+    @tool()
+    def download_email_attachment(message_id: str, attachment_id: str, save_path: str):
+        """
+        将邮件附件下载到本地磁盘 (分块流式写入，适用于大文件)。
+
+        参数:
+            message_id (str): 邮件的唯一 ID。
+            attachment_id (str): 附件的唯一 ID (可通过 list_email_attachments 获取)。
+            save_path (str): 保存路径。若为已存在的目录，则使用附件原文件名保存到该目录。
+        """
+        client = get_authenticated_client()
+        return email_tools.download_attachment(client, message_id, attachment_id, save_path)
+
+    @tool()
     def delete_email(message_id: str):
         """
         删除电子邮件。
@@ -354,16 +618,192 @@ if ENABLE_EMAIL:
         client = get_authenticated_client()
         return email_tools.delete_email(client, message_id)
 
+    @tool()
+    def move_email(message_ids: List[str], folder: str):
+        """
+        将一封或多封邮件移动到指定文件夹 (批量请求，一次最多可处理数百封)。
+        移动后邮件会获得新的 ID，结果中返回原 ID 到新 ID 的对应关系。
+
+        参数:
+            message_ids (List[str]): 待移动邮件的唯一 ID 列表。
+            folder (str): 目标文件夹。可以是名称 (如 '项目')、完整路径 (如 '收件箱/项目/甲')、知名文件夹 ('inbox', 'archive', 'deleteditems', 'junkemail' 或 '收件箱'、'存档' 等) 或文件夹 ID。
+        """
+        if not message_ids:
+            raise ValueError("参数 'message_ids' 不能为空")
+        client = get_authenticated_client()
+        return email_tools.move_emails(client, message_ids, folder)
+
+    @tool()
+    def archive_emails(message_ids: List[str]):
+        """
+        将一封或多封邮件移动到存档 (Archive) 文件夹。
+
+        参数:
+            message_ids (List[str]): 待存档邮件的唯一 ID 列表。
+        """
+        if not message_ids:
+            raise ValueError("参数 'message_ids' 不能为空")
+        client = get_authenticated_client()
+        return email_tools.archive_emails(client, message_ids)
+
 # --- System Tools ---
-@mcp.tool()
+@tool()
 def get_current_time():
     """获取当前本地时间 (UTC+8)。处理相对时间请求时，请【必须】先调用此工具以获取参考时间。"""
+    start_prefetch()
     return system_tools.get_current_time()
 
+if ENABLE_CALENDAR or ENABLE_TASKS or ENABLE_EMAIL:
+    # 不回退到旧数据：结果中的 now 被用作参考时间，旧的简报会给出过时的当前时间与“今天”
+    @tool()
+    def get_agenda(email_limit: int = 10):
+        """
+        今日简报：一次调用返回当前时间 (UTC+8)、今天的日程、今天到期及已逾期的未完成待办、收件箱中的未读邮件。
+        用户询问“今天有什么安排”等概览时请首选此工具，而不是依次调用 get_current_time 与各列表工具。
+        结果中的 now 可直接作为处理相对时间的参考时间。
+
+        参数:
+            email_limit (int, 可选): 最多返回的未读邮件数。默认为 10。
+        """
+        client = get_authenticated_client()
+        start_prefetch()
+        return agenda_tools.get_agenda(
+            client, calendar=ENABLE_CALENDAR, tasks=ENABLE_TASKS, email=ENABLE_EMAIL, email_limit=email_limit
+        )
+
+if ENABLE_CALENDAR or ENABLE_TASKS:
+    @tool()
+    def get_analytics(
+        kind: str,
+        start_date: str,
+        end_date: str,
+        group_by: Optional[List[str]] = None,
+        heatmap: bool = False
+    ):
+        """
+        对较长时间范围内的日程或待办做统计汇总，只返回小型汇总表。
+        回答“今年每周开会多少小时 (按分类)”、“每月任务完成率”等问题时请使用此工具，而不是列出全部事件后自行计算。
+        [时区] 所有日期字符串必须使用本地时间 (UTC+8)。
+
+        参数:
+            kind (str): 'calendar' (日程时长：总时长、去除重叠后的忙碌时长及分组汇总) 或 'tasks' (范围内创建的任务：完成率、逾期数、完成耗时及分组汇总)。
+            start_date (str): 统计范围的开始时间。ISO 8601 格式 (如 '2025-01-01T00:00:00')。
+            end_date (str): 统计范围的结束时间。ISO 8601 格式 (如 '2026-01-01T00:00:00')。范围不超过两年。
+            group_by (List[str], 可选): 分组维度。calendar 可选 'category'、'week'、'weekday'、'month'，默认为 ['category', 'week', 'weekday']；tasks 可选 'month'、'category'，默认为两者。
+            heatmap (bool, 可选): calendar 时额外返回星期 x 小时的忙碌时长热力图。默认为 False。
+        """
+        enabled = {"calendar": ENABLE_CALENDAR, "tasks": ENABLE_TASKS}
+        validate_enum(kind, [k for k, on in enabled.items() if on], "kind")
+        validate_iso_datetime(start_date, "start_date")
+        validate_iso_datetime(end_date, "end_date")
+        client = get_authenticated_client()
+        if kind == "calendar":
+            return analytics.calendar_analytics(client, start_date, end_date, group_by=group_by, heatmap=heatmap)
+        return analytics.task_analytics(client, start_date, end_date, group_by=group_by)
+
+if ENABLE_TASKS or ENABLE_EMAIL:
+    @tool()
+    def bulk_action(
+        kind: str,
+        filter: str,
+        action: str,
+        folder: Optional[str] = None,
+        destination: Optional[str] = None,
+        categories: Optional[List[str]] = None,
+        dry_run: bool = False,
+        limit: Optional[int] = None,
+        restart: bool = False
+    ):
+        """
+        按筛选条件批量处理邮件或待办任务，例如“将某发件人的通知邮件全部标为已读并移到某文件夹”、“完成所有已逾期的任务”。
+        匹配项由服务器端筛选，逐页读取并按批并发执行，无需先列出再逐个调用写入工具。
+        [建议] 先以 dry_run=True 调用确认匹配数量与样例，再正式执行。
+        中断或部分失败后以相同参数再次调用，会从检查点继续而不重复处理。
+
+        参数:
+            kind (str): 对象类型：'email' (邮件) 或 'task' (默认待办列表中的任务)。
+            filter (str): OData $filter 筛选条件，如 "from/emailAddress/address eq 'news@example.com'"、"isRead eq false"、"status ne 'completed' and dueDateTime/dateTime lt '2025-12-23T00:00:00'"。
+            action (str): 操作。邮件：'mark_read'、'mark_unread'、'move'、'delete'、'categorize'；任务：'complete'、'delete'、'categorize'。
+            folder (str, 可选): 只处理该邮件文件夹中的邮件 (名称、路径或 ID)。默认为所有邮件。
+            destination (str, 可选): move 操作的目标文件夹 (名称、路径或 ID)。
+            categories (List[str], 可选): categorize 操作追加的分类名称。
+            dry_run (bool, 可选): 只统计匹配数量并返回少量样例，不执行任何修改。默认为 False。
+            limit (int, 可选): 最多处理的对象数。
+            restart (bool, 可选): 丢弃之前未完成的检查点，重新筛选。默认为 False。
+        """
+        enabled = {"email": ENABLE_EMAIL, "task": ENABLE_TASKS}
+        validate_enum(kind, [k for k, on in enabled.items() if on], "kind")
+        client = get_authenticated_client()
+        return bulk_actions.run_pipeline(
+            client, kind, filter, action, folder=folder, destination=destination, categories=categories,
+            dry_run=dry_run, limit=limit, restart=restart,
+            progress=lambda count: logger.info("批量操作进度：已处理 %d 项", count)
+        )
+
+@tool()
+def get_server_metrics():
+    """获取服务器运行指标 (如被合并的重复 Graph 请求数)，用于诊断性能。"""
+    client = get_client()
+    return {**client.get_metrics(), "stale_results": stale_cache.cache.summary()}
+
+@tool()
+def configure_profiling(
+    mode: Optional[str] = None,
+    tools: Optional[List[str]] = None,
+    rate: Optional[float] = None
+):
+    """
+    查看或修改工具调用的性能分析设置，用于定位慢调用的耗时分布 (校验、MSAL、HTTP、JSON 解析、输出整形等)。
+    每次被分析的调用会在输出目录中生成独立的 profile 文件，目录中只保留最新的若干组。
+
+    参数:
+        mode (str, 可选): 'off' (关闭), 'cprofile' (确定性分析，生成 .pstats), 'sampling' (采样分析，生成 speedscope 与火焰图折叠栈格式，开销低，可长期开启)。不提供时保持不变。
+        tools (List[str], 可选): 仅分析这些工具；传入空列表表示分析全部工具。不提供时保持不变。
+        rate (float, 可选): 被分析调用的比例 (0 到 1)。不提供时保持不变。
+    """
+    profiling.config.update(mode=mode, tools=tools, rate=rate)
+    return profiling.config.status()
+
+if ENABLE_WRITE_BEHIND:
+    @tool()
+    def get_pending_writes():
+        """查看写后队列中尚未提交到服务器的写操作，以及提交时发生冲突或失败的记录。"""
+        client = get_client()
+        return client.write_queue.summary()
+
+    @tool()
+    def flush_pending_writes(retry_conflicts: bool = False):
+        """
+        立即将写后队列中的写操作提交到服务器。
+
+        参数:
+            retry_conflicts (bool, 可选): 是否重新提交此前因服务器端已被修改 (ETag 不匹配) 而冲突的操作；为 True 时以本地修改覆盖服务器内容。默认为 False。
+        """
+        client = get_client()
+        return client.write_queue.flush(retry_conflicts=retry_conflicts)
+
+if ENABLE_SEARCH_INDEX:
+    @tool()
+    def search(query: str, kinds: List[str] = None, limit: int = 20):
+        """
+        在本地索引中全文搜索邮件、日程与待办，按相关度排序 (支持中文，英文支持前缀匹配)。
+        索引由之前列出过的数据增量构建，从未列出过的项目搜索不到，可先调用对应的列表工具。
+
+        参数:
+            query (str): 搜索关键词。
+            kinds (List[str], 可选): 限定搜索类型，可选 'email', 'event', 'task'。默认搜索全部。
+            limit (int, 可选): 最多返回的结果数。默认为 20。
+        """
+        for kind in kinds or []:
+            validate_enum(kind, ["email", "event", "task"], "kinds")
+        client = get_client()
+        return client.search_index.search(query, kinds, limit)
+
 # --- Resources ---
 @mcp.resource("context://now")
 def get_time_resource() -> str:
     """获取当前的系统时间与时区信息 (UTC+8)。"""
+    start_prefetch()
     data = system_tools.get_current_time()
     return f"当前本地时间: {data['current_time']}\n时区: {data['timezone']}\n星期: {data['day_of_week']}"
 
@@ -371,6 +811,8 @@ def get_time_resource() -> str:
 @mcp.prompt("m365-assistant")
 def m365_assistant_prompt():
     """在调用本MCP的任何工具或资源前先阅读以下须知内容"""
+    # 会话开始时读取提示词，提前预取
+    start_prefetch()
     # 重新获取最新的启用状态
     cal_enabled = is_enabled("ENABLE_CALENDAR")
     tasks_enabled = is_enabled("ENABLE_TASKS")
@@ -389,7 +831,7 @@ def m365_assistant_prompt():
         f"当前启用的功能模块：{features_str}。",
         "",
         "【时区与时间处理核心原则】：",
-        "1. 在处理任何与时间相关的请求前，你【必须】先调用 `get_current_time` 工具或读取 `context://now` resource。",
+        "1. 在处理任何与时间相关的请求前，你【必须】先调用 `get_current_time` 工具或读取 `context://now` resource (`get_agenda` 的结果同样包含当前时间)。",
         "2. 本服务器自动处理【本地时间 (东八区 UTC+8)】。",
         "3. 【禁止转换】：请直接使用本地时间进行交互，严禁将时间转换为 UTC 或其他时区。",
         "4. 【格式要求】：所有输入时间必须符合 ISO 8601 格式（例如：2025-12-23T09:00:00）。",
@@ -397,12 +839,15 @@ def m365_assistant_prompt():
         "【功能使用指南】："
     ]
 
+    if enabled_features:
+        instructions.append("- 简报：当用户询问“今天有什么安排”或需要当日概览时，【首选】`get_agenda`，一次获取今日日程、到期/逾期待办与未读邮件。")
+
     if cal_enabled:
         instructions.append("- 日历：管理日程安排。当用户询问“是否有空”、“是否有冲突”或“查看忙闲”时，【必须首选】使用 `get_user_schedules` 而非 `list_calendar_events`。")
     if tasks_enabled:
         instructions.append("- 待办：管理任务清单。支持设置优先级、截止日期和提醒。")
     if email_enabled:
-        instructions.append("- 邮件：处理 Outlook 邮件。支持查询收件箱、发送新邮件和删除邮件。")
+        instructions.append("- 邮件：处理 Outlook 邮件。支持查询收件箱、发送新邮件 (可带附件)、创建草稿、下载附件、移动/存档和删除邮件。移动邮件时直接传入文件夹名称或路径即可，无需先查询文件夹 ID。")
 
     instructions.append("\n请始终以专业、高效、友好的语气为用户提供服务。")
     
@@ -411,5 +856,24 @@ def m365_assistant_prompt():
     # 直接返回字符串内容
     return prompt_text
 
+def warm_up():
+    """启动预热：加载 Token 缓存并获取访问令牌、建立连接池、解析用户资料与默认待办列表。"""
+    try:
+        client = get_client()
+        timings = client.warm_up()
+        if "profile_ms" in timings and ENABLE_TASKS:
+            started = time.perf_counter()
+            tasks_tools._get_default_todo_list_id(client)
+            timings["todo_list_ms"] = round((time.perf_counter() - started) * 1000, 1)
+        logger.info("启动预热完成：%s", timings)
+    except Exception as e:
+        logger.info("启动预热失败：%s", e)
+
+def main():
+    if ENABLE_WARMUP:
+        # 在后台进行，不延迟 MCP 握手
+        threading.Thread(target=warm_up, name="m365-warm-up", daemon=True).start()
+    mcp.run()
+
 if __name__ == "__main__":
-    mcp.run()
\ No newline at end of file
+    main()
\ No newline at end of file
@@ -0,0 +1,136 @@
+import threading
+import time
+
+# 自动调节参数：单个请求的目标耗时 (秒)、单页的目标耗时 (秒)、单页响应体上限 (KB)、
+# 两次乘性减之间的最短间隔 (秒)，以及最低并发数
+DEFAULT_AUTOTUNE_SETTINGS = {
+    "target_latency": 2.0,
+    "page_target": 1.5,
+    "max_page_kb": 1024.0,
+    "cooldown": 2.0,
+    "min_concurrency": 1,
+}
+# 列表端点的 (初始, 最小, 最大, 加性增步长) 页大小
+PAGE_SIZE_RANGES = {
+    "calendarView": (50, 10, 250, 10),
+    "tasks": (50, 10, 100, 10),
+}
+
+
+def parse_settings(value):
+    """解析形如 "target_latency=2,page_target=1.5" 的配置。"""
+    settings = dict(DEFAULT_AUTOTUNE_SETTINGS)
+    for part in filter(None, (value or "").split(",")):
+        name, _, number = part.partition("=")
+        name = name.strip()
+        try:
+            if name not in DEFAULT_AUTOTUNE_SETTINGS or float(number) <= 0:
+                raise ValueError
+            settings[name] = type(DEFAULT_AUTOTUNE_SETTINGS[name])(number.strip())
+        except ValueError:
+            raise ValueError(f"M365_AUTOTUNE 配置无效: {part}")
+    return settings
+
+
+def page_family(url):
+    """返回可调节页大小的列表端点名；其他请求返回 None。"""
+    path = url.split("?", 1)[0]
+    if path.endswith("/calendarView"):
+        return "calendarView"
+    if "/todo/lists/" in path and path.endswith("/tasks"):
+        return "tasks"
+    return None
+
+
+def page_size(client, family, default):
+    """列表请求应使用的页大小 ($top)；客户端未启用自动调节时返回默认值。"""
+    tuner = getattr(client, "autotuner", None)
+    return tuner.page_size(family) if tuner else default
+
+
+class AIMD:
+    """加性增、乘性减 (AIMD) 的整数控制量，限制在 [minimum, maximum] 内。"""
+
+    def __init__(self, value, minimum, maximum, step=1):
+        self.minimum, self.maximum, self.step = minimum, maximum, step
+        self.value = min(max(value, minimum), maximum)
+
+    def increase(self):
+        self.value = min(self.value + self.step, self.maximum)
+
+    def decrease(self, factor=0.5):
+        self.value = max(int(self.value * factor), self.minimum)
+
+
+class Autotuner:
+    """
+    根据观测到的延迟、响应大小与 429 频率调节请求并发上限与列表页大小：
+    - 并发：每完成一轮 (与当前上限相同数量) 未超时的请求加 1；收到 429 或请求耗时超过目标时减半，
+      两次减半之间至少间隔 cooldown 秒，避免同一波限流被重复计算；
+    - 页大小：整页返回且耗时与大小都在目标内时按步长增大，超出目标或遇到限流时减半。
+    """
+
+    def __init__(self, scheduler, settings=None):
+        self.scheduler = scheduler
+        self.settings = dict(DEFAULT_AUTOTUNE_SETTINGS, **(settings or {}))
+        self._lock = threading.Lock()
+        maximum = scheduler.limits["interactive"]
+        self.concurrency = AIMD(maximum, min(self.settings["min_concurrency"], maximum), maximum)
+        self.pages = {family: AIMD(*spec) for family, spec in PAGE_SIZE_RANGES.items()}
+        self._successes = 0
+        self._last_decrease = 0.0
+        self.stats = {"increases": 0, "decreases": 0, "throttled": 0}
+
+    def _decrease(self, now):
+        if now - self._last_decrease < self.settings["cooldown"]:
+            return
+        self._last_decrease = now
+        self._successes = 0
+        self.concurrency.decrease()
+        for control in self.pages.values():
+            control.decrease()
+        self.stats["decreases"] += 1
+        self.scheduler.set_total_limit(self.concurrency.value)
+
+    def observe(self, elapsed, status=None):
+        """
+        记录一个请求的耗时与状态码 (网络错误或超时为 None)。
+        elapsed 为 None 表示耗时不具参考性 ($batch、附件传输)，只统计限流。
+        """
+        now = time.monotonic()
+        with self._lock:
+            if status == 429:
+                self.stats["throttled"] += 1
+                self._decrease(now)
+            elif status is None or (elapsed is not None and elapsed > self.settings["target_latency"]):
+                self._decrease(now)
+            else:
+                self._successes += 1
+                if self._successes >= self.concurrency.value and self.concurrency.value < self.concurrency.maximum:
+                    self._successes = 0
+                    self.concurrency.increase()
+                    self.stats["increases"] += 1
+                    self.scheduler.set_total_limit(self.concurrency.value)
+
+    def observe_page(self, family, items, size, elapsed):
+        """记录一页列表响应：条数、字节数与读取耗时。"""
+        with self._lock:
+            control = self.pages[family]
+            if elapsed > self.settings["page_target"] or size > self.settings["max_page_kb"] * 1024:
+                control.decrease()
+            elif items >= control.value:
+                # 只有整页返回时才说明更大的页能减少往返次数
+                control.increase()
+
+    def page_size(self, family):
+        with self._lock:
+            return self.pages[family].value
+
+    def snapshot(self):
+        with self._lock:
+            return {
+                "concurrency": self.concurrency.value,
+                "max_concurrency": self.concurrency.maximum,
+                "page_sizes": {family: control.value for family, control in self.pages.items()},
+                **self.stats,
+            }
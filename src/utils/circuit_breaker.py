@@ -0,0 +1,156 @@
+import threading
+import time
+from collections import deque
+from urllib.parse import urlsplit
+
+# 熔断器默认参数：统计窗口 (秒)、窗口内最少请求数、失败率阈值、慢请求阈值 (秒) 与打开后的冷却时间 (秒)
+DEFAULT_BREAKER_SETTINGS = {
+    "window": 30.0,
+    "min_requests": 5,
+    "failure_rate": 0.5,
+    "slow_seconds": 10.0,
+    "open_seconds": 30.0,
+}
+# 路径中的资源段 -> 端点族；同一族的请求共享一个熔断器
+_FAMILIES = {
+    "calendar": "calendar", "events": "calendar", "calendarview": "calendar",
+    "todo": "tasks",
+    "messages": "mail", "mailfolders": "mail", "sendmail": "mail",
+    "$batch": "batch",
+}
+
+
+class GraphUnavailableError(RuntimeError):
+    """Graph 服务暂时不可用 (5xx、超时或熔断器打开)；读取类工具可以改为返回缓存的旧数据。"""
+
+
+class CircuitOpenError(GraphUnavailableError):
+    pass
+
+
+def parse_settings(value):
+    """解析形如 "failure_rate=0.5,open_seconds=30" 的配置。"""
+    settings = dict(DEFAULT_BREAKER_SETTINGS)
+    for part in filter(None, (value or "").split(",")):
+        name, _, number = part.partition("=")
+        name = name.strip()
+        try:
+            if name not in DEFAULT_BREAKER_SETTINGS:
+                raise ValueError
+            settings[name] = type(DEFAULT_BREAKER_SETTINGS[name])(number.strip())
+        except ValueError:
+            raise ValueError(f"M365_CIRCUIT_BREAKER 配置无效: {part}")
+    return settings
+
+
+def endpoint_family(url):
+    """按 URL 路径归类端点族，如 /me/calendar/calendarView -> calendar。"""
+    parts = [p.lower() for p in urlsplit(url).path.split("/") if p]
+    if parts and parts[0] in ("v1.0", "beta"):
+        parts = parts[1:]
+    for part in parts:
+        if part in _FAMILIES:
+            return _FAMILIES[part]
+    return parts[1] if len(parts) > 1 and parts[0] == "me" else "profile" if parts == ["me"] else "other"
+
+
+class CircuitBreaker:
+    """
+    单个端点族的熔断器：
+    - closed：正常放行，记录窗口内每个请求的成败 (5xx、网络错误与超过慢请求阈值的请求计为失败)；
+    - open：窗口内失败率超过阈值后打开，冷却期内的请求立即失败，不再等待超时；
+    - half_open：冷却期结束后只放行一个探测请求，成功则关闭，失败则重新打开。
+    """
+
+    def __init__(self, family, settings=None):
+        self.family = family
+        self.settings = dict(DEFAULT_BREAKER_SETTINGS, **(settings or {}))
+        self._lock = threading.Lock()
+        self._calls = deque()
+        self.state = "closed"
+        self._opened_at = 0.0
+        self._probing = False
+        self.stats = {"rejected": 0, "opened": 0}
+
+    def _trim(self, now):
+        while self._calls and now - self._calls[0][0] > self.settings["window"]:
+            self._calls.popleft()
+
+    def retry_in(self):
+        return max(self._opened_at + self.settings["open_seconds"] - time.monotonic(), 0.0)
+
+    def allow(self):
+        """请求开始前调用；熔断器打开时抛出 CircuitOpenError。返回是否为半开状态的探测请求。"""
+        with self._lock:
+            if self.state == "closed":
+                return False
+            if self.state == "open" and self.retry_in() <= 0:
+                self.state = "half_open"
+            if self.state == "half_open" and not self._probing:
+                self._probing = True
+                return True
+            self.stats["rejected"] += 1
+            retry_in = self.retry_in()
+        raise CircuitOpenError(
+            f"Microsoft Graph 服务 ({self.family}) 暂时不可用：近期请求大量失败或超时，"
+            f"已暂停访问，约 {max(round(retry_in), 1)} 秒后重试。"
+        )
+
+    def record(self, ok, elapsed, probe=False):
+        """请求结束后记录结果与耗时。"""
+        now = time.monotonic()
+        ok = ok and elapsed < self.settings["slow_seconds"]
+        with self._lock:
+            if probe:
+                self._probing = False
+                if ok:
+                    self.state = "closed"
+                    self._calls.clear()
+                else:
+                    self._open(now)
+                return
+            self._calls.append((now, ok))
+            self._trim(now)
+            failures = sum(1 for _, success in self._calls if not success)
+            if (self.state == "closed" and len(self._calls) >= self.settings["min_requests"]
+                    and failures / len(self._calls) >= self.settings["failure_rate"]):
+                self._open(now)
+
+    def _open(self, now):
+        self.state = "open"
+        self._opened_at = now
+        self._calls.clear()
+        self.stats["opened"] += 1
+
+    def snapshot(self):
+        with self._lock:
+            self._trim(time.monotonic())
+            return {
+                "state": self.state,
+                "recent_requests": len(self._calls),
+                "recent_failures": sum(1 for _, success in self._calls if not success),
+                "retry_in": round(self.retry_in(), 1) if self.state != "closed" else 0,
+                **self.stats,
+            }
+
+
+class CircuitBreakers:
+    """按端点族懒加载的熔断器集合。"""
+
+    def __init__(self, settings=None):
+        self.settings = settings
+        self._lock = threading.Lock()
+        self._breakers = {}
+
+    def for_url(self, url):
+        family = endpoint_family(url)
+        with self._lock:
+            breaker = self._breakers.get(family)
+            if breaker is None:
+                breaker = self._breakers[family] = CircuitBreaker(family, self.settings)
+            return breaker
+
+    def stats(self):
+        with self._lock:
+            breakers = list(self._breakers.values())
+        return {breaker.family: breaker.snapshot() for breaker in breakers}
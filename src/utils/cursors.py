@@ -0,0 +1,47 @@
+import secrets
+import threading
+import time
+from collections import OrderedDict
+
+
+class CursorStore:
+    """
+    服务端游标存储。
+    返回给模型的游标只是一个不透明的随机令牌，续取所需的状态保存在内存中，超过有效期后自动失效。
+    """
+
+    def __init__(self, ttl=900, max_entries=256):
+        self.ttl = ttl
+        self.max_entries = max_entries
+        self._entries = OrderedDict()
+        self._lock = threading.Lock()
+
+    def put(self, state):
+        """保存续取状态并返回新游标。"""
+        token = secrets.token_urlsafe(12)
+        with self._lock:
+            self._purge()
+            self._entries[token] = (time.monotonic() + self.ttl, state)
+            while len(self._entries) > self.max_entries:
+                self._entries.popitem(last=False)
+        return token
+
+    def get(self, token):
+        """读取游标对应的状态；游标未知或已过期时抛出 ValueError。"""
+        with self._lock:
+            self._purge()
+            entry = self._entries.get(token)
+            if entry is None:
+                raise ValueError(f"游标无效或已过期，请重新发起查询。收到值: {token}")
+            self._entries.move_to_end(token)
+            return entry[1]
+
+    def _purge(self):
+        now = time.monotonic()
+        expired = [token for token, (expires, _) in self._entries.items() if expires <= now]
+        for token in expired:
+            del self._entries[token]
+
+
+# 进程内共享的游标存储
+cursor_store = CursorStore()
@@ -0,0 +1,66 @@
+import re
+from html.parser import HTMLParser
+
+# 换行分隔的块级元素
+_BLOCK_TAGS = {
+    "address", "article", "blockquote", "br", "div", "dl", "dt", "dd", "footer", "form", "h1", "h2", "h3",
+    "h4", "h5", "h6", "header", "hr", "ol", "p", "pre", "section", "table", "tr", "ul",
+}
+# 内容不属于正文的元素
+_SKIP_TAGS = {"head", "script", "style", "title"}
+
+
+class _TextExtractor(HTMLParser):
+    def __init__(self):
+        super().__init__(convert_charrefs=True)
+        self.parts = []
+        self._skip = 0
+        self._pre = 0
+        self._links = []
+
+    def handle_starttag(self, tag, attrs):
+        if tag in _SKIP_TAGS:
+            self._skip += 1
+        elif tag == "pre":
+            self._pre += 1
+        elif tag == "li":
+            self.parts.append("\n- ")
+            return
+        elif tag in ("td", "th"):
+            self.parts.append("\t")
+        elif tag == "a":
+            self._links.append(dict(attrs).get("href"))
+        if tag in _BLOCK_TAGS:
+            self.parts.append("\n")
+
+    def handle_startendtag(self, tag, attrs):
+        if tag in ("br", "hr"):
+            self.parts.append("\n")
+
+    def handle_endtag(self, tag):
+        if tag in _SKIP_TAGS:
+            self._skip = max(self._skip - 1, 0)
+        elif tag == "pre":
+            self._pre = max(self._pre - 1, 0)
+        elif tag == "a" and self._links:
+            href = self._links.pop()
+            # 保留链接地址，但不重复显示文本本身就是地址的链接
+            if href and href.startswith(("http://", "https://")) and not "".join(self.parts[-1:]).strip().endswith(href):
+                self.parts.append(f" ({href})")
+        if tag in _BLOCK_TAGS:
+            self.parts.append("\n")
+
+    def handle_data(self, data):
+        if self._skip:
+            return
+        self.parts.append(data if self._pre else re.sub(r"\s+", " ", data))
+
+
+def html_to_text(html):
+    """将 HTML 邮件正文转换为纯文本：去除样式与脚本，块级元素换行，保留链接地址，合并多余空白。"""
+    parser = _TextExtractor()
+    parser.feed(html or "")
+    parser.close()
+    text = "".join(parser.parts).replace("\xa0", " ")
+    lines = [line.strip(" \t") for line in text.splitlines()]
+    return re.sub(r"\n{3,}", "\n\n", "\n".join(lines)).strip()
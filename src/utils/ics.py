@@ -0,0 +1,337 @@
+import hashlib
+import re
+from datetime import datetime, timedelta, timezone
+from zoneinfo import ZoneInfo, ZoneInfoNotFoundError
+
+from .recurrence import LOCAL_TZ, WEEKDAYS, parse_local
+
+PRODID = "-//Microsoft-Calendar-MCP//ICS//ZH"
+LOCAL_TIMEZONE_NAME = "China Standard Time"
+# RFC 5545：内容行超过 75 个字节时折行
+MAX_LINE_OCTETS = 75
+
+ICS_WEEKDAYS = ["MO", "TU", "WE", "TH", "FR", "SA", "SU"]
+# RRULE 中 BYDAY 的序号 -> Graph relativeMonthly/Yearly 的 index
+_ORDINALS = {1: "first", 2: "second", 3: "third", 4: "fourth", -1: "last"}
+# Outlook 导出的文件常用 Windows 时区名作为 TZID
+WINDOWS_ZONES = {
+    "China Standard Time": "Asia/Shanghai",
+    "Taipei Standard Time": "Asia/Taipei",
+    "Tokyo Standard Time": "Asia/Tokyo",
+    "Singapore Standard Time": "Asia/Singapore",
+    "Pacific Standard Time": "America/Los_Angeles",
+    "Eastern Standard Time": "America/New_York",
+    "GMT Standard Time": "Europe/London",
+    "W. Europe Standard Time": "Europe/Berlin",
+    "UTC": "UTC",
+}
+_DURATION_RE = re.compile(r"^([+-])?P(?:(\d+)W)?(?:(\d+)D)?(?:T(?:(\d+)H)?(?:(\d+)M)?(?:(\d+)S)?)?$")
+
+
+# --- 文本与行 ---
+
+def escape_text(value):
+    return (value.replace("\\", "\\\\").replace(";", "\\;").replace(",", "\\,")
+            .replace("\r\n", "\\n").replace("\n", "\\n"))
+
+
+def unescape_text(value):
+    return re.sub(r"\\([\\;,nN])", lambda m: "\n" if m.group(1) in "nN" else m.group(1), value)
+
+
+def fold(line):
+    """按 UTF-8 字节数折行，不在多字节字符中间断开。"""
+    if len(line.encode("utf-8")) <= MAX_LINE_OCTETS:
+        return line
+    parts, current, size = [], [], 0
+    for char in line:
+        width = len(char.encode("utf-8"))
+        # 续行以一个空格开头，占用一个字节
+        if size + width > MAX_LINE_OCTETS - (1 if parts else 0):
+            parts.append("".join(current))
+            current, size = [], 0
+        current.append(char)
+        size += width
+    parts.append("".join(current))
+    return "\r\n ".join(parts)
+
+
+def iter_lines(lines):
+    """逐行展开折行 (以空格或制表符开头的行接续上一行)。"""
+    current = None
+    for raw in lines:
+        line = raw.rstrip("\r\n")
+        if line[:1] in (" ", "\t") and current is not None:
+            current += line[1:]
+            continue
+        if current:
+            yield current
+        current = line
+    if current:
+        yield current
+
+
+def parse_property(line):
+    """解析内容行，返回 (名称, 参数, 值)；参数值中的冒号在引号内时不作为分隔符。"""
+    in_quotes = False
+    for i, char in enumerate(line):
+        if char == '"':
+            in_quotes = not in_quotes
+        elif char == ":" and not in_quotes:
+            head, value = line[:i], line[i + 1:]
+            break
+    else:
+        raise ValueError(f"无效的 iCalendar 内容行: {line[:40]}")
+    name, *raw_params = head.split(";")
+    params = {}
+    for param in raw_params:
+        key, _, val = param.partition("=")
+        params[key.upper()] = val.strip('"')
+    return name.upper(), params, value
+
+
+# --- 导出 ---
+
+def _utc_stamp(moment):
+    return moment.astimezone(timezone.utc).strftime("%Y%m%dT%H%M%SZ")
+
+
+def _local_to_utc(value):
+    return _utc_stamp(parse_local(value).replace(tzinfo=LOCAL_TZ))
+
+
+def vevent_lines(event):
+    """将 Graph 事件 (本地时间) 转换为 VEVENT 内容行 (未折行)。"""
+    lines = ["BEGIN:VEVENT", f"UID:{event.get('iCalUId') or event.get('id')}"]
+    modified = event.get("lastModifiedDateTime")
+    stamp = datetime.fromisoformat(modified.replace("Z", "+00:00")) if modified else datetime.now(timezone.utc)
+    lines.append(f"DTSTAMP:{_utc_stamp(stamp)}")
+    start, end = event["start"]["dateTime"], event["end"]["dateTime"]
+    if event.get("isAllDay"):
+        lines.append(f"DTSTART;VALUE=DATE:{start[:10].replace('-', '')}")
+        lines.append(f"DTEND;VALUE=DATE:{end[:10].replace('-', '')}")
+    else:
+        lines.append(f"DTSTART:{_local_to_utc(start)}")
+        lines.append(f"DTEND:{_local_to_utc(end)}")
+    lines.append(f"SUMMARY:{escape_text(event.get('subject') or '')}")
+    location = (event.get("location") or {}).get("displayName")
+    if location:
+        lines.append(f"LOCATION:{escape_text(location)}")
+    body = event.get("body") or {}
+    if event.get("bodyPreview"):
+        lines.append(f"DESCRIPTION:{escape_text(event['bodyPreview'])}")
+    if body.get("content") and (body.get("contentType") or "").lower() == "html":
+        # 与 Outlook 导出一致：完整 HTML 正文放在 X-ALT-DESC 中
+        lines.append(f"X-ALT-DESC;FMTTYPE=text/html:{escape_text(body['content'])}")
+    if event.get("categories"):
+        lines.append("CATEGORIES:" + ",".join(escape_text(c) for c in event["categories"]))
+    if event.get("showAs") == "free":
+        lines.append("TRANSP:TRANSPARENT")
+    if event.get("sensitivity") in ("private", "confidential"):
+        lines.append("CLASS:PRIVATE" if event["sensitivity"] == "private" else "CLASS:CONFIDENTIAL")
+    if event.get("isReminderOn"):
+        minutes = event.get("reminderMinutesBeforeStart") or 0
+        lines += ["BEGIN:VALARM", "ACTION:DISPLAY", "DESCRIPTION:Reminder",
+                  f"TRIGGER:-PT{minutes}M", "END:VALARM"]
+    lines.append("END:VEVENT")
+    return lines
+
+
+def write_calendar(f, events):
+    """将事件逐个写入文本文件 f (需以 newline='' 打开)，返回写入的事件数。"""
+    f.write(f"BEGIN:VCALENDAR\r\nVERSION:2.0\r\nPRODID:{PRODID}\r\nCALSCALE:GREGORIAN\r\n")
+    count = 0
+    for event in events:
+        f.write("".join(fold(line) + "\r\n" for line in vevent_lines(event)))
+        count += 1
+    f.write("END:VCALENDAR\r\n")
+    return count
+
+
+# --- 导入 ---
+
+def iter_vevents(lines):
+    """
+    流式读取 VEVENT，逐个产出 (序号, 属性)。
+    属性为 {名称: [(参数, 值), ...]}，VALARM 子组件以 {"VALARM": [属性, ...]} 形式附带。
+    """
+    index, event, alarm = 0, None, None
+    for line in iter_lines(lines):
+        try:
+            name, params, value = parse_property(line)
+        except ValueError:
+            # 跳过无法解析的行，不影响其余事件
+            continue
+        if name == "BEGIN" and value.upper() == "VEVENT":
+            event = {}
+        elif event is None:
+            continue
+        elif name == "BEGIN" and value.upper() == "VALARM":
+            alarm = {}
+        elif name == "END" and value.upper() == "VALARM":
+            event.setdefault("VALARM", []).append(alarm)
+            alarm = None
+        elif name == "END" and value.upper() == "VEVENT":
+            index += 1
+            yield index, event
+            event = None
+        else:
+            (alarm if alarm is not None else event).setdefault(name, []).append((params, value))
+
+
+def first(props, name, default=None):
+    values = props.get(name)
+    return values[0] if values else (None, default)
+
+
+def _zone(tzid):
+    try:
+        return ZoneInfo(WINDOWS_ZONES.get(tzid, tzid))
+    except (ZoneInfoNotFoundError, ValueError):
+        raise ValueError(f"不支持的时区: {tzid}")
+
+
+def parse_datetime(params, value):
+    """解析 DTSTART/DTEND 等时间，返回 (本地时间, 是否为全天日期)。"""
+    try:
+        if params.get("VALUE") == "DATE" or len(value) == 8:
+            return datetime.strptime(value[:8], "%Y%m%d"), True
+        moment = datetime.strptime(value.rstrip("Z")[:15], "%Y%m%dT%H%M%S")
+    except ValueError:
+        raise ValueError(f"无效的时间值: {value}")
+    if value.endswith("Z"):
+        moment = moment.replace(tzinfo=timezone.utc)
+    elif params.get("TZID"):
+        moment = moment.replace(tzinfo=_zone(params["TZID"]))
+    else:
+        # 浮动时间按本地时间处理
+        return moment, False
+    return moment.astimezone(LOCAL_TZ).replace(tzinfo=None), False
+
+
+def parse_duration(value):
+    match = _DURATION_RE.match(value)
+    if not match:
+        raise ValueError(f"无效的持续时间: {value}")
+    sign, weeks, days, hours, minutes, seconds = match.groups()
+    delta = timedelta(weeks=int(weeks or 0), days=int(days or 0), hours=int(hours or 0),
+                      minutes=int(minutes or 0), seconds=int(seconds or 0))
+    return -delta if sign == "-" else delta
+
+
+def _recurrence(rule, start):
+    """将常见的 RRULE 转换为 Graph 的 patternedRecurrence。"""
+    parts = dict(part.split("=", 1) for part in rule.upper().split(";") if "=" in part)
+    freq = parts.get("FREQ")
+    pattern = {"interval": int(parts.get("INTERVAL", 1))}
+    by_day = [day for day in parts.get("BYDAY", "").split(",") if day]
+
+    def weekday(code):
+        if code[-2:] not in ICS_WEEKDAYS:
+            raise ValueError(f"无效的 BYDAY: {code}")
+        return WEEKDAYS[ICS_WEEKDAYS.index(code[-2:])]
+
+    def relative(kind):
+        if len({day[:-2] for day in by_day}) > 1:
+            # Graph 的 relativeMonthly/Yearly 只有一个 index，无法表示如 1MO,3MO 的多个序号
+            raise ValueError(f"不支持 BYDAY 中包含多个不同的序号: {rule}")
+        ordinal = by_day[0][:-2] or parts.get("BYSETPOS")
+        if not ordinal or int(ordinal) not in _ORDINALS:
+            raise ValueError(f"不支持的循环规则: {rule}")
+        pattern.update(type=kind, daysOfWeek=[weekday(day) for day in by_day], index=_ORDINALS[int(ordinal)])
+
+    if freq == "DAILY":
+        pattern["type"] = "daily"
+    elif freq == "WEEKLY":
+        pattern.update(type="weekly", daysOfWeek=[weekday(day) for day in by_day] or [WEEKDAYS[start.weekday()]],
+                       firstDayOfWeek=WEEKDAYS[ICS_WEEKDAYS.index(parts.get("WKST", "SU"))])
+    elif freq in ("MONTHLY", "YEARLY"):
+        prefix = "Monthly" if freq == "MONTHLY" else "Yearly"
+        if freq == "YEARLY":
+            pattern["month"] = int(parts.get("BYMONTH", start.month))
+        if by_day:
+            relative("relative" + prefix)
+        else:
+            pattern.update(type="absolute" + prefix, dayOfMonth=int(parts.get("BYMONTHDAY", start.day)))
+    else:
+        raise ValueError(f"不支持的循环规则: {rule}")
+
+    recurrence_range = {"startDate": start.date().isoformat(), "recurrenceTimeZone": LOCAL_TIMEZONE_NAME}
+    if "COUNT" in parts:
+        recurrence_range.update(type="numbered", numberOfOccurrences=int(parts["COUNT"]))
+    elif "UNTIL" in parts:
+        until, _ = parse_datetime({}, parts["UNTIL"])
+        recurrence_range.update(type="endDate", endDate=until.date().isoformat())
+    else:
+        recurrence_range["type"] = "noEnd"
+    return {"pattern": pattern, "range": recurrence_range}
+
+
+def excluded_dates(props):
+    """循环事件的 EXDATE -> [(本地时间, 是否为全天日期)]；非循环事件返回空列表。"""
+    if not first(props, "RRULE")[1]:
+        return []
+    return [
+        parse_datetime(params, part.strip())
+        for params, value in props.get("EXDATE", [])
+        for part in value.split(",") if part.strip()
+    ]
+
+
+def vevent_to_graph(props):
+    """将 VEVENT 属性转换为 Graph 创建事件的请求体 (本地时间)；内容无效或不受支持时抛出 ValueError。"""
+    if "RECURRENCE-ID" in props:
+        raise ValueError("暂不支持循环事件的例外实例")
+    params, value = first(props, "DTSTART")
+    if value is None:
+        raise ValueError("缺少 DTSTART")
+    start, all_day = parse_datetime(params, value)
+    params, value = first(props, "DTEND")
+    if value is not None:
+        end, _ = parse_datetime(params, value)
+    elif "DURATION" in props:
+        end = start + parse_duration(first(props, "DURATION")[1])
+    else:
+        end = start + timedelta(days=1) if all_day else start
+    if end < start:
+        raise ValueError("DTEND 早于 DTSTART")
+
+    payload = {
+        "subject": unescape_text(first(props, "SUMMARY", "")[1]),
+        "start": {"dateTime": start.isoformat(), "timeZone": LOCAL_TIMEZONE_NAME},
+        "end": {"dateTime": end.isoformat(), "timeZone": LOCAL_TIMEZONE_NAME},
+        "isAllDay": all_day,
+    }
+    html = next((v for p, v in props.get("X-ALT-DESC", []) if p.get("FMTTYPE", "").lower() == "text/html"), None)
+    description = first(props, "DESCRIPTION")[1]
+    if html:
+        payload["body"] = {"contentType": "HTML", "content": unescape_text(html)}
+    elif description:
+        payload["body"] = {"contentType": "text", "content": unescape_text(description)}
+    location = first(props, "LOCATION")[1]
+    if location:
+        payload["location"] = {"displayName": unescape_text(location)}
+    categories = [c for _, v in props.get("CATEGORIES", []) for c in re.split(r"(?<!\\),", v) if c]
+    if categories:
+        payload["categories"] = [unescape_text(c) for c in categories]
+    if first(props, "TRANSP")[1] == "TRANSPARENT":
+        payload["showAs"] = "free"
+    sensitivity = {"PRIVATE": "private", "CONFIDENTIAL": "confidential"}.get(first(props, "CLASS")[1])
+    if sensitivity:
+        payload["sensitivity"] = sensitivity
+
+    triggers = [first(alarm, "TRIGGER")[1] for alarm in props.get("VALARM", [])]
+    trigger = next((t for t in triggers if t and t.lstrip("+-").startswith("P")), None)
+    payload["isReminderOn"] = trigger is not None
+    if trigger:
+        payload["reminderMinutesBeforeStart"] = max(int(-parse_duration(trigger).total_seconds() // 60), 0)
+
+    rule = first(props, "RRULE")[1]
+    if rule:
+        payload["recurrence"] = _recurrence(rule, start)
+
+    uid = first(props, "UID")[1]
+    if uid:
+        # 相同事件重复提交 (如重试) 时由服务器去重
+        payload["transactionId"] = hashlib.sha1(f"{uid}|{start.isoformat()}".encode("utf-8")).hexdigest()
+    return payload
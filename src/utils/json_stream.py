@@ -0,0 +1,192 @@
+import re
+
+# 优先使用 orjson 作为 JSON 后端 (可选依赖)，否则回退到标准库
+try:
+    import orjson
+
+    def loads(data):
+        return orjson.loads(data)
+
+    def dumps(obj):
+        return orjson.dumps(obj).decode("utf-8")
+
+    BACKEND = "orjson"
+except ImportError:
+    import json
+
+    def loads(data):
+        return json.loads(data)
+
+    def dumps(obj):
+        return json.dumps(obj, ensure_ascii=False, separators=(",", ":"))
+
+    BACKEND = "json"
+
+_WHITESPACE = b" \t\r\n"
+# 扫描复合值时只需关注的字符：引号、反斜杠与括号
+_STRUCTURAL = re.compile(rb'["\\{}\[\]]')
+_STRING_SPECIAL = re.compile(rb'["\\]')
+_SCALAR_END = re.compile(rb'[,}\]\s]')
+
+
+class ODataValueParser:
+    """
+    增量解析 OData 集合响应。
+    逐块喂入字节，`value` 数组中的元素在完整到达后立即解码产出，
+    其余顶层字段 (如 @odata.nextLink) 收集到 `meta` 中。
+    """
+
+    def __init__(self):
+        self.meta = {}
+        self._buf = bytearray()
+        self._pos = 0
+        self._state = "start"
+        self._key = None
+        # 跨数据块保存当前值的扫描进度，避免对大元素重复扫描
+        self._scan = None
+
+    def feed(self, chunk):
+        """喂入一段字节，返回本次解析出的完整元素列表。"""
+        self._buf += chunk
+        items = []
+        self._parse(items)
+        if self._pos > 65536:
+            del self._buf[:self._pos]
+            if self._scan:
+                start, i, depth, in_str = self._scan
+                self._scan = (start - self._pos, i - self._pos, depth, in_str)
+            self._pos = 0
+        return items
+
+    def close(self):
+        if self._state != "done":
+            raise ValueError("Graph 响应 JSON 不完整或格式无效")
+
+    def _skip_ws(self, pos):
+        buf = self._buf
+        n = len(buf)
+        while pos < n and buf[pos] in _WHITESPACE:
+            pos += 1
+        return pos
+
+    def _expect(self, pos, char):
+        if self._buf[pos] != ord(char):
+            raise ValueError(f"Graph 响应 JSON 格式无效：位置 {pos} 处应为 '{char}'")
+
+    def _parse(self, items):
+        buf = self._buf
+        while self._state != "done":
+            pos = self._skip_ws(self._pos)
+            if pos >= len(buf):
+                self._pos = pos
+                return
+            state = self._state
+            char = buf[pos]
+
+            if state == "start":
+                self._expect(pos, "{")
+                self._pos, self._state = pos + 1, "key"
+            elif state == "key":
+                if char == ord("}"):
+                    self._pos, self._state = pos + 1, "done"
+                    continue
+                end = self._value_end(pos)
+                if end < 0:
+                    return
+                self._key = loads(bytes(buf[pos:end]))
+                self._pos, self._state = end, "colon"
+            elif state == "colon":
+                self._expect(pos, ":")
+                self._pos, self._state = pos + 1, "value"
+            elif state == "value":
+                if self._key == "value" and char == ord("["):
+                    self._pos, self._state = pos + 1, "item"
+                    continue
+                end = self._value_end(pos)
+                if end < 0:
+                    return
+                self.meta[self._key] = loads(bytes(buf[pos:end]))
+                self._pos, self._state = end, "next_key"
+            elif state == "next_key":
+                if char == ord(","):
+                    self._pos, self._state = pos + 1, "key"
+                else:
+                    self._expect(pos, "}")
+                    self._pos, self._state = pos + 1, "done"
+            elif state == "item":
+                if char == ord("]"):
+                    self._pos, self._state = pos + 1, "next_key"
+                    continue
+                end = self._value_end(pos)
+                if end < 0:
+                    return
+                items.append(loads(bytes(buf[pos:end])))
+                self._pos, self._state = end, "next_item"
+            elif state == "next_item":
+                if char == ord(","):
+                    self._pos, self._state = pos + 1, "item"
+                else:
+                    self._expect(pos, "]")
+                    self._pos, self._state = pos + 1, "next_key"
+
+    def _value_end(self, pos):
+        """返回从 pos 开始的完整 JSON 值的结束位置；数据不足时返回 -1。"""
+        buf = self._buf
+        char = buf[pos]
+
+        if char == ord('"'):
+            i = self._scan[1] if self._scan else pos + 1
+            while True:
+                m = _STRING_SPECIAL.search(buf, i)
+                if not m:
+                    self._scan = (pos, max(i, len(buf)), 0, True)
+                    return -1
+                i = m.start()
+                if buf[i] == ord("\\"):
+                    i += 2
+                    continue
+                self._scan = None
+                return i + 1
+
+        if char in b"{[":
+            if self._scan:
+                _, i, depth, in_str = self._scan
+            else:
+                i, depth, in_str = pos, 0, False
+            while True:
+                m = (_STRING_SPECIAL if in_str else _STRUCTURAL).search(buf, i)
+                if not m:
+                    self._scan = (pos, max(i, len(buf)), depth, in_str)
+                    return -1
+                i = m.start()
+                c = buf[i]
+                if c == ord("\\"):
+                    i += 2
+                    continue
+                if c == ord('"'):
+                    in_str = not in_str
+                elif c in b"{[":
+                    depth += 1
+                elif c in b"}]":
+                    depth -= 1
+                    if depth == 0:
+                        self._scan = None
+                        return i + 1
+                i += 1
+
+        # 标量 (数字 / true / false / null)：必须看到终止符才能确定结束
+        m = _SCALAR_END.search(buf, pos)
+        return m.start() if m else -1
+
+
+def iter_odata_values(chunks, meta=None):
+    """
+    从字节块迭代器中逐项产出 OData `value` 数组元素。
+    解析结束后，其余顶层字段写入 `meta` 字典 (如果提供)。
+    """
+    parser = ODataValueParser()
+    for chunk in chunks:
+        yield from parser.feed(chunk)
+    parser.close()
+    if meta is not None:
+        meta.update(parser.meta)
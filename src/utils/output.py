@@ -0,0 +1,163 @@
+import hashlib
+from datetime import datetime, timedelta
+
+from .json_stream import dumps
+from .cursors import cursor_store
+
+OUTPUT_MODES = ["full", "compact", "table"]
+
+# 精简模式下预览类字段保留的最大字符数
+COMPACT_PREVIEW_CHARS = 80
+PREVIEW_FIELDS = ("body", "body_preview")
+
+# getSchedule 返回的 availabilityView 中每个字符的含义
+AVAILABILITY_STATUS = {
+    "0": "free",
+    "1": "tentative",
+    "2": "busy",
+    "3": "oof",
+    "4": "workingElsewhere",
+}
+
+
+def truncate_text(text, limit):
+    if not isinstance(text, str) or len(text) <= limit:
+        return text
+    return text[:limit] + "…"
+
+
+def compact_item(item, fields=None):
+    """仅保留指定字段，去掉空值，并截断预览文本。"""
+    result = {}
+    for key in fields or item.keys():
+        value = item.get(key)
+        if value is None or value == "" or value == []:
+            continue
+        if key in PREVIEW_FIELDS:
+            value = truncate_text(value, COMPACT_PREVIEW_CHARS)
+        result[key] = value
+    return result
+
+
+def to_table(items, fields=None):
+    """将字典列表转换为列式表格：列名只出现一次。"""
+    columns = list(fields) if fields else []
+    if not fields:
+        for item in items:
+            for key in item:
+                if key not in columns:
+                    columns.append(key)
+    return {"columns": columns, "rows": [[item.get(col) for col in columns] for item in items]}
+
+
+def split_by_budget(items, max_bytes):
+    """
+    按顺序保留序列化后总大小不超过 max_bytes 的元素，返回 (保留部分, 剩余部分)。
+    即使第一个元素超出预算也会保留它，保证续取总能向前推进。
+    """
+    kept, used = [], 2
+    for index, item in enumerate(items):
+        size = len(dumps(item).encode("utf-8")) + 1
+        if kept and used + size > max_bytes:
+            return kept, items[index:]
+        kept.append(item)
+        used += size
+    return kept, []
+
+
+def summarize_availability(view, start, interval):
+    """把 availabilityView 字符串按游程压缩为连续时段列表。"""
+    begin = datetime.fromisoformat(start.replace('Z', '+00:00'))
+    runs = []
+    i = 0
+    while i < len(view):
+        j = i
+        while j < len(view) and view[j] == view[i]:
+            j += 1
+        runs.append({
+            "start": (begin + timedelta(minutes=i * interval)).isoformat(),
+            "end": (begin + timedelta(minutes=j * interval)).isoformat(),
+            "status": AVAILABILITY_STATUS.get(view[i], view[i]),
+        })
+        i = j
+    return runs
+
+
+def schedule_slots(schedule_result, start, interval):
+    """把 getSchedule 的原始响应展平为非空闲时段列表 (未列出的时间均为空闲)。"""
+    return [
+        {"schedule": item.get("scheduleId"), **run}
+        for item in schedule_result.get("value", [])
+        for run in summarize_availability(item.get("availabilityView", ""), start, interval)
+        if run["status"] != "free"
+    ]
+
+
+def query_fingerprint(tool, query):
+    """计算查询指纹：同一工具、同一组查询参数得到相同的指纹。"""
+    raw = dumps([tool, sorted((key, value) for key, value in query.items() if value is not None)])
+    return hashlib.sha1(raw.encode("utf-8")).hexdigest()
+
+
+def render(items, tool, mode="full", fields=None, max_bytes=None, next_link=None, query=None):
+    """
+    按输出模式整形列表结果。超出字节预算的剩余部分，以及 Graph 返回的 @odata.nextLink，
+    都保存在服务端游标中，由同一工具通过 cursor 参数续取。
+    完整/精简模式且没有更多数据时返回列表；表格模式或存在更多数据时返回包含 next_cursor 的对象。
+    """
+    query = query or {}
+    state = {
+        "tool": tool,
+        "mode": mode,
+        "fields": fields,
+        "max_bytes": max_bytes,
+        "next_link": next_link,
+        "query": query,
+        "fingerprint": query_fingerprint(tool, query),
+    }
+    return _page(_shape(items, mode, fields), state)
+
+
+def resume(cursor, tool, fetch_page=None, **query):
+    """
+    根据游标返回下一段结果。
+    先返回上次因预算留下的剩余元素；耗尽后调用 fetch_page(next_link) 获取 Graph 的下一页，
+    它应返回 (元素列表, 新的 nextLink)。显式传入的查询参数必须与游标创建时一致。
+    """
+    state = cursor_store.get(cursor)
+    if state["tool"] != tool:
+        raise ValueError(f"游标属于工具 '{state['tool']}'，不能用于 '{tool}'。")
+    merged = {**state["query"], **{key: value for key, value in query.items() if value is not None}}
+    if query_fingerprint(tool, merged) != state["fingerprint"]:
+        raise ValueError("游标与本次查询参数不一致，请使用相同的参数或重新发起查询。")
+
+    items, next_link = state["items"], state["next_link"]
+    if not items and next_link and fetch_page:
+        items, next_link = fetch_page(next_link)
+        items = _shape(items, state["mode"], state["fields"])
+    return _page(items, {**state, "next_link": next_link})
+
+
+def _shape(items, mode, fields):
+    if mode != "full":
+        return [compact_item(item, fields) for item in items]
+    if fields:
+        return [{key: item.get(key) for key in fields} for item in items]
+    return items
+
+
+def _page(items, state):
+    rest = []
+    if state["max_bytes"]:
+        items, rest = split_by_budget(items, state["max_bytes"])
+    has_more = rest or state["next_link"]
+    next_cursor = cursor_store.put({**state, "items": rest}) if has_more else None
+
+    if state["mode"] == "table":
+        result = to_table(items, state["fields"])
+    elif next_cursor:
+        result = {"items": items}
+    else:
+        return items
+    result["next_cursor"] = next_cursor
+    return result
@@ -0,0 +1,226 @@
+import cProfile
+import functools
+import json
+import logging
+import os
+import random
+import re
+import sys
+import threading
+import time
+from collections import Counter
+from datetime import datetime
+
+logger = logging.getLogger(__name__)
+
+PROFILE_MODES = ["off", "cprofile", "sampling"]
+# 采样分析的默认间隔 (毫秒)
+DEFAULT_SAMPLE_INTERVAL_MS = 5
+# 目录中最多保留的 profile 组数 (每次调用一组)，超出时删除最旧的
+DEFAULT_KEEP = 200
+
+
+class ProfilerConfig:
+    """性能分析配置：模式、输出目录、限定的工具、采样率与文件保留数量；可在运行时修改。"""
+
+    def __init__(self):
+        self.lock = threading.Lock()
+        self.mode = "off"
+        self.directory = "profiles"
+        self.tools = set()
+        self.rate = 1.0
+        self.interval = DEFAULT_SAMPLE_INTERVAL_MS / 1000
+        self.keep = DEFAULT_KEEP
+        self.written = 0
+
+    def load_env(self):
+        self.update(
+            mode=os.getenv("M365_PROFILE", "off"),
+            directory=os.getenv("M365_PROFILE_DIR") or "profiles",
+            tools=[t.strip() for t in os.getenv("M365_PROFILE_TOOLS", "").split(",") if t.strip()],
+            rate=float(os.getenv("M365_PROFILE_RATE", "1")),
+            interval_ms=float(os.getenv("M365_PROFILE_INTERVAL_MS", DEFAULT_SAMPLE_INTERVAL_MS)),
+            keep=int(os.getenv("M365_PROFILE_KEEP", DEFAULT_KEEP)),
+        )
+
+    def update(self, mode=None, directory=None, tools=None, rate=None, interval_ms=None, keep=None):
+        if mode is not None and mode not in PROFILE_MODES:
+            raise ValueError(f"无效的性能分析模式: {mode}。必须是以下之一: {', '.join(PROFILE_MODES)}")
+        if rate is not None and not 0 <= rate <= 1:
+            raise ValueError("采样率必须在 0 到 1 之间")
+        with self.lock:
+            if mode is not None:
+                self.mode = mode
+            if directory is not None:
+                self.directory = directory
+            if tools is not None:
+                self.tools = set(tools)
+            if rate is not None:
+                self.rate = rate
+            if interval_ms is not None:
+                self.interval = max(interval_ms, 0.5) / 1000
+            if keep is not None:
+                self.keep = max(keep, 1)
+
+    def should_profile(self, tool):
+        if self.mode == "off" or (self.tools and tool not in self.tools):
+            return False
+        return self.rate >= 1 or random.random() < self.rate
+
+    def status(self):
+        with self.lock:
+            return {
+                "mode": self.mode,
+                "directory": os.path.abspath(self.directory),
+                "tools": sorted(self.tools) or "all",
+                "rate": self.rate,
+                "interval_ms": self.interval * 1000,
+                "keep": self.keep,
+                "written": self.written,
+            }
+
+
+config = ProfilerConfig()
+# 确定性分析器在进程内同一时间只能有一个处于启用状态
+_cprofile_lock = threading.Lock()
+
+
+class StackSampler:
+    """在后台线程中定期采样目标线程的调用栈 (开销与调用次数无关，适合长期开启)。"""
+
+    def __init__(self, thread_id, interval):
+        self.thread_id = thread_id
+        self.interval = interval
+        self.stacks = Counter()
+        self._stop = threading.Event()
+        self._thread = threading.Thread(target=self._run, name="m365-profiler", daemon=True)
+
+    def __enter__(self):
+        self.started = time.perf_counter()
+        self._thread.start()
+        return self
+
+    def __exit__(self, *exc):
+        self._stop.set()
+        self._thread.join()
+        self.elapsed = time.perf_counter() - self.started
+
+    def _run(self):
+        while not self._stop.wait(self.interval):
+            frame = sys._current_frames().get(self.thread_id)
+            stack = []
+            while frame is not None:
+                code = frame.f_code
+                stack.append((code.co_name, code.co_filename, code.co_firstlineno))
+                frame = frame.f_back
+            if stack:
+                self.stacks[tuple(reversed(stack))] += 1
+
+    def folded(self):
+        """火焰图工具 (flamegraph.pl、speedscope 等) 通用的折叠栈格式。"""
+        return "".join(
+            ";".join(f"{name} ({os.path.basename(path)}:{line})" for name, path, line in stack) + f" {count}\n"
+            for stack, count in self.stacks.items()
+        )
+
+    def speedscope(self, name):
+        """speedscope 的 sampled profile 格式。"""
+        frames, index, samples = [], {}, []
+        for stack in self.stacks:
+            sample = []
+            for frame in stack:
+                if frame not in index:
+                    index[frame] = len(frames)
+                    frames.append({"name": frame[0], "file": frame[1], "line": frame[2]})
+                sample.append(index[frame])
+            samples.append(sample)
+        unit = self.interval * 1000
+        weights = [count * unit for count in self.stacks.values()]
+        return {
+            "$schema": "https://www.speedscope.app/file-format-schema.json",
+            "shared": {"frames": frames},
+            "profiles": [{
+                "type": "sampled", "name": name, "unit": "milliseconds",
+                "startValue": 0, "endValue": sum(weights), "samples": samples, "weights": weights,
+            }],
+            "name": name,
+            "exporter": "m365-mcp",
+        }
+
+
+def _output_path(tool):
+    os.makedirs(config.directory, exist_ok=True)
+    stamp = datetime.now().strftime("%Y%m%d-%H%M%S-%f")
+    return os.path.join(config.directory, f"{stamp}-{tool}")
+
+
+_PROFILE_FILE_RE = re.compile(r"^(\d{8}-\d{6}-\d{6}-[\w-]+)\.(?:pstats|speedscope\.json|folded)$")
+
+
+def _rotate():
+    """只保留最新的 keep 组 profile 文件。"""
+    try:
+        entries = [os.path.join(config.directory, name) for name in os.listdir(config.directory)]
+    except OSError:
+        return
+    # 同一次调用的多个文件共享 "时间戳-工具名" 前缀，时间戳在前，按名称排序即按时间排序；
+    # 目录中不是本模块生成的文件一律不动
+    groups = {}
+    for path in entries:
+        match = _PROFILE_FILE_RE.match(os.path.basename(path))
+        if match:
+            groups.setdefault(match.group(1), []).append(path)
+    for prefix in sorted(groups)[:-config.keep]:
+        for path in groups[prefix]:
+            try:
+                os.remove(path)
+            except OSError:
+                pass
+
+
+def _write(tool, profiler=None, sampler=None):
+    try:
+        base = _output_path(tool)
+        if profiler is not None:
+            profiler.dump_stats(base + ".pstats")
+        if sampler is not None:
+            with open(base + ".speedscope.json", "w", encoding="utf-8") as f:
+                json.dump(sampler.speedscope(tool), f)
+            with open(base + ".folded", "w", encoding="utf-8") as f:
+                f.write(sampler.folded())
+        with config.lock:
+            config.written += 1
+        _rotate()
+    except OSError as e:
+        logger.warning("写入性能分析文件失败：%s", e)
+
+
+def profiled(fn, name=None):
+    """包装工具处理函数：按配置对单次调用进行确定性 (cProfile) 或采样分析。关闭时几乎没有开销。"""
+    tool = name or fn.__name__
+
+    @functools.wraps(fn)
+    def wrapper(*args, **kwargs):
+        if not config.should_profile(tool):
+            return fn(*args, **kwargs)
+        if config.mode == "cprofile":
+            if not _cprofile_lock.acquire(blocking=False):
+                # 其他调用正在被分析：跳过本次，而不是让调用排队
+                return fn(*args, **kwargs)
+            profiler = cProfile.Profile()
+            try:
+                return profiler.runcall(fn, *args, **kwargs)
+            finally:
+                _cprofile_lock.release()
+                _write(tool, profiler=profiler)
+        sampler = StackSampler(threading.get_ident(), config.interval)
+        try:
+            with sampler:
+                return fn(*args, **kwargs)
+        finally:
+            _write(tool, sampler=sampler)
+
+    return wrapper
+
+
+config.load_env()
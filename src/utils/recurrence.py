@@ -0,0 +1,151 @@
+import calendar
+from datetime import date, datetime, timedelta, timezone
+
+WEEKDAYS = ["monday", "tuesday", "wednesday", "thursday", "friday", "saturday", "sunday"]
+WEEK_INDEXES = {"first": 0, "second": 1, "third": 2, "fourth": 3, "last": -1}
+
+# 服务器统一使用中国标准时间 (UTC+8，无夏令时)
+LOCAL_TZ = timezone(timedelta(hours=8))
+
+
+def parse_local(value):
+    """解析 Graph 返回的本地时间字符串 (可能带 7 位小数秒)，精确到秒。"""
+    return datetime.fromisoformat(value[:19])
+
+
+def _month_day(year, month, day):
+    # 当月天数不足时落在月末 (与 Outlook 的行为一致)
+    return date(year, month, min(day, calendar.monthrange(year, month)[1]))
+
+
+def _relative_day(year, month, days_of_week, index):
+    """返回当月中属于 days_of_week 的第 index 个日期 (index 为 -1 表示最后一个)。"""
+    weekdays = {WEEKDAYS.index(d.lower()) for d in days_of_week}
+    matches = [
+        date(year, month, day)
+        for day in range(1, calendar.monthrange(year, month)[1] + 1)
+        if date(year, month, day).weekday() in weekdays
+    ]
+    position = WEEK_INDEXES.get((index or "first").lower(), 0)
+    if position >= len(matches):
+        return None
+    return matches[position]
+
+
+def _candidates(pattern, start):
+    """按模式产出单调递增的候选日期 (可能早于开始日期，由调用方过滤)。"""
+    kind = pattern.get("type")
+    interval = max(pattern.get("interval") or 1, 1)
+    days_of_week = pattern.get("daysOfWeek") or [WEEKDAYS[start.weekday()]]
+
+    if kind == "daily":
+        current = start
+        while True:
+            yield current
+            current += timedelta(days=interval)
+
+    elif kind == "weekly":
+        first_day = WEEKDAYS.index((pattern.get("firstDayOfWeek") or "sunday").lower())
+        offsets = sorted((WEEKDAYS.index(d.lower()) - first_day) % 7 for d in days_of_week)
+        week = start - timedelta(days=(start.weekday() - first_day) % 7)
+        while True:
+            for offset in offsets:
+                yield week + timedelta(days=offset)
+            week += timedelta(weeks=interval)
+
+    elif kind in ("absoluteMonthly", "relativeMonthly"):
+        year, month = start.year, start.month
+        while True:
+            if kind == "absoluteMonthly":
+                yield _month_day(year, month, pattern.get("dayOfMonth") or start.day)
+            else:
+                day = _relative_day(year, month, days_of_week, pattern.get("index"))
+                if day:
+                    yield day
+            month += interval
+            year, month = year + (month - 1) // 12, (month - 1) % 12 + 1
+
+    elif kind in ("absoluteYearly", "relativeYearly"):
+        month = pattern.get("month") or start.month
+        year = start.year
+        while True:
+            if kind == "absoluteYearly":
+                yield _month_day(year, month, pattern.get("dayOfMonth") or start.day)
+            else:
+                day = _relative_day(year, month, days_of_week, pattern.get("index"))
+                if day:
+                    yield day
+            year += interval
+
+    else:
+        raise ValueError(f"不支持的重复模式: {kind}")
+
+
+def iter_dates(recurrence):
+    """按 Graph patternedRecurrence 规则依次产出发生日期 (不含取消/修改等例外处理)。"""
+    pattern, rng = recurrence["pattern"], recurrence["range"]
+    start = date.fromisoformat(rng["startDate"])
+    end = date.fromisoformat(rng["endDate"]) if rng.get("type") == "endDate" else None
+    limit = rng.get("numberOfOccurrences") if rng.get("type") == "numbered" else None
+
+    count = 0
+    for day in _candidates(pattern, start):
+        if day < start:
+            continue
+        if end and day > end:
+            return
+        yield day
+        count += 1
+        if limit and count >= limit:
+            return
+
+
+def _occurrence_date(value):
+    # cancelledOccurrences 的格式为 "OID.<主事件 ID>.<YYYY-MM-DD>"
+    return date.fromisoformat(value[-10:])
+
+
+def _original_local_date(value):
+    # originalStart 为 UTC 时间
+    moment = datetime.fromisoformat(value[:19]).replace(tzinfo=timezone.utc)
+    return moment.astimezone(LOCAL_TZ).date()
+
+
+def expand_series(master, window_start, window_end):
+    """
+    在本地把系列主事件展开为 [window_start, window_end) 内的实例。
+    已取消的实例被跳过；被修改的实例 (exceptionOccurrences) 以修改后的内容替换原实例。
+    返回与 Graph 事件结构相同的字典列表。
+    """
+    first_start = parse_local(master["start"]["dateTime"])
+    duration = parse_local(master["end"]["dateTime"]) - first_start
+    cancelled = {_occurrence_date(value) for value in master.get("cancelledOccurrences") or []}
+
+    occurrences = []
+    modified = set()
+    for exception in master.get("exceptionOccurrences") or []:
+        if exception.get("originalStart"):
+            modified.add(_original_local_date(exception["originalStart"]))
+        start = parse_local(exception["start"]["dateTime"])
+        end = parse_local(exception["end"]["dateTime"])
+        if start < window_end and end > window_start and not exception.get("isCancelled"):
+            occurrences.append({**exception, "type": "exception", "seriesMasterId": master.get("id")})
+
+    for day in iter_dates(master["recurrence"]):
+        start = datetime.combine(day, first_start.time())
+        if start >= window_end:
+            break
+        end = start + duration
+        if end <= window_start or day in cancelled or day in modified:
+            continue
+        occurrences.append({
+            "id": None,
+            "seriesMasterId": master.get("id"),
+            "type": "occurrence",
+            "subject": master.get("subject"),
+            "location": master.get("location") or {},
+            "bodyPreview": master.get("bodyPreview"),
+            "start": {"dateTime": start.isoformat()},
+            "end": {"dateTime": end.isoformat()},
+        })
+    return occurrences
@@ -0,0 +1,157 @@
+import contextvars
+import os
+import threading
+import time
+from collections import OrderedDict, deque
+from contextlib import contextmanager
+
+# 优先级从高到低：用户触发的工具调用、预取、批量同步
+LANES = ["interactive", "prefetch", "bulk"]
+DEFAULT_LANE_LIMITS = {"interactive": 8, "prefetch": 2, "bulk": 1}
+# 收到 429 但响应未给出 Retry-After 时，低优先级通道的暂停时间 (秒)
+DEFAULT_THROTTLE_PAUSE = 10.0
+
+_current_lane = contextvars.ContextVar("graph_request_lane", default="interactive")
+
+
+@contextmanager
+def priority(lane):
+    """在此上下文内发出的 Graph 请求使用指定的优先级通道。"""
+    if lane not in LANES:
+        raise ValueError(f"未知的优先级通道: {lane}")
+    token = _current_lane.set(lane)
+    try:
+        yield
+    finally:
+        _current_lane.reset(token)
+
+
+def current_lane():
+    return _current_lane.get()
+
+
+def _parse_limits(value):
+    """解析形如 "interactive=8,prefetch=2,bulk=1" 的配置。"""
+    limits = dict(DEFAULT_LANE_LIMITS)
+    for part in filter(None, (value or "").split(",")):
+        lane, _, limit = part.partition("=")
+        lane = lane.strip()
+        if lane not in LANES or not limit.strip().isdigit() or int(limit) < 1:
+            raise ValueError(f"M365_LANE_LIMITS 配置无效: {part}")
+        limits[lane] = int(limit)
+    return limits
+
+
+class RequestScheduler:
+    """
+    按优先级通道调度 Graph 请求：
+    - 严格优先：有更高优先级的请求在排队时，低优先级请求不会开始；
+    - 每个通道有独立的并发上限，总并发不超过交互通道的上限，后台任务无法占满连接；
+    - 同一通道内按账号轮转，多个账号公平分享并发额度；
+    - 收到 429 后暂停预取与批量通道 (已排队的请求留在队列中)，把限流额度留给交互请求。
+    """
+
+    def __init__(self, limits=None):
+        self.limits = dict(DEFAULT_LANE_LIMITS, **(limits or {}))
+        self.total_limit = self.limits["interactive"]
+        self._cond = threading.Condition()
+        self._active = dict.fromkeys(LANES, 0)
+        self._waiting = {lane: OrderedDict() for lane in LANES}
+        self._paused_until = 0.0
+        self._stats = {lane: {"granted": 0, "queued": 0, "max_wait_ms": 0.0} for lane in LANES}
+        self._stats["throttled"] = 0
+
+    def _lane_ready(self, lane, now):
+        if self._active[lane] >= self.limits[lane]:
+            return False
+        return lane == "interactive" or now >= self._paused_until
+
+    def _next_ticket(self, now):
+        """返回下一个可以开始的排队请求；总并发已满或被更高优先级阻塞时返回 None。"""
+        if sum(self._active.values()) >= self.total_limit:
+            return None
+        for lane in LANES:
+            accounts = self._waiting[lane]
+            if not accounts:
+                continue
+            if self._lane_ready(lane, now):
+                return lane, next(iter(accounts))
+            # 严格优先：更高优先级仍在排队时，低优先级不得抢占空出的连接
+            return None
+        return None
+
+    @contextmanager
+    def slot(self, account=None, lane=None):
+        """占用一个请求名额，直到上下文结束。"""
+        lane = lane or current_lane()
+        self._acquire(lane, account)
+        try:
+            yield
+        finally:
+            self._release(lane)
+
+    def _acquire(self, lane, account):
+        ticket = object()
+        started = time.monotonic()
+        with self._cond:
+            self._waiting[lane].setdefault(account, deque()).append(ticket)
+            waited = False
+            while True:
+                now = time.monotonic()
+                choice = self._next_ticket(now)
+                if choice == (lane, account) and self._waiting[lane][account][0] is ticket:
+                    break
+                waited = True
+                timeout = self._paused_until - now if lane != "interactive" and now < self._paused_until else None
+                self._cond.wait(timeout)
+
+            queue = self._waiting[lane].pop(account)
+            queue.popleft()
+            if queue:
+                # 轮转到队尾，让其他账号先获得下一个名额
+                self._waiting[lane][account] = queue
+            self._active[lane] += 1
+
+            stats = self._stats[lane]
+            stats["granted"] += 1
+            if waited:
+                stats["queued"] += 1
+                stats["max_wait_ms"] = max(stats["max_wait_ms"], round((time.monotonic() - started) * 1000, 1))
+            self._cond.notify_all()
+
+    def _release(self, lane):
+        with self._cond:
+            self._active[lane] -= 1
+            self._cond.notify_all()
+
+    def set_total_limit(self, limit):
+        """调整总并发上限 (由自动调节使用)，不超过交互通道的上限。"""
+        with self._cond:
+            self.total_limit = max(1, min(limit, self.limits["interactive"]))
+            self._cond.notify_all()
+
+    def throttled(self, retry_after=None):
+        """记录一次 429：在 Retry-After 期间暂停低优先级通道。"""
+        try:
+            pause = float(retry_after) if retry_after else DEFAULT_THROTTLE_PAUSE
+        except ValueError:
+            pause = DEFAULT_THROTTLE_PAUSE
+        with self._cond:
+            self._paused_until = max(self._paused_until, time.monotonic() + pause)
+            self._stats["throttled"] += 1
+            self._cond.notify_all()
+
+    def stats(self):
+        with self._cond:
+            return {
+                "active": dict(self._active),
+                "waiting": {lane: sum(len(q) for q in self._waiting[lane].values()) for lane in LANES},
+                "paused_for": round(max(self._paused_until - time.monotonic(), 0.0), 1),
+                "total_limit": self.total_limit,
+                **{lane: dict(self._stats[lane]) for lane in LANES},
+                "throttled": self._stats["throttled"],
+            }
+
+
+# 进程内所有 GraphClient 共享的调度器
+scheduler = RequestScheduler(_parse_limits(os.getenv("M365_LANE_LIMITS")))
@@ -0,0 +1,286 @@
+import atexit
+import bisect
+import heapq
+import logging
+import math
+import re
+import threading
+from collections import Counter
+
+from .json_stream import loads, dumps
+from .token_cache import FileCipher, FileLock, atomic_write
+
+logger = logging.getLogger(__name__)
+
+# BM25 参数
+BM25_K1 = 1.2
+BM25_B = 0.75
+# 前缀扩展命中的词项相对完整命中的权重，以及单个查询词最多扩展的词项数
+PREFIX_WEIGHT = 0.5
+MAX_PREFIX_EXPANSIONS = 50
+# 索引变更后延迟多久写盘 (秒)，期间的多次变更合并为一次写入
+SAVE_DELAY = 5.0
+SNIPPET_CHARS = 80
+
+_CJK = "\u3040-\u30ff\u3400-\u4dbf\u4e00-\u9fff\uf900-\ufaff\uac00-\ud7af"
+_TOKEN_RE = re.compile(f"[{_CJK}]+|[^\\W_{_CJK}]+")
+_CJK_RE = re.compile(f"[{_CJK}]")
+
+
+def _is_cjk(run):
+    return bool(_CJK_RE.match(run))
+
+
+def tokenize(text, query=False):
+    """
+    分词：拉丁字母/数字按单词切分并转为小写；中日韩文字没有空格分隔，切分为单字与相邻双字 (bigram)。
+    查询时长度不小于 2 的中文片段只使用双字，以获得更精确的匹配。
+    """
+    tokens = []
+    for run in _TOKEN_RE.findall((text or "").lower()):
+        if not _is_cjk(run):
+            tokens.append(run)
+            continue
+        bigrams = [run[i:i + 2] for i in range(len(run) - 1)]
+        if query:
+            tokens.extend(bigrams or [run])
+        else:
+            tokens.extend(run)
+            tokens.extend(bigrams)
+    return tokens
+
+
+class SearchIndex:
+    """
+    邮件、日程与待办的本地全文索引 (倒排索引 + BM25 排序)。
+    由服务器读取到的数据增量构建，持久化在磁盘上；拉丁文本的查询词支持前缀匹配。
+    多个进程共享同一个索引文件时，保存时在文件锁内合并磁盘上的内容，只写入本进程的变更。
+    提供 key 时文件以口令加密 (与 Token 缓存相同)。
+    """
+
+    def __init__(self, path=None, key=None):
+        self.path = path
+        self._lock = threading.RLock()
+        self._file_lock = FileLock(path + ".lock") if path else None
+        self._cipher = FileCipher(key) if key else None
+        self._docs = {}
+        self._postings = {}
+        self._terms = []
+        self._total_length = 0
+        self._timer = None
+        self._dirty = False
+        # 自上次保存以来本进程的变更：键 -> 文档 (删除为 None)
+        self._pending = {}
+        if path:
+            self._load()
+            atexit.register(self.save)
+
+    def __len__(self):
+        return len(self._docs)
+
+    # --- 索引维护 ---
+
+    def add(self, kind, item_id, title, text="", meta=None):
+        """添加或替换一个文档；title 与 text 参与检索，meta 原样随结果返回。"""
+        # 写后队列中尚未提交的实体只有本地临时 ID，提交后会以真实 ID 重新读取
+        if not item_id or item_id.startswith("local-"):
+            return
+        title, text, meta = title or "", text or "", meta or {}
+        key = f"{kind}:{item_id}"
+        with self._lock:
+            old = self._docs.get(key)
+            # 重复读取到未变化的数据时不重新分词
+            if old and old["title"] == title and old["text"] == text and old["meta"] == meta:
+                return
+            tf = Counter(tokenize(title) + tokenize(text))
+            if old:
+                self._unindex(key, old)
+            self._index(key, {
+                "kind": kind, "id": item_id, "title": title, "text": text, "meta": meta,
+                "tf": dict(tf), "length": sum(tf.values()),
+            })
+            self._pending[key] = self._docs[key]
+            self._changed()
+
+    def update(self, kind, item_id, title=None, text=None, meta=None):
+        """局部更新已索引的文档 (未索引时忽略)，未提供的部分保持不变。"""
+        with self._lock:
+            doc = self._docs.get(f"{kind}:{item_id}")
+            if doc is None:
+                return
+            self.add(
+                kind, item_id,
+                doc["title"] if title is None else title,
+                doc["text"] if text is None else text,
+                {**doc["meta"], **(meta or {})},
+            )
+
+    def remove(self, kind, item_id):
+        key = f"{kind}:{item_id}"
+        with self._lock:
+            doc = self._docs.get(key)
+            if doc:
+                self._unindex(key, doc)
+                self._pending[key] = None
+                self._changed()
+
+    def _index(self, key, doc, keep_sorted=True):
+        self._docs[key] = doc
+        self._total_length += doc["length"]
+        for term, count in doc["tf"].items():
+            postings = self._postings.get(term)
+            if postings is None:
+                postings = self._postings[term] = {}
+                if keep_sorted:
+                    bisect.insort(self._terms, term)
+            postings[key] = count
+
+    def _unindex(self, key, doc):
+        del self._docs[key]
+        self._total_length -= doc["length"]
+        for term in doc["tf"]:
+            postings = self._postings[term]
+            del postings[key]
+            if not postings:
+                del self._postings[term]
+                del self._terms[bisect.bisect_left(self._terms, term)]
+
+    # --- 查询 ---
+
+    def _expand(self, token):
+        """返回 [(词项, 权重)]：完整命中权重为 1，拉丁文本的前缀扩展权重为 PREFIX_WEIGHT。"""
+        matches = [(token, 1.0)] if token in self._postings else []
+        if _is_cjk(token):
+            return matches
+        start = bisect.bisect_right(self._terms, token)
+        for term in self._terms[start:start + MAX_PREFIX_EXPANSIONS]:
+            if not term.startswith(token):
+                break
+            matches.append((term, PREFIX_WEIGHT))
+        return matches
+
+    def search(self, query, kinds=None, limit=20):
+        """按 BM25 相关度返回匹配的文档。"""
+        tokens = list(dict.fromkeys(tokenize(query, query=True)))
+        with self._lock:
+            total = len(self._docs)
+            if not tokens or not total:
+                return []
+            # BM25：score += idf * tf * (k1 + 1) / (tf + k1 * (1 - b + b * 文档长度 / 平均长度))
+            docs = self._docs
+            base = BM25_K1 * (1 - BM25_B)
+            slope = BM25_K1 * BM25_B / (self._total_length / total or 1)
+            scores = {}
+            for token in tokens:
+                for term, weight in self._expand(token):
+                    postings = self._postings[term]
+                    idf = math.log(1 + (total - len(postings) + 0.5) / (len(postings) + 0.5))
+                    factor = weight * idf * (BM25_K1 + 1)
+                    for key, tf in postings.items():
+                        gain = factor * tf / (tf + base + slope * docs[key]["length"])
+                        scores[key] = scores.get(key, 0.0) + gain
+
+            if kinds:
+                scores = {key: score for key, score in scores.items() if self._docs[key]["kind"] in kinds}
+            results = []
+            for key in heapq.nlargest(limit, scores, key=scores.get):
+                doc = self._docs[key]
+                results.append({
+                    "kind": doc["kind"], "id": doc["id"], "title": doc["title"],
+                    "snippet": doc["text"][:SNIPPET_CHARS], **doc["meta"], "score": round(scores[key], 3),
+                })
+            return results
+
+    def stats(self):
+        with self._lock:
+            return {"documents": len(self._docs), "terms": len(self._terms)}
+
+    # --- 持久化 ---
+
+    def _read(self):
+        """读取磁盘上的文档；文件不存在时返回 None，无法解密或解析时抛出 ValueError。"""
+        try:
+            with open(self.path, "rb") as f:
+                data = f.read()
+        except FileNotFoundError:
+            return None
+        try:
+            if self._cipher and not data.lstrip().startswith(b"{"):
+                data = self._cipher.decrypt(data)
+            return loads(data).get("docs", {})
+        except Exception as e:
+            raise ValueError(f"搜索索引文件 {self.path} 无法读取：{e}") from e
+
+    def _load(self):
+        try:
+            docs = self._read()
+        except (OSError, ValueError) as e:
+            logger.warning("%s，将重新构建", e)
+            return
+        if not docs:
+            return
+        with self._lock:
+            # 批量载入时最后统一排序词项表，避免逐个插入
+            for key, doc in docs.items():
+                self._index(key, doc, keep_sorted=False)
+            self._terms = sorted(self._postings)
+
+    def _changed(self):
+        self._dirty = True
+        if not self.path or self._timer is not None:
+            return
+        self._timer = threading.Timer(SAVE_DELAY, self.save)
+        self._timer.daemon = True
+        self._timer.start()
+
+    def save(self):
+        """将本进程的变更合并写入磁盘 (仅在有变更时)，并载入其他进程写入的文档。"""
+        with self._lock:
+            self._timer = None
+            if not self.path or not self._dirty:
+                return
+            pending, self._pending, self._dirty = self._pending, {}, False
+            # 浅拷贝：序列化与比较都在锁外进行，不阻塞检索与索引更新
+            snapshot = dict(self._docs)
+        try:
+            with self._file_lock:
+                try:
+                    docs, merged = self._read() or {}, True
+                except ValueError as e:
+                    # 无法读取 (口令变更、文件损坏等) 不等于索引为空：以内存中的全部文档重写文件
+                    logger.warning("%s，将以内存中的索引重写", e)
+                    docs, merged = snapshot, False
+                for key, doc in pending.items():
+                    if doc is None:
+                        docs.pop(key, None)
+                    else:
+                        docs[key] = doc
+                data = dumps({"docs": docs}).encode("utf-8")
+                atomic_write(self.path, self._cipher.encrypt(data) if self._cipher else data)
+        except (OSError, TimeoutError) as e:
+            with self._lock:
+                for key, doc in pending.items():
+                    self._pending.setdefault(key, doc)
+                self._dirty = True
+            logger.warning("写入搜索索引文件 %s 失败：%s", self.path, e)
+            return
+        if merged:
+            self._sync(snapshot, docs)
+
+    def _sync(self, snapshot, docs):
+        """应用其他进程新增、修改或删除的文档；保存期间本进程又有变更的以本进程为准。"""
+        changed = [key for key, doc in docs.items() if snapshot.get(key) != doc]
+        removed = [key for key in snapshot if key not in docs]
+        if not changed and not removed:
+            return
+        with self._lock:
+            for key in changed:
+                old = self._docs.get(key)
+                if key in self._pending or old is not snapshot.get(key):
+                    continue
+                if old:
+                    self._unindex(key, old)
+                self._index(key, docs[key])
+            for key in removed:
+                if key not in self._pending and self._docs.get(key) is snapshot[key]:
+                    self._unindex(key, snapshot[key])
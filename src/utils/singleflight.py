@@ -0,0 +1,131 @@
+import threading
+from collections import Counter
+
+
+class Flight:
+    """
+    一次正在进行的请求。跟随者既可以等待最终结果，也可以边到达边读取流式数据块。
+    流式跟随者必须在领导者产出第一个数据块之前加入；数据块只保留到所有跟随者都读取之后，
+    没有跟随者时不保留，因此不会在内存中积累整个响应体。
+    """
+
+    def __init__(self):
+        self._cond = threading.Condition()
+        # 还有跟随者未读取的数据块，_chunks[0] 的序号为 _offset
+        self._chunks = []
+        self._offset = 0
+        # 序号 -> 下一个要读取该数据块的跟随者数
+        self._readers = Counter()
+        self.started = False
+        self.done = False
+        self.result = None
+        self.error = None
+
+    def join(self):
+        """登记一个流式跟随者；领导者已开始产出数据块时返回 False。"""
+        with self._cond:
+            if self.started:
+                return False
+            self._readers[0] += 1
+            return True
+
+    def append(self, chunk):
+        with self._cond:
+            self.started = True
+            if self._readers:
+                self._chunks.append(chunk)
+                self._cond.notify_all()
+
+    def finish(self, result=None, error=None):
+        with self._cond:
+            self.result, self.error, self.done = result, error, True
+            self._cond.notify_all()
+
+    def wait(self):
+        with self._cond:
+            while not self.done:
+                self._cond.wait()
+        if self.error is not None:
+            raise self.error
+        return self.result
+
+    def iter_chunks(self):
+        """从第一个数据块开始跟随领导者读取 (须已通过 join 登记)。"""
+        index = 0
+        try:
+            while True:
+                with self._cond:
+                    while index >= self._offset + len(self._chunks) and not self.done:
+                        self._cond.wait()
+                    if index < self._offset + len(self._chunks):
+                        chunk = self._chunks[index - self._offset]
+                        self._move(index, index + 1)
+                        index += 1
+                    elif self.error is not None:
+                        raise self.error
+                    else:
+                        return
+                yield chunk
+        finally:
+            with self._cond:
+                self._move(index, None)
+
+    def _move(self, old, new):
+        self._readers[old] -= 1
+        if not self._readers[old]:
+            del self._readers[old]
+        if new is not None:
+            self._readers[new] += 1
+        # 丢弃所有跟随者都已读取的数据块
+        oldest = min(self._readers, default=self._offset + len(self._chunks))
+        if oldest > self._offset:
+            del self._chunks[:oldest - self._offset]
+            self._offset = oldest
+
+
+class SingleFlight:
+    """
+    合并相同的并发请求：同一个键上首个到达的调用者 (领导者) 实际发起请求，
+    在其完成前到达的调用者 (跟随者) 共享同一份响应。
+    """
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._flights = {}
+        self.stats = {"executed": 0, "coalesced": 0}
+
+    def begin(self, key, stream=False):
+        """
+        返回 (flight, 是否为领导者)。领导者必须在结束后调用 end()。
+        stream=True 时跟随者通过 iter_chunks() 读取数据块；领导者已开始产出数据块时不再合并，
+        调用方成为新的领导者。
+        """
+        with self._lock:
+            flight = self._flights.get(key)
+            if flight is not None and (not stream or flight.join()):
+                self.stats["coalesced"] += 1
+                return flight, False
+            flight = self._flights[key] = Flight()
+            self.stats["executed"] += 1
+            return flight, True
+
+    def end(self, key, flight):
+        with self._lock:
+            if self._flights.get(key) is flight:
+                del self._flights[key]
+
+    def do(self, key, fn):
+        """执行 fn 或等待相同键上进行中的调用，返回共享结果。"""
+        flight, leader = self.begin(key)
+        if not leader:
+            return flight.wait()
+        try:
+            result = fn()
+        except BaseException as e:
+            flight.finish(error=e)
+            raise
+        else:
+            flight.finish(result=result)
+        finally:
+            self.end(key, flight)
+        return result
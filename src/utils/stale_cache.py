@@ -0,0 +1,103 @@
+import functools
+import logging
+import os
+import threading
+import time
+from collections import OrderedDict
+from datetime import datetime
+
+from .circuit_breaker import GraphUnavailableError
+
+logger = logging.getLogger(__name__)
+
+# 最多保留的工具结果数
+STALE_CACHE_SIZE = 128
+# 超过该时长 (秒) 的旧数据不再返回
+DEFAULT_STALE_MAX_AGE = 24 * 3600
+
+
+class StaleCache:
+    """
+    读取类工具的最近一次成功结果。Graph 暂时不可用 (5xx、超时或熔断) 时返回旧数据并注明其时效，
+    同时在后台重新获取；恢复后的调用照常返回最新数据。
+    """
+
+    def __init__(self, size=STALE_CACHE_SIZE, max_age=DEFAULT_STALE_MAX_AGE):
+        self.size = size
+        self.max_age = max_age
+        self._lock = threading.Lock()
+        self._entries = OrderedDict()
+        self._refreshing = set()
+        self.stats = {"served_stale": 0, "revalidated": 0}
+
+    def get(self, key):
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is None or time.time() - entry[0] > self.max_age:
+                return None
+            self._entries.move_to_end(key)
+            return entry
+
+    def put(self, key, result):
+        with self._lock:
+            self._entries[key] = (time.time(), result)
+            self._entries.move_to_end(key)
+            while len(self._entries) > self.size:
+                self._entries.popitem(last=False)
+
+    def _revalidate(self, key, fn, args, kwargs):
+        with self._lock:
+            if key in self._refreshing:
+                return
+            self._refreshing.add(key)
+
+        def run():
+            try:
+                self.put(key, fn(*args, **kwargs))
+                with self._lock:
+                    self.stats["revalidated"] += 1
+            except Exception as e:
+                logger.info("后台刷新缓存数据失败：%s", e)
+            finally:
+                with self._lock:
+                    self._refreshing.discard(key)
+        threading.Thread(target=run, name="m365-revalidate", daemon=True).start()
+
+    def wrap(self, fn, name=None):
+        """包装读取类工具：成功时记录结果，Graph 不可用时回退到旧数据。带 cursor 的续取调用不参与。"""
+        tool = name or fn.__name__
+
+        @functools.wraps(fn)
+        def wrapper(*args, **kwargs):
+            if self.max_age <= 0 or kwargs.get("cursor"):
+                return fn(*args, **kwargs)
+            key = (tool, repr(args), repr(sorted(kwargs.items())))
+            try:
+                result = fn(*args, **kwargs)
+            except GraphUnavailableError as e:
+                entry = self.get(key)
+                if entry is None:
+                    raise
+                self._revalidate(key, fn, args, kwargs)
+                with self._lock:
+                    self.stats["served_stale"] += 1
+                fetched_at, result = entry
+                age = round(time.time() - fetched_at)
+                return {
+                    "stale": True,
+                    "age_seconds": age,
+                    "fetched_at": datetime.fromtimestamp(fetched_at).isoformat(timespec="seconds"),
+                    "warning": f"{e} 以下是 {age} 秒前获取的缓存数据，可能已过期；正在后台重新获取。",
+                    "data": result,
+                }
+            self.put(key, result)
+            return result
+
+        return wrapper
+
+    def summary(self):
+        with self._lock:
+            return {"entries": len(self._entries), **self.stats}
+
+
+cache = StaleCache(max_age=float(os.getenv("M365_STALE_MAX_AGE", DEFAULT_STALE_MAX_AGE)))
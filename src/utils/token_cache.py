@@ -0,0 +1,206 @@
+import base64
+import hashlib
+import logging
+import os
+import sys
+import tempfile
+import threading
+import time
+from contextlib import contextmanager
+
+logger = logging.getLogger(__name__)
+
+# 加密文件的格式：文件头 + 随机盐值 + Fernet 密文；密钥由口令经 PBKDF2 派生
+_ENCRYPTED_HEADER = b"M365ENC1"
+_SALT_BYTES = 16
+_KDF_ITERATIONS = 200_000
+
+
+class FileLock:
+    """
+    基于独立 .lock 文件的跨进程排他锁 (POSIX 使用 fcntl，Windows 使用 msvcrt)。
+    同一线程内可重入。
+    """
+
+    def __init__(self, path, timeout=30.0):
+        self.path = path
+        self.timeout = timeout
+        self._thread_lock = threading.RLock()
+        self._depth = 0
+        self._fd = None
+
+    def acquire(self):
+        if not self._thread_lock.acquire(timeout=self.timeout):
+            raise TimeoutError(f"等待文件锁超时: {self.path}")
+        if self._depth == 0:
+            try:
+                self._fd = self._lock_file()
+            except BaseException:
+                self._thread_lock.release()
+                raise
+        self._depth += 1
+
+    def release(self):
+        self._depth -= 1
+        if self._depth == 0:
+            self._unlock_file(self._fd)
+            self._fd = None
+        self._thread_lock.release()
+
+    def __enter__(self):
+        self.acquire()
+        return self
+
+    def __exit__(self, *exc):
+        self.release()
+
+    def _lock_file(self):
+        fd = os.open(self.path, os.O_RDWR | os.O_CREAT, 0o600)
+        deadline = time.monotonic() + self.timeout
+        while True:
+            try:
+                if sys.platform == "win32":
+                    import msvcrt
+                    msvcrt.locking(fd, msvcrt.LK_NBLCK, 1)
+                else:
+                    import fcntl
+                    fcntl.flock(fd, fcntl.LOCK_EX | fcntl.LOCK_NB)
+                return fd
+            except OSError:
+                if time.monotonic() >= deadline:
+                    os.close(fd)
+                    raise TimeoutError(f"等待文件锁超时: {self.path}")
+                time.sleep(0.05)
+
+    @staticmethod
+    def _unlock_file(fd):
+        try:
+            if sys.platform == "win32":
+                import msvcrt
+                os.lseek(fd, 0, os.SEEK_SET)
+                msvcrt.locking(fd, msvcrt.LK_UNLCK, 1)
+            else:
+                import fcntl
+                fcntl.flock(fd, fcntl.LOCK_UN)
+        finally:
+            os.close(fd)
+
+
+def atomic_write(path, data):
+    """先写入同目录临时文件并刷盘，再原子重命名覆盖目标文件。"""
+    directory = os.path.dirname(os.path.abspath(path))
+    fd, tmp_path = tempfile.mkstemp(dir=directory, prefix="." + os.path.basename(path) + ".", suffix=".tmp")
+    try:
+        with os.fdopen(fd, "wb") as f:
+            f.write(data)
+            f.flush()
+            os.fsync(f.fileno())
+        os.replace(tmp_path, path)
+    except BaseException:
+        if os.path.exists(tmp_path):
+            os.remove(tmp_path)
+        raise
+
+
+class FileCipher:
+    """
+    以口令加密的文件内容：每个文件使用随机盐值 (写在文件头中) 派生密钥，相同口令在不同安装中得到不同密钥。
+    派生的密钥按盐值缓存，重复读写同一文件时不重新计算 PBKDF2。
+    """
+
+    def __init__(self, key):
+        try:
+            from cryptography.fernet import Fernet
+        except ImportError:
+            raise RuntimeError("已设置 MS_GRAPH_TOKEN_KEY，但未安装 cryptography。请执行 uv pip install -e \".[encryption]\"。")
+        self._fernet_class = Fernet
+        self._key = key.encode("utf-8")
+        self._fernets = {}
+        self._salt = None
+
+    def _fernet(self, salt):
+        fernet = self._fernets.get(salt)
+        if fernet is None:
+            derived = hashlib.pbkdf2_hmac("sha256", self._key, salt, _KDF_ITERATIONS)
+            fernet = self._fernets[salt] = self._fernet_class(base64.urlsafe_b64encode(derived))
+        return fernet
+
+    def encrypt(self, data):
+        if self._salt is None:
+            self._salt = os.urandom(_SALT_BYTES)
+        return _ENCRYPTED_HEADER + self._salt + self._fernet(self._salt).encrypt(data)
+
+    def decrypt(self, data):
+        """解密失败 (口令错误或内容损坏) 时抛出异常。"""
+        if not data.startswith(_ENCRYPTED_HEADER):
+            raise ValueError("不是可识别的加密文件格式")
+        salt = data[len(_ENCRYPTED_HEADER):len(_ENCRYPTED_HEADER) + _SALT_BYTES]
+        plain = self._fernet(salt).decrypt(data[len(_ENCRYPTED_HEADER) + _SALT_BYTES:])
+        # 沿用文件已有的盐值，避免每次保存都重新派生密钥
+        self._salt = salt
+        return plain
+
+
+class TokenCacheFile:
+    """
+    Token 缓存文件的持久化层，可供多个服务器进程安全共享：
+    - 所有读写都在跨进程文件锁内进行；
+    - 写入先落到同目录临时文件，再原子重命名覆盖，读者永远看不到半写的文件；
+    - 通过文件标识 (inode/mtime/size) 检测其他进程的写入，以便在刷新前重新加载；
+    - 提供密钥时使用 Fernet 进行静态加密。
+    """
+
+    def __init__(self, path, key=None):
+        self.path = os.path.abspath(path)
+        self.lock = FileLock(self.path + ".lock")
+        self._cipher = FileCipher(key) if key else None
+        self._stamp = None
+
+    @contextmanager
+    def locked(self):
+        with self.lock:
+            yield
+
+    def changed(self):
+        """自上次读写以来，文件是否被 (其他进程) 修改过。"""
+        return self._current_stamp() != self._stamp
+
+    def load(self):
+        """读取并解密缓存内容；文件不存在或无法解密时返回 None。"""
+        with self.lock:
+            self._stamp = self._current_stamp()
+            if self._stamp is None:
+                return None
+            with open(self.path, "rb") as f:
+                data = f.read()
+        if not data:
+            return None
+        if self._cipher:
+            if data.lstrip().startswith(b"{"):
+                # 旧的明文缓存：照常读取，下次保存时自动加密
+                return data.decode("utf-8")
+            try:
+                return self._cipher.decrypt(data).decode("utf-8")
+            except Exception:
+                logger.warning("无法解密 Token 缓存 %s，请检查 MS_GRAPH_TOKEN_KEY。", self.path)
+                return None
+        if not data.lstrip().startswith(b"{"):
+            logger.warning("Token 缓存 %s 已加密，但未设置 MS_GRAPH_TOKEN_KEY。", self.path)
+            return None
+        return data.decode("utf-8")
+
+    def save(self, text):
+        """原子地写入缓存内容。"""
+        data = text.encode("utf-8")
+        if self._cipher:
+            data = self._cipher.encrypt(data)
+        with self.lock:
+            atomic_write(self.path, data)
+            self._stamp = self._current_stamp()
+
+    def _current_stamp(self):
+        try:
+            st = os.stat(self.path)
+        except FileNotFoundError:
+            return None
+        return (st.st_ino, st.st_mtime_ns, st.st_size)
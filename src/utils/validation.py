@@ -1,3 +1,4 @@
+import os
 import re
 from datetime import datetime
 from typing import Optional, List
@@ -20,3 +21,7 @@ def validate_email(email: str, name: str):
 def validate_enum(value: Optional[str], valid_values: List[str], name: str):
     if value is not None and value.lower() not in [v.lower() for v in valid_values]:
         raise ValueError(f"参数 '{name}' 的值无效。必须是 {valid_values} 之一。收到值: {value}")
+
+def validate_file_path(path: Optional[str], name: str):
+    if path is not None and not os.path.isfile(path):
+        raise ValueError(f"参数 '{name}' 指向的文件不存在: {path}")
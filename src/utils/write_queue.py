@@ -0,0 +1,410 @@
+import glob
+import logging
+import os
+import threading
+import time
+import uuid
+from collections import OrderedDict
+
+from .json_stream import loads, dumps
+from .scheduler import priority
+from .token_cache import FileLock, atomic_write
+
+logger = logging.getLogger(__name__)
+
+# 首次写入后延迟多久在后台提交 (秒)；此期间对同一实体的修改会被合并
+FLUSH_DELAY = 2.0
+# 提交失败 (网络错误、429、5xx) 后的重试间隔 (秒)
+RETRY_DELAY = 30.0
+# 记录最近读取到的 ETag 数量上限
+MAX_ETAGS = 10000
+# 保留的本地临时 ID -> 服务器 ID 映射数上限
+MAX_ID_MAPPINGS = 10000
+# 提交中的写操作超过该时长 (秒) 仍未完成，视为提交方进程已退出，允许重新提交
+CLAIM_TIMEOUT = 600.0
+
+
+class WriteQueue:
+    """
+    写后 (write-behind) 队列：写操作先记录在本地持久化队列中并立即返回，随后在后台通过 $batch 提交。
+    - 对同一实体的多次 PATCH 合并为一次；
+    - 先创建后删除的实体互相抵消，不产生任何请求；
+    - 正在提交的写操作带有提交标记，多个线程或进程同时提交时不会重复发送；
+    - 创建提交后记录本地临时 ID 与服务器 ID 的映射，之后以临时 ID 发起的修改/删除作用于真实实体；
+    - 以读取时记录的 ETag 作为 If-Match，检测服务器端的并发修改 (冲突)；
+    - 读取集合时叠加尚未提交的修改，使后续读取立即看到本地结果。
+    per_process=True 时每个进程使用独立的队列文件 (path 加进程号)，启动时接管已退出进程遗留的队列文件
+    以及共享队列文件中未在提交的写操作。
+    """
+
+    def __init__(self, client, path, flush_delay=FLUSH_DELAY, per_process=False):
+        self.client = client
+        shared = os.path.abspath(path)
+        self.path = _process_path(shared) if per_process else shared
+        self.lock = FileLock(self.path + ".lock")
+        self.flush_delay = flush_delay
+        self.stats = {"recorded": 0, "merged": 0, "cancelled": 0, "sent": 0, "conflicts": 0, "failed": 0}
+        self._etags = OrderedDict()
+        self._timer = None
+        self._timer_lock = threading.Lock()
+
+        if per_process:
+            self._adopt_orphans(shared)
+        # 提交上次运行遗留的写操作
+        if self._read()["entries"]:
+            self._schedule()
+
+    # --- 持久化 ---
+
+    def _read(self, path=None):
+        try:
+            with open(path or self.path, "rb") as f:
+                state = loads(f.read())
+        except FileNotFoundError:
+            state = {}
+        state.setdefault("entries", {})
+        state.setdefault("conflicts", [])
+        state.setdefault("failed", [])
+        state.setdefault("ids", {})
+        return state
+
+    def _write(self, state, path=None):
+        atomic_write(path or self.path, dumps(state).encode("utf-8"))
+
+    def _adopt_orphans(self, shared):
+        """接管已退出进程的队列文件与共享队列文件中的写操作；接管过程在共享队列的文件锁内进行。"""
+        root, ext = os.path.splitext(shared)
+        try:
+            with FileLock(shared + ".lock"):
+                for path in glob.glob(glob.escape(root) + ".*" + ext):
+                    pid = path[len(root) + 1:len(path) - len(ext)]
+                    if path != self.path and pid.isdigit() and not _process_alive(int(pid)):
+                        # 原进程已退出，只有持有共享锁的接管方会访问这些文件
+                        self._adopt(path, self._read(path))
+                        for leftover in (path, path + ".lock"):
+                            if os.path.exists(leftover):
+                                os.remove(leftover)
+                # 共享队列中正在由其他进程提交的写操作保留给提交方
+                state = self._read(shared)
+                if self._adopt(shared, state, keep_in_flight=True) is not None:
+                    self._write(state, shared)
+        except (OSError, TimeoutError) as e:
+            logger.warning("接管遗留的写后队列失败：%s", e)
+
+    def _adopt(self, path, other, keep_in_flight=False):
+        """把 other 中的写操作合并进本进程的队列；返回值非 None 时 other 已被修改，需要写回。"""
+        entries = {url: entry for url, entry in other["entries"].items()
+                   if not (keep_in_flight and entry.get("in_flight"))}
+        if not (entries or other["conflicts"] or other["failed"]):
+            return None
+        with self.lock:
+            state = self._read()
+            for url, entry in entries.items():
+                entry.pop("in_flight", None)
+                state["entries"].setdefault(url, entry)
+            state["conflicts"] += other["conflicts"]
+            state["failed"] += other["failed"]
+            for local_url, real_url in other["ids"].items():
+                self._map_id(state, local_url, real_url)
+            self._write(state)
+        logger.info("已接管 %s 中的 %d 个写操作", path, len(entries))
+        for url in entries:
+            del other["entries"][url]
+        other["conflicts"], other["failed"] = [], []
+        return other
+
+    @staticmethod
+    def _resolve(state, url):
+        """本地临时 ID 的 URL -> 已提交实体的真实 URL。"""
+        return state["ids"].get(url, url)
+
+    @staticmethod
+    def _map_id(state, local_url, real_url):
+        ids = state["ids"]
+        ids[local_url] = real_url
+        while len(ids) > MAX_ID_MAPPINGS:
+            del ids[next(iter(ids))]
+
+    def _remember_etag(self, url, etag):
+        self._etags[url] = etag
+        self._etags.move_to_end(url)
+        while len(self._etags) > MAX_ETAGS:
+            self._etags.popitem(last=False)
+
+    # --- 记录写操作 ---
+
+    def create(self, collection_url, body):
+        """记录创建操作，返回本地临时 ID (可用于后续修改或删除)。"""
+        local_id = f"local-{uuid.uuid4().hex}"
+        with self.lock:
+            state = self._read()
+            state["entries"][f"{collection_url}/{local_id}"] = {
+                "op": "create", "collection": collection_url, "body": dict(body), "rev": 1, "queued_at": time.time()
+            }
+            self._write(state)
+        self.stats["recorded"] += 1
+        self._schedule()
+        return local_id
+
+    def patch(self, url, body):
+        """记录 PATCH 操作；同一实体上尚未提交的修改会与之合并。"""
+        with self.lock:
+            state = self._read()
+            url = self._resolve(state, url)
+            entry = state["entries"].get(url)
+            if entry and (entry["op"] == "delete" or entry.get("deleted")):
+                raise ValueError("该项目已在待提交队列中被删除，无法再修改。")
+            if entry:
+                entry["body"].update(body)
+                entry["rev"] += 1
+                self.stats["merged"] += 1
+            else:
+                state["entries"][url] = {
+                    "op": "patch", "body": dict(body), "etag": self._etags.get(url), "rev": 1, "queued_at": time.time()
+                }
+            self._write(state)
+        self.stats["recorded"] += 1
+        self._schedule()
+
+    def delete(self, url):
+        """
+        记录删除操作；若该实体的创建尚未提交，两者直接抵消。
+        若创建正在提交中，则标记为待删除，创建返回后再按真实 ID 删除。
+        """
+        with self.lock:
+            state = self._read()
+            url = self._resolve(state, url)
+            entry = state["entries"].get(url)
+            if entry and entry["op"] == "create" and entry.get("in_flight"):
+                entry["deleted"] = True
+                entry["rev"] += 1
+                self.stats["merged"] += 1
+            elif entry and entry["op"] == "create":
+                del state["entries"][url]
+                self.stats["cancelled"] += 1
+            else:
+                if entry:
+                    self.stats["merged"] += 1
+                state["entries"][url] = {
+                    "op": "delete", "etag": (entry or {}).get("etag") or self._etags.get(url),
+                    "rev": (entry or {}).get("rev", 0) + 1, "queued_at": time.time()
+                }
+                if entry and entry.get("in_flight"):
+                    # 对该实体的修改正在提交中：保留提交标记，提交返回后再发送删除
+                    state["entries"][url]["in_flight"] = entry["in_flight"]
+            self._write(state)
+        self.stats["recorded"] += 1
+        self._schedule()
+
+    # --- 乐观本地状态 ---
+
+    def observe(self, items, collection_url, include_created=None):
+        """
+        包装集合读取：记录每个实体的 ETag，并叠加待提交的修改/删除。
+        :param include_created: 可选的判断函数；为其返回 True 的待创建实体会追加在结果末尾。
+        """
+        with self.lock:
+            state = self._read()
+        entries = {self._resolve(state, url): entry for url, entry in state["entries"].items()}
+        for item in items:
+            url = f"{collection_url}/{item.get('id')}"
+            if item.get("@odata.etag"):
+                self._remember_etag(url, item["@odata.etag"])
+            entry = entries.get(url)
+            if entry is None:
+                yield item
+            elif entry["op"] == "patch":
+                yield {**item, **entry["body"]}
+            # 已排队删除的实体不再返回
+        if include_created:
+            for url, entry in entries.items():
+                if (entry["op"] == "create" and not entry.get("deleted") and entry["collection"] == collection_url
+                        and include_created(entry["body"])):
+                    yield {**entry["body"], "id": url.rsplit("/", 1)[1]}
+
+    # --- 提交 ---
+
+    @staticmethod
+    def _to_request(url, entry):
+        headers = {"If-Match": entry["etag"]} if entry.get("etag") else {}
+        if entry["op"] == "create":
+            return {"method": "POST", "url": entry["collection"], "body": entry["body"]}
+        if entry["op"] == "patch":
+            return {"method": "PATCH", "url": url, "body": entry["body"], "headers": headers}
+        return {"method": "DELETE", "url": url, "headers": headers}
+
+    def flush(self, retry_conflicts=False):
+        """
+        立即通过 $batch 提交所有待写操作，返回提交结果摘要。
+        :param retry_conflicts: 为 True 时重新提交此前冲突的操作 (不再校验 ETag，以本地修改覆盖服务器)。
+        """
+        claim = uuid.uuid4().hex
+        with self.lock:
+            state = self._read()
+            if retry_conflicts and state["conflicts"]:
+                for conflict in state["conflicts"]:
+                    state["entries"].setdefault(conflict["url"], {**conflict["entry"], "etag": None})
+                state["conflicts"] = []
+            # 在跨进程锁内认领待提交项：其他线程或进程正在提交的项跳过，不重复发送
+            now, snapshot = time.time(), {}
+            for url, entry in list(state["entries"].items()):
+                in_flight = entry.get("in_flight")
+                if in_flight and now - in_flight["at"] < CLAIM_TIMEOUT:
+                    continue
+                if entry["op"] == "create" and entry.get("deleted"):
+                    # 上次提交失败的创建此后又被删除：直接抵消
+                    del state["entries"][url]
+                    continue
+                entry["in_flight"] = {"claim": claim, "at": now}
+                snapshot[url] = dict(entry)
+            self._write(state)
+        if not snapshot:
+            remaining = len(state["entries"])
+            if remaining:
+                # 其余项正由其他提交方处理；若其进程退出，认领超时后由本进程接管
+                self._schedule(RETRY_DELAY)
+            return {"sent": [], "conflicts": [], "failed": [], "remaining": remaining}
+
+        # 网络请求在锁外进行，提交期间新的写操作不会被阻塞
+        urls = list(snapshot)
+        try:
+            responses = self.client.batch([self._to_request(url, snapshot[url]) for url in urls])
+        except BaseException:
+            self._release(urls, claim)
+            raise
+
+        sent, conflicts, failed = [], [], []
+        with self.lock:
+            state = self._read()
+            entries = state["entries"]
+            for url, response in zip(urls, responses):
+                sent_entry = snapshot[url]
+                status = response.get("status", 500)
+                body = response.get("body") or {}
+                current = entries.get(url)
+                if current is not None and (current.get("in_flight") or {}).get("claim") != claim:
+                    # 认领已超时并被其他提交方接管
+                    continue
+                if current is not None:
+                    current.pop("in_flight", None)
+                changed = current is not None and current.get("rev") != sent_entry.get("rev")
+
+                if 200 <= status < 300 or (status == 404 and sent_entry["op"] == "delete"):
+                    self.stats["sent"] += 1
+                    result = {"url": url, "op": sent_entry["op"], "status": status}
+                    real_url = url
+                    if sent_entry["op"] == "create":
+                        real_url = f"{sent_entry['collection']}/{body.get('id')}"
+                        result["id"] = body.get("id")
+                        # 调用方持有的是本地临时 ID：之后的修改/删除改写为真实 URL
+                        self._map_id(state, url, real_url)
+                    if body.get("@odata.etag"):
+                        self._remember_etag(real_url, body["@odata.etag"])
+                    sent.append(result)
+                    if not changed:
+                        entries.pop(url, None)
+                    elif sent_entry["op"] == "create" and current.get("deleted"):
+                        # 创建提交期间被删除：按真实 ID 补发删除
+                        del entries[url]
+                        entries[real_url] = {
+                            "op": "delete", "etag": self._etags.get(real_url),
+                            "rev": 1, "queued_at": current["queued_at"]
+                        }
+                    elif sent_entry["op"] == "create" and current["op"] == "create":
+                        # 创建已提交，但期间又有修改：转为对真实 ID 的 PATCH
+                        del entries[url]
+                        entries[real_url] = {
+                            "op": "patch", "body": current["body"], "etag": self._etags.get(real_url),
+                            "rev": 1, "queued_at": current["queued_at"]
+                        }
+                    elif body.get("@odata.etag"):
+                        # 提交期间又有修改：以提交后的新 ETag 作为下一次的 If-Match
+                        current["etag"] = body["@odata.etag"]
+                elif status == 412:
+                    self.stats["conflicts"] += 1
+                    conflict = {"url": url, "entry": current or sent_entry, "error": _error_message(body)}
+                    state["conflicts"].append(conflict)
+                    conflicts.append(conflict)
+                    entries.pop(url, None)
+                elif status == 429 or status >= 500:
+                    # 暂时性错误：保留在队列中稍后重试
+                    continue
+                else:
+                    self.stats["failed"] += 1
+                    failure = {"url": url, "entry": sent_entry, "status": status, "error": _error_message(body)}
+                    state["failed"].append(failure)
+                    failed.append(failure)
+                    if not changed or current.get("deleted"):
+                        entries.pop(url, None)
+            self._write(state)
+            remaining = len(entries)
+
+        if remaining:
+            self._schedule(RETRY_DELAY)
+        return {"sent": sent, "conflicts": conflicts, "failed": failed, "remaining": remaining}
+
+    def _release(self, urls, claim):
+        """提交失败时撤销认领，留待稍后重试。"""
+        with self.lock:
+            state = self._read()
+            for url in urls:
+                entry = state["entries"].get(url)
+                if entry and (entry.get("in_flight") or {}).get("claim") == claim:
+                    del entry["in_flight"]
+            self._write(state)
+
+    def summary(self):
+        """返回待提交的写操作、冲突与失败记录。"""
+        with self.lock:
+            state = self._read()
+        return {
+            "pending": [
+                {"url": url, "op": entry["op"], "fields": sorted(entry.get("body", {}))}
+                for url, entry in state["entries"].items()
+            ],
+            "conflicts": state["conflicts"],
+            "failed": state["failed"],
+        }
+
+    def _schedule(self, delay=None):
+        with self._timer_lock:
+            if self._timer is not None:
+                return
+            self._timer = threading.Timer(delay or self.flush_delay, self._background_flush)
+            self._timer.daemon = True
+            self._timer.start()
+
+    def _background_flush(self):
+        with self._timer_lock:
+            self._timer = None
+        try:
+            # 后台提交走批量通道，不与交互请求争抢连接
+            with priority("bulk"):
+                self.flush()
+        except Exception as e:
+            logger.warning("后台提交待写操作失败，将稍后重试：%s", e)
+            self._schedule(RETRY_DELAY)
+
+
+def _process_path(path):
+    """pending_writes.json -> pending_writes.<进程号>.json"""
+    root, ext = os.path.splitext(path)
+    return f"{root}.{os.getpid()}{ext}"
+
+
+def _process_alive(pid):
+    if os.name == "nt":
+        # Windows 上 os.kill 会结束目标进程，无法用于探测；视为仍在运行
+        return True
+    try:
+        os.kill(pid, 0)
+    except ProcessLookupError:
+        return False
+    except PermissionError:
+        return True
+    return True
+
+
+def _error_message(body):
+    error = (body or {}).get("error") or {}
+    return f"{error.get('code', 'UnknownError')}: {error.get('message', '')}"
@@ -0,0 +1,456 @@
+"""
+并发多会话浸泡 (soak) 测试：长时间驱动大量模拟 MCP 会话调用服务器工具，检测泄漏与性能退化。
+
+Graph 后端由本地 httpx.MockTransport 模拟 (无需网络与账号)，会话通过 fastmcp 内存传输直连服务器。
+运行期间按时间窗口报告吞吐量、尾延迟、RSS、文件描述符与连接数，结束时按工具对比 tracemalloc 快照；
+任一指标超出阈值时以非零状态码退出。
+
+用法 (在项目根目录):
+    python tests/soak_harness.py --duration 3600 --sessions 32
+    python tests/soak_harness.py --duration 60 --sessions 8 --write-behind
+"""
+import argparse
+import asyncio
+import gc
+import itertools
+import json
+import os
+import random
+import re
+import sys
+import tempfile
+import threading
+import time
+import tracemalloc
+from datetime import datetime, timedelta
+from unittest import mock
+
+import httpx
+
+# Add project root to sys.path to import the src package
+sys.path.append(os.getcwd())
+
+
+class FakeGraph:
+    """内存中的 Graph 后端：支持待办、日程、忙闲、邮件、/me 与 $batch，状态在线程间共享。"""
+
+    def __init__(self, latency=0.0):
+        self.latency = latency
+        self.lock = threading.Lock()
+        self.ids = itertools.count(1)
+        self.tasks = {}
+        self.events = {}
+        self.requests = 0
+        self.messages = [
+            {
+                "id": f"m{i}", "subject": f"项目周报 第 {i} 期", "bodyPreview": "本周进展与下周计划 " * 5,
+                "receivedDateTime": "2025-01-06T09:00:00Z",
+                "from": {"emailAddress": {"address": f"user{i % 7}@example.com"}},
+            }
+            for i in range(50)
+        ]
+
+    def handler(self, request):
+        if self.latency:
+            time.sleep(self.latency)
+        path = request.url.path.removeprefix("/v1.0")
+        body = json.loads(request.content) if request.content else None
+        status, payload = self.dispatch(request.method, path, dict(request.url.params), body)
+        return httpx.Response(status, json=payload) if payload is not None else httpx.Response(status)
+
+    def _new_id(self, prefix):
+        return f"{prefix}{next(self.ids)}"
+
+    def dispatch(self, method, path, params, body):
+        with self.lock:
+            self.requests += 1
+        if path == "/$batch":
+            responses = []
+            for req in body["requests"]:
+                url = httpx.URL(req["url"])
+                status, payload = self.dispatch(req["method"], url.path, dict(url.params), req.get("body"))
+                responses.append({"id": req["id"], "status": status, "headers": {}, "body": payload})
+            return 200, {"responses": responses}
+        if path == "/me":
+            return 200, {"mail": "soak@example.com", "displayName": "Soak"}
+        if path == "/me/todo/lists":
+            return 200, {"value": [{"id": "L1", "wellKnownName": "defaultList"}]}
+        if path == "/me/messages":
+            return 200, {"value": self.messages[:int(params.get("$top", 10))]}
+        if path == "/me/calendar/getSchedule":
+            start = datetime.fromisoformat(body["startTime"]["dateTime"][:19])
+            end = datetime.fromisoformat(body["endTime"]["dateTime"][:19])
+            slots = int((end - start) / timedelta(minutes=body.get("availabilityViewInterval", 30)))
+            return 200, {"value": [{"scheduleId": body["schedules"][0], "availabilityView": "0" * slots,
+                                    "scheduleItems": []}]}
+        if path == "/me/calendar/calendarView":
+            with self.lock:
+                return 200, {"value": list(self.events.values())[:50]}
+
+        match = re.fullmatch(r"/me/todo/lists/L1/tasks(?:/([^/]+))?", path) or re.fullmatch(r"/me/events(?:/([^/]+))?", path)
+        if not match:
+            return 404, {"error": {"code": "NotFound", "message": path}}
+        store = self.tasks if "/todo/" in path else self.events
+        item_id = match.group(1)
+        with self.lock:
+            if method == "GET" and not item_id:
+                return 200, {"value": list(store.values())[:50]}
+            if method == "POST" and not item_id:
+                item = {**body, "id": self._new_id("t" if store is self.tasks else "e"), "@odata.etag": 'W/"1"'}
+                store[item["id"]] = item
+                return 201, item
+            if item_id not in store:
+                return 404, {"error": {"code": "ErrorItemNotFound", "message": item_id}}
+            if method == "PATCH":
+                store[item_id].update(body)
+                return 200, store[item_id]
+            if method == "DELETE":
+                del store[item_id]
+                return 204, None
+        return 405, {"error": {"code": "MethodNotAllowed", "message": method}}
+
+
+def install_fake_client(graph, workdir):
+    """构造使用模拟后端的 GraphClient，并注册为进程内共享客户端。"""
+    from src import auth
+
+    # MSAL 在构造时会访问登录服务进行实例发现，这里替换掉，并直接返回固定令牌
+    with mock.patch.object(auth.msal, "PublicClientApplication"):
+        client = auth.GraphClient(
+            "soak-client-id",
+            token_path=os.path.join(workdir, "graph_token.json"),
+            transport=httpx.MockTransport(graph.handler),
+        )
+    client.get_token = lambda: "soak-token"
+    auth._client = client
+    return client
+
+
+def _now_window():
+    today = datetime.now().replace(hour=0, minute=0, second=0, microsecond=0)
+    return today.isoformat(), (today + timedelta(days=1)).isoformat()
+
+
+def build_operations(enable_write_behind):
+    """返回 [(工具名, 权重, 生成参数的函数)]；写操作使用会话自己创建的项目 ID。"""
+    def created(state, kind):
+        return random.choice(state[kind]) if state[kind] else None
+
+    start, end = _now_window()
+    operations = [
+        ("get_current_time", 5, lambda state: {}),
+        ("list_calendar_events", 15, lambda state: {"start_date": start, "end_date": end, "output_mode": "compact"}),
+        ("get_user_schedules", 10, lambda state: {"start": start, "end": end, "output_mode": "compact"}),
+        ("list_tasks", 15, lambda state: {"output_mode": "table"}),
+        ("list_emails", 10, lambda state: {"limit": 20, "output_mode": "compact"}),
+        ("search", 10, lambda state: {"query": "周报"}),
+        ("create_task", 8, lambda state: {"title": f"浸泡任务 {random.randint(1, 10 ** 6)}"}),
+        ("update_task", 8, lambda state: created(state, "tasks") and {"task_id": created(state, "tasks"), "title": "已更新"}),
+        ("delete_task", 6, lambda state: created(state, "tasks") and {"task_id": state["tasks"].pop()}),
+        ("create_calendar_event", 6, lambda state: {"subject": "浸泡会议", "start": start[:11] + "10:00:00",
+                                                    "end": start[:11] + "11:00:00"}),
+        ("delete_calendar_event", 5, lambda state: created(state, "events") and {"event_id": state["events"].pop()}),
+    ]
+    if enable_write_behind:
+        operations.append(("get_pending_writes", 2, lambda state: {}))
+    return operations
+
+
+class Recorder:
+    """按时间窗口记录每次调用的耗时与错误。"""
+
+    def __init__(self, interval):
+        self.interval = interval
+        self.started = time.monotonic()
+        self.windows = []
+        self.tool_p99 = []
+        self.current = {"latencies": [], "errors": 0}
+        self.by_tool = {}
+        self.errors = {}
+
+    def record(self, tool, elapsed, error=None):
+        self.current["latencies"].append(elapsed)
+        self.by_tool.setdefault(tool, []).append(elapsed)
+        if error:
+            self.current["errors"] += 1
+            self.errors.setdefault(tool, str(error)[:200])
+
+    def roll(self, sample):
+        latencies = sorted(self.current["latencies"])
+        window = {
+            "t": round(time.monotonic() - self.started, 1),
+            "calls": len(latencies),
+            "throughput": round(len(latencies) / self.interval, 1),
+            "errors": self.current["errors"],
+            "p50_ms": _percentile(latencies, 0.50),
+            "p99_ms": _percentile(latencies, 0.99),
+            **sample,
+        }
+        self.windows.append(window)
+        self.tool_p99.append({tool: _percentile(sorted(values), 0.99) for tool, values in self.by_tool.items()})
+        self.current = {"latencies": [], "errors": 0}
+        self.by_tool = {}
+        return window
+
+
+def _percentile(values, q):
+    if not values:
+        return None
+    return round(values[min(int(len(values) * q), len(values) - 1)] * 1000, 2)
+
+
+def _rss_bytes():
+    try:
+        with open("/proc/self/status") as f:
+            for line in f:
+                if line.startswith("VmRSS:"):
+                    return int(line.split()[1]) * 1024
+    except OSError:
+        pass
+    import resource
+    # 非 Linux 平台只能取得峰值 RSS (macOS 单位为字节，其他为 KiB)
+    peak = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    return peak if sys.platform == "darwin" else peak * 1024
+
+
+def _fd_counts():
+    """返回 (打开的文件描述符数, 其中的 socket 数)；无法获取时为 None。"""
+    try:
+        fds = os.listdir("/proc/self/fd")
+    except OSError:
+        return None, None
+    sockets = 0
+    for fd in fds:
+        try:
+            sockets += os.readlink(f"/proc/self/fd/{fd}").startswith("socket:")
+        except OSError:
+            pass
+    return len(fds), sockets
+
+
+def sample_process(client):
+    fds, sockets = _fd_counts()
+    pool = getattr(client._http._transport, "_pool", None)
+    return {
+        "rss_mb": round(_rss_bytes() / 2 ** 20, 1),
+        "heap_mb": round(tracemalloc.get_traced_memory()[0] / 2 ** 20, 1),
+        "fds": fds,
+        "sockets": sockets,
+        "pool_connections": len(pool.connections) if pool is not None else None,
+        "threads": threading.active_count(),
+    }
+
+
+async def run_session(mcp, operations, deadline, recorder):
+    from fastmcp import Client
+
+    state = {"tasks": [], "events": []}
+    names, weights = [op[0] for op in operations], [op[1] for op in operations]
+    builders = {op[0]: op[2] for op in operations}
+    async with Client(mcp) as session:
+        while time.monotonic() < deadline:
+            tool = random.choices(names, weights)[0]
+            arguments = builders[tool](state)
+            if arguments is None:
+                continue
+            started = time.perf_counter()
+            try:
+                result = await session.call_tool(tool, arguments)
+                error = None
+            except Exception as e:
+                result, error = None, e
+            recorder.record(tool, time.perf_counter() - started, error)
+            data = getattr(result, "data", None)
+            if isinstance(data, dict) and data.get("id"):
+                state["tasks" if tool == "create_task" else "events"].append(data["id"])
+
+
+def _stop_background_work():
+    """停止后台预取并等待进行中的预取结束，避免其他线程的分配与释放混入按工具的快照对比。"""
+    from src import server
+
+    server.ENABLE_PREFETCH = False
+    for thread in threading.enumerate():
+        if thread.name == "m365-prefetch":
+            thread.join()
+
+
+def _snapshot(client, source_filter):
+    # 先写盘搜索索引的待保存变更并回收垃圾，只比较本项目代码中仍然存活的分配
+    if client.search_index:
+        client.search_index.save()
+    gc.collect()
+    return tracemalloc.take_snapshot().filter_traces([source_filter])
+
+
+async def profile_tools(mcp, client, operations, calls):
+    """逐个工具重复调用，对比调用前后 (仅 src/ 下代码分配) 的 tracemalloc 快照，得到每次调用的堆增长。"""
+    from fastmcp import Client
+    import src
+
+    _stop_background_work()
+    source_filter = tracemalloc.Filter(True, os.path.join(os.path.dirname(os.path.abspath(src.__file__)), "*"))
+    growth = {}
+    async with Client(mcp) as session:
+        state = {"tasks": [], "events": []}
+        for tool, _, build in operations:
+            # 先调用几次，排除首次导入、缓存建立等一次性分配
+            for _ in range(5):
+                await _call_quietly(session, tool, build, state)
+            before = _snapshot(client, source_filter)
+            for _ in range(calls):
+                await _call_quietly(session, tool, build, state)
+            after = _snapshot(client, source_filter)
+            diff = after.compare_to(before, "filename")
+            total = sum(stat.size_diff for stat in diff)
+            growth[tool] = {
+                "bytes_per_call": round(total / calls, 1),
+                "top": [
+                    f"{stat.traceback[0].filename}: {stat.size_diff / 1024:+.1f} KiB"
+                    for stat in diff[:3] if stat.size_diff > 0
+                ],
+            }
+    return growth
+
+
+async def _call_quietly(session, tool, build, state):
+    # 更新/删除类工具需要先有可操作的项目
+    if tool in ("update_task", "delete_task") and not state["tasks"]:
+        result = await session.call_tool("create_task", {"title": "内存分析"}, raise_on_error=False)
+        state["tasks"].append(result.data["id"])
+    elif tool == "delete_calendar_event" and not state["events"]:
+        start, _ = _now_window()
+        result = await session.call_tool("create_calendar_event", {
+            "subject": "内存分析", "start": start[:11] + "10:00:00", "end": start[:11] + "11:00:00"
+        }, raise_on_error=False)
+        state["events"].append(result.data["id"])
+    arguments = build(state)
+    if arguments is not None:
+        await session.call_tool(tool, arguments, raise_on_error=False)
+
+
+async def soak(args):
+    workdir = tempfile.mkdtemp(prefix="m365-soak-")
+    os.environ.update({
+        "MS_GRAPH_CLIENT_ID": "soak-client-id",
+        "MS_GRAPH_TOKEN_PATH": os.path.join(workdir, "graph_token.json"),
+        "M365_SEARCH_INDEX_PATH": os.path.join(workdir, "search_index.json"),
+        "M365_WRITE_QUEUE_PATH": os.path.join(workdir, "pending_writes.json"),
+        "ENABLE_WRITE_BEHIND": "true" if args.write_behind else "false",
+        # search 工具只在启用本地索引时注册
+        "ENABLE_SEARCH_INDEX": "true",
+        "ENABLE_WARMUP": "false",
+    })
+    tracemalloc.start(args.trace_frames)
+
+    graph = FakeGraph(latency=args.backend_latency_ms / 1000)
+    client = install_fake_client(graph, workdir)
+    from src.server import mcp
+
+    operations = build_operations(args.write_behind)
+    recorder = Recorder(args.interval)
+    deadline = time.monotonic() + args.duration
+    sessions = [asyncio.create_task(run_session(mcp, operations, deadline, recorder)) for _ in range(args.sessions)]
+
+    while not all(task.done() for task in sessions):
+        await asyncio.sleep(args.interval)
+        window = recorder.roll(sample_process(client))
+        print(json.dumps(window, ensure_ascii=False), flush=True)
+    for task in sessions:
+        task.result()
+
+    growth = await profile_tools(mcp, client, operations, args.profile_calls)
+    report = {
+        "windows": len(recorder.windows),
+        "backend_requests": graph.requests,
+        "errors": recorder.errors,
+        "p99_drift_per_tool": tool_drift(recorder),
+        "heap_growth_per_tool": growth,
+        "metrics": client.get_metrics(),
+    }
+    report["failures"] = check_thresholds(args, recorder, growth)
+    print(json.dumps(report, ensure_ascii=False, indent=2))
+    return 1 if report["failures"] else 0
+
+
+def _baseline_and_tail(windows):
+    """第一个窗口包含导入与缓存建立，以随后 (最多) 三个窗口作为基线，与最后三个窗口比较。"""
+    baseline = windows[1:4] or windows[:1]
+    return baseline, windows[-3:]
+
+
+def _mean(windows, key):
+    values = [w[key] for w in windows if w[key] is not None]
+    return sum(values) / len(values) if values else None
+
+
+def tool_drift(recorder):
+    baseline, tail = _baseline_and_tail(recorder.tool_p99)
+    drift = {}
+    for tool in sorted({tool for window in recorder.tool_p99 for tool in window}):
+        before = [w[tool] for w in baseline if w.get(tool) is not None]
+        after = [w[tool] for w in tail if w.get(tool) is not None]
+        drift[tool] = {
+            "baseline_p99_ms": round(sum(before) / len(before), 2) if before else None,
+            "tail_p99_ms": round(sum(after) / len(after), 2) if after else None,
+        }
+    return drift
+
+
+def check_thresholds(args, recorder, growth):
+    failures = []
+    windows = [w for w in recorder.windows if w["calls"]]
+    if not windows:
+        return ["没有完成任何调用"]
+    baseline, tail = _baseline_and_tail(windows)
+    first, last = baseline[0], windows[-1]
+
+    total_calls = sum(w["calls"] for w in windows)
+    total_errors = sum(w["errors"] for w in windows)
+    if total_errors / total_calls > args.max_error_rate:
+        failures.append(f"错误率 {total_errors / total_calls:.2%} 超过 {args.max_error_rate:.2%}")
+
+    base_throughput, tail_throughput = _mean(baseline, "throughput"), _mean(tail, "throughput")
+    if base_throughput and tail_throughput < base_throughput * args.min_throughput_ratio:
+        failures.append(f"吞吐量从 {base_throughput:.1f}/s 下降到 {tail_throughput:.1f}/s")
+
+    base_p99, tail_p99 = _mean(baseline, "p99_ms"), _mean(tail, "p99_ms")
+    if base_p99 and tail_p99 > base_p99 * args.max_p99_drift:
+        failures.append(f"p99 延迟从 {base_p99:.1f}ms 漂移到 {tail_p99:.1f}ms")
+
+    if last["rss_mb"] - first["rss_mb"] > args.max_rss_growth_mb:
+        failures.append(f"RSS 增长 {last['rss_mb'] - first['rss_mb']:.1f} MiB")
+    if last["heap_mb"] - first["heap_mb"] > args.max_heap_growth_mb:
+        failures.append(f"Python 堆增长 {last['heap_mb'] - first['heap_mb']:.1f} MiB")
+    if last["fds"] is not None and last["fds"] - first["fds"] > args.max_fd_growth:
+        failures.append(f"文件描述符从 {first['fds']} 增长到 {last['fds']}")
+    if last["sockets"] is not None and last["sockets"] - first["sockets"] > args.max_fd_growth:
+        failures.append(f"socket 从 {first['sockets']} 增长到 {last['sockets']}")
+
+    for tool, stats in growth.items():
+        if stats["bytes_per_call"] > args.max_heap_bytes_per_call:
+            failures.append(f"{tool} 每次调用堆增长 {stats['bytes_per_call']} 字节")
+    return failures
+
+
+def parse_args(argv=None):
+    parser = argparse.ArgumentParser(description="Microsoft 365 MCP 服务器浸泡测试")
+    parser.add_argument("--duration", type=float, default=600, help="运行时长 (秒)")
+    parser.add_argument("--sessions", type=int, default=16, help="并发会话数")
+    parser.add_argument("--interval", type=float, default=10, help="报告窗口 (秒)")
+    parser.add_argument("--backend-latency-ms", type=float, default=2, help="模拟后端每个请求的延迟")
+    parser.add_argument("--write-behind", action="store_true", help="启用写后队列")
+    parser.add_argument("--trace-frames", type=int, default=1, help="tracemalloc 记录的栈深度")
+    parser.add_argument("--profile-calls", type=int, default=200, help="按工具分析堆增长时每个工具的调用次数")
+    parser.add_argument("--max-error-rate", type=float, default=0.001)
+    parser.add_argument("--min-throughput-ratio", type=float, default=0.8, help="末尾吞吐量相对基线的最低比例")
+    parser.add_argument("--max-p99-drift", type=float, default=2.0, help="末尾 p99 相对基线的最大倍数")
+    parser.add_argument("--max-rss-growth-mb", type=float, default=64)
+    parser.add_argument("--max-heap-growth-mb", type=float, default=32)
+    parser.add_argument("--max-fd-growth", type=int, default=16)
+    parser.add_argument("--max-heap-bytes-per-call", type=float, default=2048)
+    return parser.parse_args(argv)
+
+
+if __name__ == "__main__":
+    sys.exit(asyncio.run(soak(parse_args())))
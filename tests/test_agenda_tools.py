@@ -0,0 +1,67 @@
+from datetime import datetime, timedelta
+
+import httpx
+
+from src.capabilities import agenda_tools, tasks_tools
+
+
+class FakeBatchClient:
+    """以 $batch 响应日程、待办与邮件，并记录请求。"""
+
+    def __init__(self, fail=()):
+        self.batches = []
+        self.requests = []
+        self.fail = fail
+        today = datetime.now().replace(hour=0, minute=0, second=0, microsecond=0)
+        self.day = lambda days, hour=9: (today + timedelta(days=days, hours=hour)).isoformat() + ".0000000"
+
+    def _respond(self, url):
+        if any(name in url for name in self.fail):
+            return {"status": 403, "body": {"error": {"code": "ErrorAccessDenied", "message": "拒绝访问"}}}
+        if "calendarView" in url:
+            value = [{"id": "e1", "subject": "周会", "start": {"dateTime": self.day(0, 9)},
+                      "end": {"dateTime": self.day(0, 10)}, "location": {"displayName": ""}, "bodyPreview": "议程"}]
+        elif url == "/me/todo/lists":
+            value = [{"id": "L1", "wellKnownName": "defaultList"}]
+        elif "/tasks" in url:
+            value = [
+                {"id": "t1", "title": "今天到期", "status": "notStarted", "dueDateTime": {"dateTime": self.day(0, 0)}},
+                {"id": "t2", "title": "已逾期", "status": "inProgress", "dueDateTime": {"dateTime": self.day(-2, 0)}},
+                {"id": "t3", "title": "下周", "status": "notStarted", "dueDateTime": {"dateTime": self.day(7, 0)}},
+                {"id": "t4", "title": "无截止日期", "status": "notStarted"},
+            ]
+        else:
+            value = [{"id": "m1", "subject": "报销", "from": {"emailAddress": {"address": "a@example.com"}}}]
+        return {"status": 200, "body": {"value": value}}
+
+    def batch(self, requests):
+        self.batches.append([req["url"] for req in requests])
+        return [self._respond(req["url"]) for req in requests]
+
+    def request(self, method, endpoint, **kwargs):
+        self.requests.append(endpoint)
+        return httpx.Response(200, json=self._respond(endpoint)["body"])
+
+
+def test_agenda_merges_sections_in_one_batch():
+    client = FakeBatchClient()
+    tasks_tools._default_list_ids[client] = "L1"
+    agenda = agenda_tools.get_agenda(client)
+    assert len(client.batches) == 1 and len(client.batches[0]) == 3 and client.requests == []
+    assert [e["subject"] for e in agenda["events"]] == ["周会"]
+    assert "location" not in agenda["events"][0]
+    assert [(t["title"], t["overdue"]) for t in agenda["tasks"]] == [("已逾期", True), ("今天到期", False)]
+    assert agenda["unread_emails"] == [{"id": "m1", "subject": "报销", "sender": "a@example.com"}]
+    assert "errors" not in agenda
+
+
+def test_agenda_resolves_list_id_and_reports_partial_failures():
+    client = FakeBatchClient(fail=("mailFolders",))
+    agenda = agenda_tools.get_agenda(client, calendar=False)
+    assert client.batches == [[
+        "/me/todo/lists", client.batches[0][1],
+    ]]
+    assert client.requests == [agenda_tools._tasks_url("L1")]
+    assert tasks_tools._default_list_ids[client] == "L1"
+    assert len(agenda["tasks"]) == 2 and "events" not in agenda
+    assert agenda["errors"]["unread_emails"].startswith("Microsoft Graph API 错误 (ErrorAccessDenied)")
@@ -0,0 +1,89 @@
+import sys
+
+import pytest
+
+from src.capabilities import analytics, tasks_tools
+
+
+class FakeClient:
+    def __init__(self, items):
+        self.items = items
+        self.endpoints = []
+
+    def iter_values(self, method, endpoint, meta=None):
+        self.endpoints.append(endpoint)
+        return iter(self.items)
+
+
+def _event(start, end, categories=None, **extra):
+    return {"start": {"dateTime": start + ".0000000"}, "end": {"dateTime": end + ".0000000"},
+            "categories": categories or [], "showAs": "busy", **extra}
+
+
+def test_requires_numpy(monkeypatch):
+    monkeypatch.setitem(sys.modules, "numpy", None)
+    with pytest.raises(RuntimeError, match="numpy"):
+        analytics.calendar_analytics(FakeClient([]), "2025-01-01T00:00:00", "2025-02-01T00:00:00")
+
+
+def test_range_validation():
+    pytest.importorskip("numpy")
+    with pytest.raises(ValueError):
+        analytics.calendar_analytics(FakeClient([]), "2025-02-01T00:00:00", "2025-01-01T00:00:00")
+    with pytest.raises(ValueError):
+        analytics.calendar_analytics(FakeClient([]), "2020-01-01T00:00:00", "2025-01-01T00:00:00")
+
+
+def test_calendar_aggregations_and_heatmap():
+    pytest.importorskip("numpy")
+    client = FakeClient([
+        # 2025-01-06 是周一
+        _event("2025-01-06T09:00:00", "2025-01-06T10:30:00", ["项目"]),
+        _event("2025-01-06T10:00:00", "2025-01-06T11:00:00", ["项目", "客户"]),
+        _event("2025-01-08T14:00:00", "2025-01-08T15:00:00"),
+        _event("2025-01-14T09:00:00", "2025-01-14T09:30:00", ["客户"]),
+        _event("2025-01-07T00:00:00", "2025-01-08T00:00:00", isAllDay=True),
+        _event("2025-01-09T09:00:00", "2025-01-09T10:00:00", showAs="free"),
+        # 跨越范围结束时间，只统计范围内的部分
+        _event("2025-01-31T23:00:00", "2025-02-01T01:00:00"),
+    ])
+    result = analytics.calendar_analytics(
+        client, "2025-01-01T00:00:00", "2025-02-01T00:00:00",
+        group_by=["category", "week", "weekday", "month"], heatmap=True
+    )
+    assert result["events"] == 5
+    assert result["total_hours"] == 5.0
+    # 重叠的 10:00-10:30 只计一次
+    assert result["busy_hours"] == 4.5
+    assert result["by_category"]["rows"] == [["项目", 2.5, 2], ["(无分类)", 2.0, 2], ["客户", 1.5, 2]]
+    assert result["by_week"]["rows"][0] == ["2025-01-06", 3.5, 3]
+    assert dict((row[0], row[1]) for row in result["by_weekday"]["rows"]) == {"周一": 2.5, "周三": 1.0, "周二": 0.5, "周五": 1.0}
+    assert result["by_month"]["rows"] == [["2025-01", 5.0, 5]]
+    heat = result["heatmap"]["values"]
+    assert heat[0][9] == 1.0 and heat[0][10] == 1.0 and heat[0][11] == 0.0
+    assert sum(map(sum, heat)) == 4.5
+
+
+def test_task_completion_stats():
+    pytest.importorskip("numpy")
+    client = FakeClient([
+        {"status": "completed", "createdDateTime": "2025-01-02T00:00:00Z",
+         "completedDateTime": {"dateTime": "2025-01-04T00:00:00.0000000", "timeZone": "UTC"}, "categories": ["工作"]},
+        {"status": "notStarted", "createdDateTime": "2025-01-10T00:00:00Z",
+         "dueDateTime": {"dateTime": "2025-01-15T00:00:00.0000000", "timeZone": "China Standard Time"}},
+        {"status": "inProgress", "createdDateTime": "2025-02-03T00:00:00Z", "categories": ["工作"]},
+        # 范围外
+        {"status": "completed", "createdDateTime": "2024-12-01T00:00:00Z"},
+    ])
+    tasks_tools._default_list_ids[client] = "L1"
+    result = analytics.task_analytics(client, "2025-01-01T00:00:00", "2025-03-01T00:00:00", now="2025-02-01T00:00:00")
+    assert result["created"] == 3 and result["completed"] == 1 and result["overdue"] == 1
+    assert result["completion_rate"] == 0.333
+    assert result["completion_days"]["median"] == 2.0
+    assert result["by_month"]["rows"] == [["2025-01", 2, 1, 0.5], ["2025-02", 1, 0, 0.0]]
+    assert result["by_category"]["rows"] == [["(无分类)", 1, 0, 0.0], ["工作", 2, 1, 0.5]]
+    assert "/me/todo/lists/L1/tasks?$select=" in client.endpoints[0]
+
+    # 今天到期的任务当天不算逾期
+    result = analytics.task_analytics(client, "2025-01-01T00:00:00", "2025-03-01T00:00:00", now="2025-01-15T18:00:00")
+    assert result["overdue"] == 0
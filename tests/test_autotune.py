@@ -0,0 +1,114 @@
+from unittest import mock
+
+import httpx
+import pytest
+
+from src import auth
+from src.capabilities import tasks_tools
+from src.utils.autotune import AIMD, Autotuner, page_family, parse_settings
+from src.utils.scheduler import RequestScheduler
+
+
+def test_aimd_bounds():
+    control = AIMD(8, 2, 10, step=3)
+    control.increase()
+    assert control.value == 10
+    control.decrease()
+    control.decrease()
+    control.decrease()
+    assert control.value == 2
+
+
+def test_settings_and_page_family():
+    assert parse_settings("target_latency=0.5")["target_latency"] == 0.5
+    with pytest.raises(ValueError):
+        parse_settings("target_latency=-1")
+    with pytest.raises(ValueError):
+        parse_settings("speed=1")
+    assert page_family("https://graph.microsoft.com/v1.0/me/calendar/calendarView?$top=50") == "calendarView"
+    assert page_family("/me/todo/lists/L1/tasks?$top=50") == "tasks"
+    assert page_family("/me/todo/lists") is None
+
+
+def test_throttling_halves_concurrency_once_per_cooldown():
+    scheduler = RequestScheduler({"interactive": 8})
+    tuner = Autotuner(scheduler, {"cooldown": 60})
+    tuner.observe(0.1, 429)
+    tuner.observe(0.1, 429)
+    assert tuner.concurrency.value == 4
+    assert scheduler.total_limit == 4
+    assert tuner.snapshot()["throttled"] == 2
+    assert tuner.page_size("calendarView") == 25
+
+
+def test_concurrency_grows_additively_after_a_round_of_fast_requests():
+    scheduler = RequestScheduler({"interactive": 8})
+    tuner = Autotuner(scheduler, {"cooldown": 0.001})
+    tuner.observe(5.0, 200)
+    assert scheduler.total_limit == 4
+    # 一轮 4 个正常请求后加 1；$batch 等不计耗时的请求同样计为成功
+    for _ in range(3):
+        tuner.observe(0.1, 200)
+    tuner.observe(None, 200)
+    assert scheduler.total_limit == 5
+
+
+def test_page_size_follows_latency_and_size():
+    tuner = Autotuner(RequestScheduler({"interactive": 4}))
+    tuner.observe_page("tasks", 50, 20_000, 0.2)
+    assert tuner.page_size("tasks") == 60
+    # 未满一页：不再增大
+    tuner.observe_page("tasks", 12, 5_000, 0.1)
+    assert tuner.page_size("tasks") == 60
+    tuner.observe_page("tasks", 60, 2_000_000, 0.2)
+    assert tuner.page_size("tasks") == 30
+
+
+def test_client_applies_tuned_page_size(tmp_path, monkeypatch):
+    urls = []
+
+    def handler(request):
+        urls.append(str(request.url))
+        return httpx.Response(200, json={"value": [{"id": f"t{i}", "title": "x"} for i in range(50)]})
+
+    monkeypatch.setenv("ENABLE_SEARCH_INDEX", "false")
+    monkeypatch.setenv("ENABLE_PREFETCH", "false")
+    with mock.patch.object(auth.msal, "PublicClientApplication"):
+        client = auth.GraphClient("id", token_path=str(tmp_path / "token.json"),
+                                  transport=httpx.MockTransport(handler))
+    client.get_token = lambda: "token"
+    client.autotuner = Autotuner(RequestScheduler({"interactive": 4}))
+    tasks_tools._default_list_ids[client] = "L1"
+
+    tasks_tools.list_tasks_page(client)
+    tasks_tools.list_tasks_page(client)
+    assert "%24top=50" in urls[0] or "$top=50" in urls[0]
+    assert "%24top=60" in urls[1] or "$top=60" in urls[1]
+    assert client.get_metrics()["autotune"]["page_sizes"]["tasks"] == 60
+
+
+def test_page_timing_excludes_time_queued_for_a_slot(tmp_path, monkeypatch):
+    import contextlib
+    import time
+
+    def handler(request):
+        return httpx.Response(200, json={"value": [{"id": f"t{i}", "title": "x"} for i in range(50)]})
+
+    @contextlib.contextmanager
+    def slow_slot(account=None, lane=None):
+        # 模拟本地批量任务占满并发名额时的排队
+        time.sleep(0.3)
+        yield
+
+    monkeypatch.setenv("ENABLE_SEARCH_INDEX", "false")
+    monkeypatch.setenv("ENABLE_PREFETCH", "false")
+    with mock.patch.object(auth.msal, "PublicClientApplication"):
+        client = auth.GraphClient("id", token_path=str(tmp_path / "token.json"),
+                                  transport=httpx.MockTransport(handler))
+    client.get_token = lambda: "token"
+    client.autotuner = Autotuner(RequestScheduler({"interactive": 4}), parse_settings("page_target=0.2"))
+    monkeypatch.setattr(auth.scheduler, "slot", slow_slot)
+    tasks_tools._default_list_ids[client] = "L1"
+
+    tasks_tools.list_tasks_page(client)
+    assert client.get_metrics()["autotune"]["page_sizes"]["tasks"] == 60
@@ -0,0 +1,84 @@
+import threading
+
+import pytest
+
+from src.capabilities import availability, calendar_tools
+
+
+def _fake_get_schedule(views, calls, fail=()):
+    lock = threading.Lock()
+
+    def get_user_schedules(client, schedules, start, end, interval):
+        with lock:
+            calls.append((tuple(schedules), start, end))
+        if set(schedules) & set(fail):
+            raise RuntimeError("Graph 错误")
+        slots = availability._slots(availability.parse_local(start), availability.parse_local(end), interval)
+        offset = availability._slots(availability.parse_local("2025-01-06T00:00:00"), availability.parse_local(start), interval)
+        return {"value": [
+            {"scheduleId": s, "availabilityView": views.get(s, "0" * 10000)[offset:offset + slots]}
+            if s != "bad@example.com" else {"scheduleId": s, "error": {"message": "未找到邮箱"}}
+            for s in schedules
+        ]}
+    return get_user_schedules
+
+
+def test_chunks_requests_and_merges_common_free(monkeypatch):
+    calls = []
+    views = {
+        # 2 小时的时间槽：a 在第 0、1 个槽忙碌，b 在第 3 个槽暂定
+        "a@example.com": "22000000",
+        "b@example.com": "00010000",
+    }
+    monkeypatch.setattr(calendar_tools, "get_user_schedules", _fake_get_schedule(views, calls))
+    monkeypatch.setattr(availability, "MAX_SCHEDULES_PER_REQUEST", 2)
+    schedules = ["a@example.com", "b@example.com", "c@example.com", "bad@example.com", "a@example.com"]
+    result = availability.get_bulk_availability(
+        None, schedules, "2025-01-06T00:00:00", "2025-01-06T16:00:00", interval=120, per_schedule_free=True
+    )
+    assert len(calls) == 2 and {len(c[0]) for c in calls} == {2}
+    assert result["errors"] == {"bad@example.com": "未找到邮箱"}
+    assert [s["schedule"] for s in result["schedules"]] == ["a@example.com", "b@example.com", "c@example.com"]
+    assert result["schedules"][0]["busy_hours"] == 4.0
+    assert result["schedules"][2]["free"] == [{"start": "2025-01-06T00:00:00", "end": "2025-01-06T16:00:00", "minutes": 960}]
+    assert result["common_free"] == [
+        {"start": "2025-01-06T04:00:00", "end": "2025-01-06T06:00:00", "minutes": 120},
+        {"start": "2025-01-06T08:00:00", "end": "2025-01-06T16:00:00", "minutes": 480},
+    ]
+
+
+def test_long_windows_are_split_and_stitched(monkeypatch):
+    calls = []
+    # 第 70 天 (3 月 16 日) 上午 10 点起忙碌 1 小时
+    view = ["0"] * (100 * 24)
+    view[69 * 24 + 10] = "2"
+    monkeypatch.setattr(calendar_tools, "get_user_schedules", _fake_get_schedule({"a@example.com": "".join(view)}, calls))
+    result = availability.get_bulk_availability(
+        None, ["a@example.com"], "2025-01-06T00:00:00", "2025-04-16T00:00:00",
+        interval=60, min_duration=60, working_hours="09:00-12:00"
+    )
+    assert len(calls) == 2
+    assert calls[0][2] == calls[1][1] == "2025-03-09T00:00:00"
+    assert result["schedules"][0]["busy_hours"] == 1.0
+    day70 = [slot for slot in result["common_free"] if slot["start"].startswith("2025-03-16")]
+    assert day70 == [
+        {"start": "2025-03-16T09:00:00", "end": "2025-03-16T10:00:00", "minutes": 60},
+        {"start": "2025-03-16T11:00:00", "end": "2025-03-16T12:00:00", "minutes": 60},
+    ]
+
+
+def test_failed_chunks_are_reported(monkeypatch):
+    calls = []
+    monkeypatch.setattr(calendar_tools, "get_user_schedules",
+                        _fake_get_schedule({}, calls, fail=["x@example.com"]))
+    monkeypatch.setattr(availability, "MAX_SCHEDULES_PER_REQUEST", 1)
+    result = availability.get_bulk_availability(
+        None, ["x@example.com", "y@example.com"], "2025-01-06T09:00:00", "2025-01-06T10:00:00"
+    )
+    assert result["errors"] == {"x@example.com": "Graph 错误"}
+    assert result["common_free"][0]["minutes"] == 60
+    with pytest.raises(RuntimeError):
+        availability.get_bulk_availability(None, ["x@example.com"], "2025-01-06T09:00:00", "2025-01-06T10:00:00")
+    with pytest.raises(ValueError):
+        availability.get_bulk_availability(None, ["y@example.com"], "2025-01-06T09:00:00", "2025-01-06T10:00:00",
+                                           working_hours="9-18")
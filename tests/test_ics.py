@@ -0,0 +1,156 @@
+import io
+
+import pytest
+
+from src.capabilities import calendar_tools
+from src.utils import ics
+
+
+def _event(i, **extra):
+    return {
+        "id": f"e{i}", "iCalUId": f"uid-{i}", "subject": f"会议, 第 {i} 场; 讨论",
+        "start": {"dateTime": "2024-03-04T09:00:00.0000000"}, "end": {"dateTime": "2024-03-04T10:30:00.0000000"},
+        "location": {"displayName": "会议室 A"}, "bodyPreview": "议程\n第一项",
+        "body": {"contentType": "html", "content": "<p>" + "很长的正文" * 40 + "</p>"},
+        "categories": ["工作"], "isReminderOn": True, "reminderMinutesBeforeStart": 15,
+        "lastModifiedDateTime": "2024-03-01T00:00:00Z", **extra,
+    }
+
+
+def test_export_lines_are_folded_and_round_trip():
+    out = io.StringIO(newline="")
+    assert ics.write_calendar(out, [_event(1), _event(2, isAllDay=True, showAs="free")]) == 2
+    text = out.getvalue()
+    assert all(len(line.encode("utf-8")) <= 75 for line in text.split("\r\n"))
+    assert "DTSTART:20240304T010000Z" in text
+
+    events = list(ics.iter_vevents(io.StringIO(text, newline="")))
+    assert [index for index, _ in events] == [1, 2]
+    timed = ics.vevent_to_graph(events[0][1])
+    assert timed["subject"] == "会议, 第 1 场; 讨论"
+    assert timed["start"]["dateTime"] == "2024-03-04T09:00:00"
+    assert timed["end"]["dateTime"] == "2024-03-04T10:30:00"
+    assert timed["body"]["content"] == _event(1)["body"]["content"]
+    assert timed["reminderMinutesBeforeStart"] == 15 and timed["categories"] == ["工作"]
+    all_day = ics.vevent_to_graph(events[1][1])
+    assert all_day["isAllDay"] and all_day["showAs"] == "free"
+    assert all_day["end"]["dateTime"] == "2024-03-04T00:00:00"
+
+
+def test_foreign_events_are_converted():
+    props = dict(ics.iter_vevents([
+        "BEGIN:VEVENT",
+        "DTSTART;TZID=America/New_York:20240304T090000",
+        "DURATION:PT45M",
+        "RRULE:FREQ=MONTHLY;BYDAY=-1FR;COUNT=6",
+        "SUMMARY:Sync",
+        "END:VEVENT",
+    ]))[1]
+    payload = ics.vevent_to_graph(props)
+    assert payload["start"]["dateTime"] == "2024-03-04T22:00:00"
+    assert payload["end"]["dateTime"] == "2024-03-04T22:45:00"
+    assert payload["recurrence"]["pattern"] == {
+        "interval": 1, "type": "relativeMonthly", "daysOfWeek": ["friday"], "index": "last"}
+    assert payload["recurrence"]["range"]["numberOfOccurrences"] == 6
+
+    with pytest.raises(ValueError):
+        ics.vevent_to_graph({"SUMMARY": [({}, "无开始时间")]})
+
+
+class FakeBatchClient:
+    def __init__(self):
+        self.batches = []
+        self.throttle_once = True
+
+    def batch(self, requests):
+        self.batches.append(len(requests))
+        responses = []
+        for req in requests:
+            subject = req["body"]["subject"]
+            if subject == "限流" and self.throttle_once:
+                self.throttle_once = False
+                responses.append({"status": 429, "headers": {"Retry-After": "0"}, "body": None})
+            elif subject == "拒绝":
+                responses.append({"status": 400, "body": {"error": {"code": "BadRequest", "message": "无效"}}})
+            else:
+                responses.append({"status": 201, "body": {"id": subject}})
+        return responses
+
+
+def test_import_batches_and_reports_failures(tmp_path):
+    lines = ["BEGIN:VCALENDAR"]
+    for i in range(45):
+        subject = {3: "限流", 7: "拒绝"}.get(i, f"事件 {i}")
+        lines += ["BEGIN:VEVENT", f"UID:{i}", f"DTSTART:20240304T{i % 24:02d}0000Z", f"SUMMARY:{subject}", "END:VEVENT"]
+    lines += ["BEGIN:VEVENT", "SUMMARY:坏的", "END:VEVENT", "END:VCALENDAR"]
+    path = tmp_path / "import.ics"
+    path.write_text("\r\n".join(lines), encoding="utf-8")
+
+    client = FakeBatchClient()
+    dry = calendar_tools.import_ics(client, str(path), dry_run=True)
+    assert client.batches == [] and dry["valid"] == 45 and dry["failed"] == 1
+
+    result = calendar_tools.import_ics(client, str(path))
+    assert result["total"] == 46 and result["created"] == 44 and result["failed"] == 2
+    assert sorted(f["index"] for f in result["failures"]) == [8, 46]
+    # 45 个有效事件分为 3 批，另有一次限流重试
+    assert sorted(client.batches) == [1, 5, 20, 20]
+
+
+class FakePagedClient:
+    def iter_values(self, method, endpoint, meta=None, **kwargs):
+        if "page2" in endpoint:
+            return iter([_event(3)])
+        meta["@odata.nextLink"] = "https://graph.microsoft.com/v1.0/page2"
+        return iter([_event(1), _event(2)])
+
+
+def test_export_follows_pages_into_file(tmp_path):
+    path = tmp_path / "out.ics"
+    result = calendar_tools.export_ics(FakePagedClient(), str(path), "2024-03-01T00:00:00", "2024-04-01T00:00:00")
+    assert result["exported"] == 3
+    text = path.read_text(encoding="utf-8")
+    assert text.startswith("BEGIN:VCALENDAR") and text.count("BEGIN:VEVENT") == 3
+    assert not (tmp_path / "out.ics.tmp").exists()
+
+
+def test_multi_ordinal_byday_is_rejected():
+    props = {"DTSTART": [({}, "20240304T090000")], "RRULE": [({}, "FREQ=MONTHLY;BYDAY=1MO,3MO")]}
+    with pytest.raises(ValueError, match="多个不同的序号"):
+        ics.vevent_to_graph(props)
+    props["RRULE"] = [({}, "FREQ=MONTHLY;BYDAY=1MO,1WE")]
+    assert ics.vevent_to_graph(props)["recurrence"]["pattern"]["index"] == "first"
+
+
+class FakeSeriesClient:
+    """创建循环事件并返回其实例；记录删除的实例。"""
+
+    def __init__(self):
+        self.requests = []
+
+    def batch(self, requests):
+        self.requests.extend(requests)
+        return [{"status": 201 if r["method"] == "POST" else 204, "body": {"id": "series"}} for r in requests]
+
+    def iter_values(self, method, endpoint, meta=None, **kwargs):
+        assert endpoint.startswith("/me/events/series/instances?")
+        return iter([{"id": f"i{day}", "start": {"dateTime": f"2024-03-{day:02d}T09:00:00.0000000"}}
+                     for day in range(4, 12)])
+
+
+def test_import_deletes_excluded_instances(tmp_path):
+    path = tmp_path / "series.ics"
+    path.write_text("\r\n".join([
+        "BEGIN:VCALENDAR", "BEGIN:VEVENT", "UID:s", "SUMMARY:站会",
+        "DTSTART;TZID=China Standard Time:20240304T090000", "RRULE:FREQ=DAILY;COUNT=8",
+        "EXDATE;TZID=China Standard Time:20240305T090000,20240307T090000", "EXDATE:20240320T010000Z",
+        "END:VEVENT", "END:VCALENDAR",
+    ]), encoding="utf-8")
+
+    client = FakeSeriesClient()
+    result = calendar_tools.import_ics(client, str(path))
+    deleted = [r["url"] for r in client.requests if r["method"] == "DELETE"]
+    assert deleted == ["/me/events/i5", "/me/events/i7"]
+    # 找不到对应实例的排除日期如实报告
+    assert result["created"] == 1 and result["failed"] == 1
+    assert "2024-03-20T09:00:00" in result["failures"][0]["error"]
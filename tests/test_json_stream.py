@@ -0,0 +1,60 @@
+import json
+
+from src.utils.json_stream import ODataValueParser, iter_odata_values
+
+PAGE = {
+    "@odata.context": "https://graph.microsoft.com/v1.0/$metadata#users('me')/events",
+    "value": [
+        {"id": "A1", "subject": "周会 {重要}", "location": {"displayName": "会议室 [3]"}},
+        {"id": "A2", "subject": "含 \"引号\" 与 \\ 反斜杠", "categories": ["x", "y"]},
+        {"id": "A3", "isAllDay": True, "reminderMinutesBeforeStart": 15, "bodyPreview": None},
+    ],
+    "@odata.nextLink": "https://graph.microsoft.com/v1.0/me/events?$skip=3",
+}
+
+
+def _chunks(data, size):
+    return [data[i:i + size] for i in range(0, len(data), size)]
+
+
+def test_parse_whole_page():
+    """一次性喂入整页时应产出全部元素与顶层字段"""
+    data = json.dumps(PAGE, ensure_ascii=False).encode("utf-8")
+    meta = {}
+    items = list(iter_odata_values([data], meta))
+    assert items == PAGE["value"]
+    assert meta["@odata.nextLink"] == PAGE["@odata.nextLink"]
+    assert "value" not in meta
+
+
+def test_parse_byte_by_byte():
+    """任意切分的数据块 (包括切在转义符与多字节字符中间) 都应得到相同结果"""
+    data = json.dumps(PAGE, ensure_ascii=False, indent=2).encode("utf-8")
+    for size in (1, 2, 3, 7, 64):
+        meta = {}
+        items = list(iter_odata_values(_chunks(data, size), meta))
+        assert items == PAGE["value"], size
+        assert meta["@odata.context"] == PAGE["@odata.context"]
+
+
+def test_items_yielded_before_page_completes():
+    """元素应在完整到达后立即产出，而不是等待整个响应结束"""
+    data = json.dumps(PAGE).encode("utf-8")
+    cut = data.index(b'"A2"')
+    parser = ODataValueParser()
+    first = parser.feed(data[:cut])
+    assert [item["id"] for item in first] == ["A1"]
+    rest = parser.feed(data[cut:])
+    assert [item["id"] for item in rest] == ["A2", "A3"]
+    parser.close()
+
+
+def test_empty_value_and_truncated_response():
+    assert list(iter_odata_values([b'{"value": []}'])) == []
+
+    truncated = json.dumps(PAGE).encode("utf-8")[:-10]
+    try:
+        list(iter_odata_values([truncated]))
+        assert False, "截断的响应应当报错"
+    except ValueError:
+        pass
@@ -0,0 +1,70 @@
+import pytest
+
+from src.capabilities import email_tools, mail_folders
+
+
+class FakeMailClient:
+    def __init__(self):
+        self.delta_calls = []
+        self.batches = []
+        self.changes = [
+            {"id": "F1", "displayName": "收件箱", "parentFolderId": "ROOT"},
+            {"id": "F2", "displayName": "项目", "parentFolderId": "F1"},
+            {"id": "F3", "displayName": "甲", "parentFolderId": "F2"},
+            {"id": "F4", "displayName": "甲", "parentFolderId": "F1"},
+        ]
+
+    def iter_values(self, method, endpoint, meta=None, **kwargs):
+        self.delta_calls.append(endpoint)
+        meta["@odata.deltaLink"] = f"delta-{len(self.delta_calls)}"
+        changes, self.changes = self.changes, []
+        return iter(changes)
+
+    def batch(self, requests):
+        self.batches.append(requests)
+        return [
+            {"status": 404, "body": {"error": {"code": "ErrorItemNotFound", "message": "不存在"}}}
+            if "missing" in req["url"] else
+            {"status": 429, "headers": {"Retry-After": "0"}, "body": {}}
+            if "busy" in req["url"] and len(self.batches) == 1 else
+            {"status": 201, "body": {"id": "new-" + req["url"].split("/")[3]}}
+            for req in requests
+        ]
+
+
+def test_folder_names_and_paths_resolve_from_one_load():
+    client = FakeMailClient()
+    tree = mail_folders.get_folder_tree(client)
+    assert tree.resolve(client, "收件箱/项目/甲") == "F3"
+    assert tree.resolve(client, "项目") == "F2"
+    assert tree.resolve(client, "存档") == "archive"
+    assert client.delta_calls == [mail_folders._DELTA_ENDPOINT]
+    with pytest.raises(ValueError, match="不唯一"):
+        tree.resolve(client, "甲")
+
+    # 未命中时通过 deltaLink 增量刷新
+    client.changes = [{"id": "F5", "displayName": "新建", "parentFolderId": "F1"}, {"id": "F2", "@removed": {}}]
+    assert tree.resolve(client, "收件箱/新建") == "F5"
+    assert client.delta_calls[-1] == "delta-1"
+    with pytest.raises(ValueError, match="未找到"):
+        tree.resolve(client, "项目")
+
+
+def test_move_emails_batches_and_reports_failures():
+    client = FakeMailClient()
+    result = email_tools.move_emails(client, ["m1", "m2", "missing", "m1"], "项目")
+    assert len(client.batches) == 1 and len(client.batches[0]) == 3
+    assert client.batches[0][0]["body"] == {"destinationId": "F2"}
+    assert result["moved"] == {"m1": "new-m1", "m2": "new-m2"}
+    assert result["status"] == "partial" and result["failed"][0]["id"] == "missing"
+    assert email_tools.archive_emails(client, ["m3"])["folder_id"] == "archive"
+
+
+def test_move_emails_retries_throttled_moves(monkeypatch):
+    from src.capabilities import bulk_actions
+    monkeypatch.setattr(bulk_actions.scheduler, "throttled", lambda retry_after=None: None)
+    client = FakeMailClient()
+    result = email_tools.move_emails(client, ["m1", "busy"], "archive")
+    # 被限流的子请求单独重试，而不是直接记为失败
+    assert [len(batch) for batch in client.batches] == [2, 1]
+    assert result["moved"] == {"m1": "new-m1", "busy": "new-busy"} and result["failed"] == []
@@ -0,0 +1,41 @@
+import sys
+
+from src.models import Event, Task, Message
+
+
+def _raw_event(i):
+    return {
+        "id": f"e{i}", "subject": "周会", "start": {"dateTime": "2024-03-04T09:00:00.0000000"},
+        "end": {"dateTime": "2024-03-04T10:00:00.0000000"}, "location": {"displayName": "会议室 A"},
+        "bodyPreview": f"议程 {i}",
+    }
+
+
+def test_models_convert_to_the_tool_output_shape():
+    event = Event.from_graph(_raw_event(1))
+    assert event.to_dict() == {
+        "id": "e1", "subject": "周会", "start": "2024-03-04T09:00:00.0000000",
+        "end": "2024-03-04T10:00:00.0000000", "location": "会议室 A", "body": "议程 1",
+    }
+    task = Task.from_graph({"id": "t1", "title": "写周报", "status": "completed"})
+    assert task.to_dict() == {"id": "t1", "title": "写周报", "status": "completed", "due": None,
+                              "importance": None, "is_completed": True}
+    message = Message.from_graph({"id": "m1", "from": {"emailAddress": {"address": "a@example.com"}}})
+    assert message.sender == "a@example.com" and message.to_dict()["body_preview"] is None
+
+
+def test_models_are_compact_and_share_repeated_strings():
+    # 模拟 JSON 解析：每条数据中重复的值都是独立的字符串对象
+    raws = [{**_raw_event(i), "location": {"displayName": "".join(["会议室", " A"])}} for i in range(2)]
+    events = [Event.from_graph(raw) for raw in raws]
+    assert events[0].location is events[1].location
+    assert not hasattr(events[0], "__dict__")
+    assert sys.getsizeof(events[0]) * 2 < sys.getsizeof(events[0].to_dict())
+
+
+def test_overlaps_compares_local_times():
+    event = Event.from_graph(_raw_event(1))
+    assert event.overlaps("2024-03-04T09:30:00", "2024-03-04T11:00:00")
+    assert not event.overlaps("2024-03-04T10:00:00", "2024-03-04T11:00:00")
+    local = Event.from_graph({"start": {"dateTime": "2024-03-04T09:00"}, "end": {"dateTime": "2024-03-04T10:00"}})
+    assert not local.overlaps("2024-03-04T08:00:00", "2024-03-04T09:00:00")
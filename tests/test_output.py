@@ -0,0 +1,102 @@
+import json
+
+from src.utils import output
+
+EMAILS = [
+    {"id": f"M{i}", "subject": f"周报 {i}", "sender": "a@example.com", "received": None,
+     "body_preview": "内容" * 100}
+    for i in range(10)
+]
+
+
+def test_full_mode_is_unchanged():
+    """默认完整模式保持原有的列表输出"""
+    assert output.render(EMAILS, "list_emails") == EMAILS
+
+
+def test_compact_mode_drops_empty_and_truncates():
+    result = output.render(EMAILS, "list_emails", mode="compact", fields=["id", "received", "body_preview"])
+    assert isinstance(result, list)
+    assert set(result[0]) == {"id", "body_preview"}
+    assert len(result[0]["body_preview"]) == output.COMPACT_PREVIEW_CHARS + 1
+
+
+def test_table_mode():
+    result = output.render(EMAILS[:2], "list_emails", mode="table", fields=["id", "subject"])
+    assert result["columns"] == ["id", "subject"]
+    assert result["rows"] == [["M0", "周报 0"], ["M1", "周报 1"]]
+    assert result["next_cursor"] is None
+
+
+def test_budget_with_cursor_continuation():
+    """超出预算时分段返回，通过游标取回全部结果且每段不超过预算"""
+    budget = 700
+    page = output.render(EMAILS, "list_emails", mode="compact", max_bytes=budget)
+    seen = []
+    while True:
+        items = page["items"] if isinstance(page, dict) else page
+        assert len(json.dumps(items, ensure_ascii=False, separators=(",", ":")).encode("utf-8")) <= budget
+        seen.extend(item["id"] for item in items)
+        if not isinstance(page, dict) or not page["next_cursor"]:
+            break
+        page = output.resume(page["next_cursor"], "list_emails")
+    assert seen == [item["id"] for item in EMAILS]
+
+
+def test_cursor_is_bound_to_tool():
+    page = output.render(EMAILS, "list_emails", max_bytes=100)
+    try:
+        output.resume(page["next_cursor"], "list_tasks")
+        assert False, "游标不应能用于其他工具"
+    except ValueError:
+        pass
+
+
+def test_summarize_availability():
+    runs = output.summarize_availability("0022201", "2025-12-23T09:00:00", 30)
+    assert runs == [
+        {"start": "2025-12-23T09:00:00", "end": "2025-12-23T10:00:00", "status": "free"},
+        {"start": "2025-12-23T10:00:00", "end": "2025-12-23T11:30:00", "status": "busy"},
+        {"start": "2025-12-23T11:30:00", "end": "2025-12-23T12:00:00", "status": "free"},
+        {"start": "2025-12-23T12:00:00", "end": "2025-12-23T12:30:00", "status": "tentative"},
+    ]
+    slots = output.schedule_slots(
+        {"value": [{"scheduleId": "me@example.com", "availabilityView": "0022201"}]},
+        "2025-12-23T09:00:00", 30,
+    )
+    assert [slot["status"] for slot in slots] == ["busy", "tentative"]
+
+
+def test_cursor_follows_graph_next_link():
+    """剩余元素耗尽后，游标通过 nextLink 逐页向 Graph 续取"""
+    pages = {
+        "link-2": ([{"id": "E3"}, {"id": "E4"}], "link-3"),
+        "link-3": ([{"id": "E5"}], None),
+    }
+    fetched = []
+
+    def fetch_page(link):
+        fetched.append(link)
+        return pages[link]
+
+    query = {"start_date": "2025-12-01T00:00:00", "end_date": None}
+    page = output.render([{"id": "E1"}, {"id": "E2"}], "list_calendar_events", next_link="link-2", query=query)
+    assert [item["id"] for item in page["items"]] == ["E1", "E2"]
+
+    page = output.resume(page["next_cursor"], "list_calendar_events", fetch_page)
+    assert [item["id"] for item in page["items"]] == ["E3", "E4"]
+    page = output.resume(page["next_cursor"], "list_calendar_events", fetch_page,
+                         start_date="2025-12-01T00:00:00")
+    assert page == [{"id": "E5"}]
+    assert fetched == ["link-2", "link-3"]
+
+
+def test_cursor_rejects_different_query():
+    page = output.render([{"id": "E1"}], "list_calendar_events", next_link="link-2",
+                         query={"start_date": "2025-12-01T00:00:00"})
+    try:
+        output.resume(page["next_cursor"], "list_calendar_events", lambda link: ([], None),
+                      start_date="2026-01-01T00:00:00")
+        assert False, "查询参数不一致时应拒绝游标"
+    except ValueError:
+        pass
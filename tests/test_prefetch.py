@@ -0,0 +1,90 @@
+from datetime import timedelta
+
+import httpx
+
+from src.prefetch import Prefetcher, parse_rules
+
+
+class FakeGraphClient:
+    """按端点返回固定数据的 Graph 客户端，并记录请求次数。"""
+
+    def __init__(self, events, view):
+        self.events = events
+        self.view = view
+        self.calls = []
+
+    def iter_values(self, method, endpoint, meta=None, **kwargs):
+        self.calls.append(endpoint)
+        if "calendarView" in endpoint:
+            return iter(self.events)
+        return iter([{"id": "t1", "title": "写周报", "status": "notStarted"}])
+
+    def get_me(self):
+        self.calls.append("/me")
+        return {"mail": "me@example.com"}
+
+    def request(self, method, endpoint, **kwargs):
+        self.calls.append(endpoint)
+        if endpoint == "/me/todo/lists":
+            return httpx.Response(200, json={"value": [{"id": "L1", "wellKnownName": "defaultList"}]})
+        start = kwargs["json"]["startTime"]["dateTime"]
+        return httpx.Response(200, json={"value": [{
+            "scheduleId": "me@example.com",
+            "availabilityView": self.view,
+            "scheduleItems": [{"status": "busy", "start": {"dateTime": start[:11] + "09:00:00"},
+                               "end": {"dateTime": start[:11] + "10:00:00"}}],
+        }]})
+
+
+def _event(event_id, start, hours=1):
+    end = start + timedelta(hours=hours)
+    return {"id": event_id, "subject": event_id, "start": {"dateTime": start.isoformat()},
+            "end": {"dateTime": end.isoformat()}, "location": {}, "bodyPreview": ""}
+
+
+def test_prefetched_reads_are_served_from_memory():
+    probe = Prefetcher(None)
+    start, end = probe._window(7)
+    slots = int((end - start) / timedelta(minutes=30))
+    client = FakeGraphClient(
+        [_event("monday", start + timedelta(hours=9)), _event("tuesday", start + timedelta(days=1, hours=9))],
+        "0" * 18 + "22" + "0" * (slots - 20),
+    )
+    prefetcher = Prefetcher(client)
+    prefetcher.run()
+    calls = len(client.calls)
+
+    day = start.isoformat()
+    next_day = (start + timedelta(days=1)).isoformat()
+    assert [e["id"] for e in prefetcher.events(day, next_day)] == ["monday"]
+
+    schedule = prefetcher.schedule((start + timedelta(hours=8)).isoformat(), (start + timedelta(hours=11)).isoformat(), 30)
+    assert schedule["value"][0]["availabilityView"] == "002200"
+    assert len(schedule["value"][0]["scheduleItems"]) == 1
+
+    tasks, next_link = prefetcher.tasks()
+    assert tasks[0]["title"] == "写周报" and next_link is None
+    # 结果仍新鲜时再次触发不会重复请求
+    prefetcher.run()
+    assert len(client.calls) == calls
+
+    # 超出预取范围、时间槽不对齐或带时区的请求不命中
+    assert prefetcher.events(day, (end + timedelta(days=1)).isoformat()) is None
+    assert prefetcher.schedule((start + timedelta(minutes=10)).isoformat(), next_day, 30) is None
+    assert prefetcher.events(day + "+08:00", next_day) is None
+
+    stats = prefetcher.stats()
+    assert stats["calendar"]["hits"] == 1 and stats["calendar"]["misses"] == 2
+    assert stats["tasks"]["hit_rate"] == 1.0
+
+
+def test_invalidate_and_rules(monkeypatch):
+    client = FakeGraphClient([], "")
+    prefetcher = Prefetcher(client, parse_rules("tasks"))
+    assert list(prefetcher.rules) == ["tasks"]
+    prefetcher.run()
+    prefetcher.invalidate("tasks")
+    assert prefetcher.tasks() is None
+
+    monkeypatch.setenv("ENABLE_TASKS", "false")
+    assert list(Prefetcher(client).rules) == ["calendar", "schedule"]
@@ -0,0 +1,77 @@
+import json
+import pstats
+import time
+
+import pytest
+
+from src.utils import profiling
+
+
+@pytest.fixture
+def config(tmp_path, monkeypatch):
+    cfg = profiling.ProfilerConfig()
+    cfg.update(directory=str(tmp_path), interval_ms=1)
+    monkeypatch.setattr(profiling, "config", cfg)
+    return cfg
+
+
+def slow_tool(n):
+    """示例工具"""
+    time.sleep(0.05)
+    return n * 2
+
+
+def test_wrapper_is_transparent_when_off(config, tmp_path):
+    wrapped = profiling.profiled(slow_tool)
+    assert wrapped.__name__ == "slow_tool" and wrapped.__doc__ == "示例工具"
+    assert wrapped(2) == 4
+    assert list(tmp_path.iterdir()) == []
+
+
+def test_cprofile_writes_pstats(config, tmp_path):
+    config.update(mode="cprofile")
+    assert profiling.profiled(slow_tool)(3) == 6
+    [path] = tmp_path.glob("*-slow_tool.pstats")
+    assert any(func[2] == "slow_tool" for func in pstats.Stats(str(path)).stats)
+
+
+def test_sampling_writes_speedscope_and_folded(config, tmp_path):
+    config.update(mode="sampling")
+    profiling.profiled(slow_tool)(1)
+    [path] = tmp_path.glob("*.speedscope.json")
+    profile = json.loads(path.read_text(encoding="utf-8"))
+    frames = [frame["name"] for frame in profile["shared"]["frames"]]
+    assert "slow_tool" in frames
+    assert sum(profile["profiles"][0]["weights"]) > 0
+    assert "slow_tool" in next(tmp_path.glob("*.folded")).read_text(encoding="utf-8")
+
+
+def test_tool_filter_rate_and_rotation(config, tmp_path):
+    config.update(mode="cprofile", tools=["other_tool"])
+    profiling.profiled(slow_tool)(1)
+    assert list(tmp_path.iterdir()) == []
+
+    config.update(tools=[], rate=0)
+    profiling.profiled(slow_tool)(1)
+    assert list(tmp_path.iterdir()) == []
+
+    config.update(rate=1, keep=2)
+    for _ in range(4):
+        profiling.profiled(slow_tool)(1)
+    assert len(list(tmp_path.glob("*.pstats"))) == 2
+    assert config.status()["written"] == 4
+
+    with pytest.raises(ValueError):
+        config.update(mode="trace")
+
+
+def test_rotation_leaves_unrelated_files_alone(config, tmp_path):
+    # 排序在时间戳之后的无关文件不能被当作 profile 删除，也不能挤掉刚写入的 profile
+    (tmp_path / "important.db").write_bytes(b"data")
+    (tmp_path / "notes.txt").write_text("x")
+    config.update(mode="cprofile", keep=1)
+    for _ in range(2):
+        profiling.profiled(slow_tool)(1)
+    assert (tmp_path / "important.db").read_bytes() == b"data"
+    assert (tmp_path / "notes.txt").exists()
+    assert len(list(tmp_path.glob("*-slow_tool.pstats"))) == 1
@@ -0,0 +1,71 @@
+from datetime import date, datetime
+from itertools import islice
+
+from src.utils.recurrence import iter_dates, expand_series
+
+
+def _rule(pattern, start, range_type="noEnd", **range_fields):
+    return {"pattern": pattern, "range": {"type": range_type, "startDate": start, **range_fields}}
+
+
+def test_daily_numbered():
+    rule = _rule({"type": "daily", "interval": 2}, "2025-01-30", "numbered", numberOfOccurrences=3)
+    assert list(iter_dates(rule)) == [date(2025, 1, 30), date(2025, 2, 1), date(2025, 2, 3)]
+
+
+def test_weekly_multiple_days_with_interval():
+    """每两周的周一、周三；开始日期之前的同周日期不计入"""
+    rule = _rule({"type": "weekly", "interval": 2, "daysOfWeek": ["monday", "wednesday"],
+                  "firstDayOfWeek": "sunday"}, "2025-01-08", "endDate", endDate="2025-02-05")
+    assert list(iter_dates(rule)) == [
+        date(2025, 1, 8), date(2025, 1, 20), date(2025, 1, 22), date(2025, 2, 3), date(2025, 2, 5),
+    ]
+
+
+def test_absolute_monthly_clamps_to_month_end():
+    rule = _rule({"type": "absoluteMonthly", "interval": 1, "dayOfMonth": 31}, "2025-01-31")
+    assert list(islice(iter_dates(rule), 3)) == [date(2025, 1, 31), date(2025, 2, 28), date(2025, 3, 31)]
+
+
+def test_relative_monthly_and_yearly():
+    last_friday = _rule({"type": "relativeMonthly", "interval": 1, "daysOfWeek": ["friday"], "index": "last"},
+                        "2025-01-01")
+    assert list(islice(iter_dates(last_friday), 2)) == [date(2025, 1, 31), date(2025, 2, 28)]
+
+    first_weekday = _rule({"type": "relativeMonthly", "interval": 1, "index": "first",
+                           "daysOfWeek": ["monday", "tuesday", "wednesday", "thursday", "friday"]}, "2025-03-01")
+    assert next(iter_dates(first_weekday)) == date(2025, 3, 3)
+
+    thanksgiving = _rule({"type": "relativeYearly", "interval": 1, "month": 11, "daysOfWeek": ["thursday"],
+                          "index": "fourth"}, "2025-01-01", "numbered", numberOfOccurrences=2)
+    assert list(iter_dates(thanksgiving)) == [date(2025, 11, 27), date(2026, 11, 26)]
+
+    birthday = _rule({"type": "absoluteYearly", "interval": 1, "month": 2, "dayOfMonth": 29}, "2024-01-01")
+    assert list(islice(iter_dates(birthday), 2)) == [date(2024, 2, 29), date(2025, 2, 28)]
+
+
+def test_expand_series_with_cancelled_and_modified_occurrences():
+    master = {
+        "id": "S1",
+        "subject": "站会",
+        "start": {"dateTime": "2025-01-06T09:00:00.0000000"},
+        "end": {"dateTime": "2025-01-06T09:15:00.0000000"},
+        "recurrence": _rule({"type": "daily", "interval": 1}, "2025-01-06"),
+        "cancelledOccurrences": ["OID.S1.2025-01-07"],
+        "exceptionOccurrences": [{
+            "id": "X1",
+            "subject": "站会 (改期)",
+            # 原定 1 月 8 日 09:00 (UTC+8) 的实例被改到下午
+            "originalStart": "2025-01-08T01:00:00Z",
+            "start": {"dateTime": "2025-01-08T14:00:00.0000000"},
+            "end": {"dateTime": "2025-01-08T14:15:00.0000000"},
+        }],
+    }
+    occurrences = expand_series(master, datetime(2025, 1, 6), datetime(2025, 1, 10))
+    starts = sorted((o["start"]["dateTime"][:16], o["type"]) for o in occurrences)
+    assert starts == [
+        ("2025-01-06T09:00", "occurrence"),
+        ("2025-01-08T14:00", "exception"),
+        ("2025-01-09T09:00", "occurrence"),
+    ]
+    assert all(o["seriesMasterId"] == "S1" for o in occurrences)
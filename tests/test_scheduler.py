@@ -0,0 +1,86 @@
+import threading
+import time
+
+import pytest
+
+from src.utils.scheduler import RequestScheduler, priority, current_lane, _parse_limits
+
+
+def _start(scheduler, order, name, lane, account=None, hold=None):
+    """在后台线程中申请名额，记录获得名额的顺序；hold 被 set 之前一直占用名额。"""
+    def run():
+        with scheduler.slot(account, lane):
+            order.append(name)
+            if hold:
+                hold.wait(5)
+    thread = threading.Thread(target=run)
+    thread.start()
+    return thread
+
+
+def _wait_queued(scheduler, lane, count):
+    deadline = time.monotonic() + 5
+    while scheduler.stats()["waiting"][lane] < count:
+        assert time.monotonic() < deadline
+        time.sleep(0.01)
+
+
+def test_interactive_requests_go_before_queued_background_work():
+    scheduler = RequestScheduler({"interactive": 1, "prefetch": 1, "bulk": 1})
+    order, gate = [], threading.Event()
+    blocker = _start(scheduler, order, "blocker", "interactive", hold=gate)
+    while not order:
+        time.sleep(0.01)
+
+    threads = [_start(scheduler, order, "bulk", "bulk")]
+    _wait_queued(scheduler, "bulk", 1)
+    threads.append(_start(scheduler, order, "prefetch", "prefetch"))
+    _wait_queued(scheduler, "prefetch", 1)
+    threads.append(_start(scheduler, order, "interactive", "interactive"))
+    _wait_queued(scheduler, "interactive", 1)
+
+    gate.set()
+    for thread in [blocker] + threads:
+        thread.join(5)
+    assert order == ["blocker", "interactive", "prefetch", "bulk"]
+
+
+def test_accounts_share_a_lane_round_robin():
+    scheduler = RequestScheduler({"interactive": 1})
+    order, gate = [], threading.Event()
+    blocker = _start(scheduler, order, "blocker", "interactive", hold=gate)
+    while not order:
+        time.sleep(0.01)
+
+    threads = []
+    for i, account in enumerate(["a", "a", "a", "b"]):
+        threads.append(_start(scheduler, order, f"{account}{i}", "interactive", account))
+        _wait_queued(scheduler, "interactive", i + 1)
+
+    gate.set()
+    for thread in [blocker] + threads:
+        thread.join(5)
+    assert order == ["blocker", "a0", "b3", "a1", "a2"]
+
+
+def test_throttling_pauses_only_background_lanes():
+    scheduler = RequestScheduler()
+    scheduler.throttled("0.3")
+    order = []
+    background = _start(scheduler, order, "prefetch", "prefetch")
+    _wait_queued(scheduler, "prefetch", 1)
+    with scheduler.slot(lane="interactive"):
+        order.append("interactive")
+    background.join(5)
+    assert order == ["interactive", "prefetch"]
+    assert scheduler.stats()["throttled"] == 1
+
+
+def test_priority_context_and_config():
+    assert current_lane() == "interactive"
+    with priority("bulk"):
+        assert current_lane() == "bulk"
+    assert current_lane() == "interactive"
+    assert _parse_limits("prefetch=4")["prefetch"] == 4
+    with pytest.raises(ValueError):
+        _parse_limits("background=2")
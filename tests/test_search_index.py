@@ -0,0 +1,96 @@
+import pytest
+
+from src.utils.search_index import SearchIndex, tokenize
+
+
+def test_tokenize_splits_cjk_into_unigrams_and_bigrams():
+    assert tokenize("项目周会 Weekly-Sync") == ["项", "目", "周", "会", "项目", "目周", "周会", "weekly", "sync"]
+    assert tokenize("项目周会", query=True) == ["项目", "目周", "周会"]
+    assert tokenize("会", query=True) == ["会"]
+
+
+def _sample_index(path=None):
+    index = SearchIndex(path)
+    index.add("email", "m1", "项目周会纪要", "本周讨论上线计划", {"sender": "a@example.com"})
+    index.add("event", "e1", "周末爬山", "香山")
+    index.add("task", "t1", "Write weekly report")
+    index.add("task", "t2", "Review budget")
+    return index
+
+
+def test_bm25_ranking_and_kind_filter():
+    index = _sample_index()
+    results = index.search("周会")
+    assert [r["id"] for r in results] == ["m1"]
+    assert results[0]["sender"] == "a@example.com"
+
+    # 单字查询同时命中两个文档
+    assert {r["id"] for r in index.search("周")} == {"m1", "e1"}
+    assert [r["id"] for r in index.search("周", kinds=["event"])] == ["e1"]
+
+
+def test_prefix_matching_for_latin_terms():
+    index = _sample_index()
+    assert [r["id"] for r in index.search("rep")] == ["t1"]
+    # 完整命中的得分高于前缀扩展命中
+    index.add("task", "t3", "Repository cleanup")
+    index.add("task", "t4", "rep sync")
+    assert index.search("rep")[0]["id"] == "t4"
+
+
+def test_update_remove_and_persistence(tmp_path):
+    path = str(tmp_path / "index.json")
+    index = _sample_index(path)
+    index.update("task", "t2", title="Approve budget", meta={"status": "completed"})
+    index.remove("event", "e1")
+    index.add("task", "local-123", "未提交的任务")
+    index.save()
+
+    reloaded = SearchIndex(path)
+    assert len(reloaded) == 3
+    assert reloaded.search("review") == []
+    assert reloaded.search("approve")[0]["status"] == "completed"
+    assert reloaded.search("爬山") == []
+    assert reloaded.stats()["terms"] == index.stats()["terms"]
+
+
+def test_processes_sharing_a_file_merge_on_save(tmp_path):
+    path = str(tmp_path / "index.json")
+    first, second = SearchIndex(path), SearchIndex(path)
+    first.add("task", "t1", "Write weekly report")
+    first.save()
+    second.add("task", "t2", "Review budget")
+    second.save()
+
+    # 第二个进程保存时保留第一个进程的文档，并载入它们
+    assert {r["id"] for r in second.search("re")} == {"t1", "t2"}
+    first.remove("task", "t1")
+    first.save()
+    second.add("email", "m1", "周报")
+    second.save()
+    assert len(SearchIndex(path)) == 2
+    assert second.search("weekly") == []
+
+
+def test_index_file_is_encrypted_with_key(tmp_path):
+    pytest.importorskip("cryptography")
+    path = tmp_path / "index.json"
+    index = SearchIndex(str(path), key="secret")
+    index.add("email", "m1", "机密的邮件主题", meta={"sender": "boss@example.com"})
+    index.save()
+    assert "boss@example.com".encode() not in path.read_bytes()
+    assert SearchIndex(str(path), key="secret").search("机密")[0]["id"] == "m1"
+    assert len(SearchIndex(str(path), key="wrong")) == 0
+
+
+def test_unreadable_file_does_not_wipe_the_index(tmp_path):
+    path = tmp_path / "index.json"
+    index = SearchIndex(str(path))
+    index.add("task", "t1", "Write weekly report")
+    index.save()
+    index.add("task", "t2", "Review budget")
+    # 文件被截断 (或口令变更) 后保存：内存中的文档全部保留并重新写入
+    path.write_bytes(b'{"docs": {"task:t1"')
+    index.save()
+    assert {r["id"] for r in index.search("re")} == {"t1", "t2"}
+    assert len(SearchIndex(str(path))) == 2
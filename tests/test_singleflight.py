@@ -0,0 +1,74 @@
+import threading
+import time
+
+from src.utils.singleflight import SingleFlight
+
+
+def test_concurrent_calls_share_one_execution():
+    flights = SingleFlight()
+    calls = []
+    release = threading.Event()
+
+    def fetch():
+        calls.append(1)
+        release.wait(5)
+        return {"value": [1, 2, 3]}
+
+    results = []
+    threads = [threading.Thread(target=lambda: results.append(flights.do("GET /me/todo/lists", fetch)))
+               for _ in range(5)]
+    for t in threads:
+        t.start()
+    while flights.stats["coalesced"] < 4:
+        time.sleep(0.01)
+    release.set()
+    for t in threads:
+        t.join()
+
+    assert len(calls) == 1
+    assert results == [{"value": [1, 2, 3]}] * 5
+    assert flights.stats == {"executed": 1, "coalesced": 4}
+
+
+def test_errors_are_shared_and_key_is_released():
+    flights = SingleFlight()
+    try:
+        flights.do("k", lambda: 1 / 0)
+        assert False
+    except ZeroDivisionError:
+        pass
+    # 请求结束后，同一键上的新调用重新执行
+    assert flights.do("k", lambda: "ok") == "ok"
+    assert flights.stats == {"executed": 2, "coalesced": 0}
+
+
+def test_stream_followers_share_chunks_without_buffering_the_body():
+    """跟随者在领导者开始产出前加入并读取全部数据块；已被读取的数据块随即释放"""
+    flights = SingleFlight()
+    flight, leader = flights.begin("stream", stream=True)
+    assert leader
+    follower, is_leader = flights.begin("stream", stream=True)
+    assert follower is flight and not is_leader
+    chunks = flight.iter_chunks()
+
+    flight.append(b'{"value": [')
+    assert next(chunks) == b'{"value": ['
+    assert flight._chunks == []
+
+    # 领导者已开始产出后到达的请求不再合并 (早先的数据块已不再保留)
+    late, late_leader = flights.begin("stream", stream=True)
+    assert late is not flight and late_leader
+
+    flight.append(b'1, 2]}')
+    flight.finish()
+    flights.end("stream", flight)
+    assert list(chunks) == [b'1, 2]}']
+    assert flight._chunks == []
+
+
+def test_stream_without_followers_keeps_no_chunks():
+    flights = SingleFlight()
+    flight, _ = flights.begin("stream", stream=True)
+    for _ in range(3):
+        flight.append(b"x" * 1024)
+    assert flight._chunks == []
@@ -0,0 +1,32 @@
+import httpx
+
+from src.capabilities import tasks_tools
+
+
+class FakeTodoClient:
+    def __init__(self):
+        self.calls = []
+
+    def request(self, method, endpoint, **kwargs):
+        self.calls.append((method, endpoint))
+        if endpoint == "/me/todo/lists":
+            return httpx.Response(200, json={"value": [
+                {"id": "L0", "wellKnownName": "none"},
+                {"id": "L1", "wellKnownName": "defaultList"},
+            ]})
+        return httpx.Response(201, json={"id": "T1"})
+
+
+def test_default_list_id_is_resolved_once_per_client():
+    client = FakeTodoClient()
+    tasks_tools.create_task(client, "写周报")
+    tasks_tools.update_task(client, "T1", status="completed")
+    assert client.calls == [
+        ("GET", "/me/todo/lists"),
+        ("POST", "/me/todo/lists/L1/tasks"),
+        ("PATCH", "/me/todo/lists/L1/tasks/T1"),
+    ]
+    # 其他客户端 (如其他账号) 各自解析
+    other = FakeTodoClient()
+    assert tasks_tools._get_default_todo_list_id(other) == "L1"
+    assert other.calls == [("GET", "/me/todo/lists")]
@@ -0,0 +1,80 @@
+import json
+import os
+import threading
+
+import pytest
+
+from src.utils import token_cache
+from src.utils.token_cache import TokenCacheFile
+
+
+def test_save_and_load_roundtrip(tmp_path):
+    path = tmp_path / "graph_token.json"
+    cache = TokenCacheFile(str(path))
+    assert cache.load() is None
+
+    cache.save('{"AccessToken": {}}')
+    assert TokenCacheFile(str(path)).load() == '{"AccessToken": {}}'
+    # 写入时不应残留临时文件
+    assert sorted(p.name for p in tmp_path.iterdir()) == ["graph_token.json", "graph_token.json.lock"]
+
+
+def test_detects_writes_from_other_instances(tmp_path):
+    """模拟另一个服务器进程刷新了 Token：本实例应能察觉并重新加载"""
+    path = str(tmp_path / "graph_token.json")
+    mine, sibling = TokenCacheFile(path), TokenCacheFile(path)
+    mine.save('{"v": 1}')
+    assert not mine.changed()
+
+    sibling.save('{"v": 2}')
+    assert mine.changed()
+    assert mine.load() == '{"v": 2}'
+    assert not mine.changed()
+
+
+def test_concurrent_writers_never_corrupt_file(tmp_path):
+    path = str(tmp_path / "graph_token.json")
+    errors = []
+
+    def writer(n):
+        cache = TokenCacheFile(path)
+        for i in range(30):
+            cache.save(json.dumps({"writer": n, "i": i, "pad": "x" * 4096}))
+            try:
+                json.loads(TokenCacheFile(path).load())
+            except Exception as e:
+                errors.append(e)
+
+    threads = [threading.Thread(target=writer, args=(n,)) for n in range(8)]
+    for t in threads:
+        t.start()
+    for t in threads:
+        t.join()
+    assert not errors
+    assert [p for p in os.listdir(tmp_path) if p.endswith(".tmp")] == []
+
+
+def test_encryption_at_rest(tmp_path):
+    pytest.importorskip("cryptography")
+    path = tmp_path / "graph_token.json"
+    TokenCacheFile(str(path), key="secret").save('{"RefreshToken": {"rt": "abc"}}')
+    assert b"RefreshToken" not in path.read_bytes()
+    assert TokenCacheFile(str(path), key="secret").load() == '{"RefreshToken": {"rt": "abc"}}'
+    assert TokenCacheFile(str(path), key="wrong").load() is None
+    assert TokenCacheFile(str(path)).load() is None
+
+
+def test_encryption_uses_random_salt_and_requires_header(tmp_path):
+    pytest.importorskip("cryptography")
+
+    first, second = tmp_path / "a.json", tmp_path / "b.json"
+    TokenCacheFile(str(first), key="secret").save("{}")
+    TokenCacheFile(str(second), key="secret").save("{}")
+    header = len(token_cache._ENCRYPTED_HEADER)
+    salts = [p.read_bytes()[header:header + token_cache._SALT_BYTES] for p in (first, second)]
+    assert salts[0] != salts[1]
+
+    # 没有文件头的内容不再按其他密钥派生方式尝试解密
+    unknown = tmp_path / "unknown.json"
+    unknown.write_bytes(b"gAAAAAB" + b"x" * 64)
+    assert TokenCacheFile(str(unknown), key="secret").load() is None
@@ -0,0 +1,174 @@
+import os
+import subprocess
+import sys
+import threading
+import time
+
+from src.utils.write_queue import WriteQueue
+
+
+class FakeBatchClient:
+    """记录收到的 $batch 子请求，并按 URL 返回预设的状态码。"""
+
+    def __init__(self, statuses=None):
+        self.statuses = statuses or {}
+        self.batches = []
+
+    def batch(self, requests):
+        self.batches.append(requests)
+        responses = []
+        for req in requests:
+            status = self.statuses.get(req["url"], 201 if req["method"] == "POST" else 200)
+            body = {"id": "server-1", "@odata.etag": 'W/"2"'} if req["method"] == "POST" else {}
+            if status == 412:
+                body = {"error": {"code": "ErrorIrresolvableConflict", "message": "etag mismatch"}}
+            responses.append({"status": status, "headers": {}, "body": body})
+        return responses
+
+
+def _queue(tmp_path, client):
+    # 足够长的延迟，避免测试期间后台线程自动提交
+    return WriteQueue(client, str(tmp_path / "pending.json"), flush_delay=3600)
+
+
+def test_patches_are_coalesced_and_sent_with_etag(tmp_path):
+    client = FakeBatchClient()
+    queue = _queue(tmp_path, client)
+    listed = list(queue.observe([{"id": "t1", "title": "旧标题", "@odata.etag": 'W/"1"'}], "/me/tasks"))
+    assert listed[0]["title"] == "旧标题"
+
+    queue.patch("/me/tasks/t1", {"title": "新标题"})
+    queue.patch("/me/tasks/t1", {"status": "completed"})
+    result = queue.flush()
+
+    assert len(client.batches) == 1
+    assert client.batches[0] == [{
+        "method": "PATCH", "url": "/me/tasks/t1",
+        "body": {"title": "新标题", "status": "completed"}, "headers": {"If-Match": 'W/"1"'},
+    }]
+    assert result["remaining"] == 0
+    assert queue.stats["merged"] == 1
+
+
+def test_create_then_delete_cancels_out(tmp_path):
+    client = FakeBatchClient()
+    queue = _queue(tmp_path, client)
+    local_id = queue.create("/me/tasks", {"title": "临时"})
+    queue.patch(f"/me/tasks/{local_id}", {"importance": "high"})
+    queue.delete(f"/me/tasks/{local_id}")
+
+    assert queue.flush()["sent"] == []
+    assert client.batches == []
+
+
+def test_reads_overlay_pending_writes(tmp_path):
+    queue = _queue(tmp_path, FakeBatchClient())
+    queue.patch("/me/tasks/t1", {"title": "改过"})
+    queue.delete("/me/tasks/t2")
+    local_id = queue.create("/me/tasks", {"title": "新任务"})
+
+    items = [{"id": "t1", "title": "原始"}, {"id": "t2", "title": "待删"}]
+    listed = list(queue.observe(items, "/me/tasks", include_created=lambda body: True))
+    assert listed == [{"id": "t1", "title": "改过"}, {"id": local_id, "title": "新任务"}]
+
+
+def test_conflicts_and_transient_errors(tmp_path):
+    client = FakeBatchClient({"/me/tasks/t1": 412, "/me/tasks/t2": 503})
+    queue = _queue(tmp_path, client)
+    queue.patch("/me/tasks/t1", {"title": "A"})
+    queue.patch("/me/tasks/t2", {"title": "B"})
+
+    result = queue.flush()
+    assert [c["url"] for c in result["conflicts"]] == ["/me/tasks/t1"]
+    assert result["remaining"] == 1
+
+    # 队列持久化在磁盘上，新实例 (如进程重启后) 仍能看到待提交项与冲突
+    summary = _queue(tmp_path, client).summary()
+    assert [p["url"] for p in summary["pending"]] == ["/me/tasks/t2"]
+    assert summary["conflicts"][0]["url"] == "/me/tasks/t1"
+
+    client.statuses = {}
+    result = queue.flush(retry_conflicts=True)
+    assert sorted(s["url"] for s in result["sent"]) == ["/me/tasks/t1", "/me/tasks/t2"]
+    assert queue.summary() == {"pending": [], "conflicts": [], "failed": []}
+
+
+class SlowBatchClient(FakeBatchClient):
+    """提交耗时较长的 $batch，便于在提交过程中插入其他操作。"""
+
+    def batch(self, requests):
+        self.started.set()
+        time.sleep(0.2)
+        return super().batch(requests)
+
+    def __init__(self):
+        super().__init__()
+        self.started = threading.Event()
+
+
+def _flush_in_background(queue, client):
+    thread = threading.Thread(target=queue.flush)
+    thread.start()
+    client.started.wait(5)
+    return thread
+
+
+def test_concurrent_flushes_do_not_resend_in_flight_entries(tmp_path):
+    client = SlowBatchClient()
+    queue = _queue(tmp_path, client)
+    queue.create("/me/tasks", {"title": "一次"})
+
+    thread = _flush_in_background(queue, client)
+    # 另一个提交方 (如另一个会话的进程) 同时提交同一个队列文件
+    assert _queue(tmp_path, client).flush()["sent"] == []
+    thread.join()
+    assert [r["method"] for batch in client.batches for r in batch] == ["POST"]
+    assert queue.summary()["pending"] == []
+
+
+def test_delete_during_in_flight_create_deletes_server_item(tmp_path):
+    client = SlowBatchClient()
+    queue = _queue(tmp_path, client)
+    local_id = queue.create("/me/tasks", {"title": "临时"})
+
+    thread = _flush_in_background(queue, client)
+    queue.delete(f"/me/tasks/{local_id}")
+    thread.join()
+    assert [p["url"] for p in queue.summary()["pending"]] == ["/me/tasks/server-1"]
+
+    queue.flush()
+    assert client.batches[-1] == [{"method": "DELETE", "url": "/me/tasks/server-1", "headers": {"If-Match": 'W/"2"'}}]
+    assert queue.summary() == {"pending": [], "conflicts": [], "failed": []}
+
+
+def test_local_ids_resolve_to_server_ids_after_create(tmp_path):
+    client = FakeBatchClient()
+    queue = _queue(tmp_path, client)
+    local_id = queue.create("/me/tasks", {"title": "新任务"})
+    assert queue.flush()["sent"][0]["id"] == "server-1"
+
+    # 新实例 (如进程重启后) 也能从持久化的映射中解析临时 ID
+    queue = _queue(tmp_path, client)
+    queue.patch(f"/me/tasks/{local_id}", {"title": "改名"})
+    listed = list(queue.observe([{"id": "server-1", "title": "新任务"}], "/me/tasks"))
+    assert listed == [{"id": "server-1", "title": "改名"}]
+    queue.flush()
+    assert client.batches[-1][0]["url"] == "/me/tasks/server-1"
+
+
+def test_per_process_queue_adopts_writes_of_exited_processes(tmp_path):
+    client = FakeBatchClient()
+    exited = subprocess.Popen([sys.executable, "-c", "pass"])
+    exited.wait()
+    # 共享队列、已退出进程的队列与仍在运行的进程的队列
+    WriteQueue(client, str(tmp_path / "pending.json"), flush_delay=3600).patch("/me/tasks/a", {"title": "共享"})
+    orphan = tmp_path / f"pending.{exited.pid}.json"
+    WriteQueue(client, str(orphan), flush_delay=3600).patch("/me/tasks/b", {"title": "遗留"})
+    alive = tmp_path / f"pending.{os.getppid()}.json"
+    WriteQueue(client, str(alive), flush_delay=3600).patch("/me/tasks/c", {"title": "运行中"})
+
+    queue = WriteQueue(client, str(tmp_path / "pending.json"), flush_delay=3600, per_process=True)
+    assert queue.path == str(tmp_path / f"pending.{os.getpid()}.json")
+    assert sorted(p["url"] for p in queue.summary()["pending"]) == ["/me/tasks/a", "/me/tasks/b"]
+    assert not orphan.exists() and alive.exists()
+    assert _queue(tmp_path, client).summary()["pending"] == []
@@ -2,12 +2,12 @@ import sys
 import os
 from datetime import datetime, timedelta
 
-# 将 src 目录添加到 sys.path
-sys.path.append(os.path.join(os.getcwd(), 'src'))
+# 将项目根目录添加到 sys.path
+sys.path.append(os.getcwd())
 
-from auth import get_client
-from capabilities import calendar_tools
-from utils.validation import validate_email, validate_iso_datetime
+from src.auth import get_client
+from src.capabilities import calendar_tools
+from src.utils.validation import validate_email, validate_iso_datetime
 
 def verify_tool_logic():
     print("=== 验证 get_user_schedules 工具修复情况 ===")